@@ -6,7 +6,7 @@ import uuid
 import zipfile
 import tempfile
 from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import JSONResponse
 from PIL import Image
 import io
@@ -15,6 +15,10 @@ from loguru import logger
 from ...core.config import settings
 from ...core.azure_client import azure_client
 from ...api.models.asset import AssetCreate, Asset, AssetType
+from ...rule_engine.brand_rules.color_compliance import ColorComplianceChecker
+from ...rule_engine.brand_rules.geometry_rules import GeometryChecker
+from ...rule_engine.image_context import ImageContext
+from ...rule_engine.image_io import decode_image
 
 
 router = APIRouter()
@@ -85,6 +89,26 @@ def extract_file_metadata(file_content: bytes, filename: str) -> dict:
     return metadata
 
 
+def record_color_statistics(asset_id: int, file_content: bytes) -> None:
+    """Persist color statistics of a raster asset so it can be re-scored without re-decoding.
+    
+    Runs as a background task once the upload response is sent. Statistics
+    cover the logo region found by the geometry analysis, the same region
+    the live color analysis is restricted to. Non-raster files are skipped;
+    failures are logged and never fail the upload.
+    """
+    
+    try:
+        image = decode_image(file_content)
+        if image is None:
+            return
+        context = ImageContext(image)
+        geometry = GeometryChecker().check_geometry_compliance(context)
+        ColorComplianceChecker().record_color_statistics(context, asset_id, roi=geometry)
+    except Exception as e:
+        logger.warning(f"Failed to record color statistics for asset {asset_id}: {e}")
+
+
 def process_zip_file(zip_content: bytes, filename: str) -> List[dict]:
     """Process ZIP file and extract individual files."""
     extracted_files = []
@@ -120,6 +144,7 @@ def process_zip_file(zip_content: bytes, filename: str) -> List[dict]:
 
 @router.post("/single", response_model=dict)
 async def upload_single_asset(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     asset_type: AssetType = Form(...),
     description: str = Form(None),
@@ -192,6 +217,8 @@ async def upload_single_asset(
                     "updated_at": "2024-01-01T00:00:00Z"
                 }
                 
+                background_tasks.add_task(record_color_statistics, asset_data["id"], extracted_file["content"])
+                
                 uploaded_assets.append(asset_data)
                 logger.info(f"Successfully uploaded from ZIP: {unique_filename}")
             
@@ -243,6 +270,8 @@ async def upload_single_asset(
                 "updated_at": "2024-01-01T00:00:00Z"
             }
             
+            background_tasks.add_task(record_color_statistics, asset_data["id"], file_content)
+            
             logger.info(f"Successfully uploaded asset: {unique_filename}")
             
             return {
@@ -261,6 +290,7 @@ async def upload_single_asset(
 
 @router.post("/batch", response_model=dict)
 async def upload_batch_images(
+    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     asset_type: AssetType = Form(...),
     description: str = Form(None)
@@ -315,6 +345,8 @@ async def upload_batch_images(
                 "updated_at": "2024-01-01T00:00:00Z"
             }
             
+            background_tasks.add_task(record_color_statistics, asset_data["id"], file_content)
+            
             uploaded_assets.append(asset_data)
             logger.info(f"Successfully uploaded: {unique_filename}")
             
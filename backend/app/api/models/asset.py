@@ -183,6 +183,13 @@ class ComplianceReport(BaseModel):
     model_version: str
     analysis_timestamp: datetime
     processing_time_ms: int
+    rule_timings_ms: Dict[str, float] = Field(default_factory=dict)
+    cached: bool = False  # Served from the result cache
+    rule_provenance: Dict[str, Dict[str, Any]] = Field(default_factory=dict)  # Version, parameters and inputs per rule
+    reused_rules: List[str] = Field(default_factory=list)  # Rules whose stored result was reused
+    rule_evaluations_avoided: int = 0
+    completed_rules: List[str] = Field(default_factory=list)
+    pending_rules: List[str] = Field(default_factory=list)  # Not run before the analysis deadline
 
 
 class BatchAnalysisRequest(BaseModel):
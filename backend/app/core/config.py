@@ -53,6 +53,67 @@ class Settings(BaseSettings):
     color_tolerance: int = 10
     min_logo_size: int = 50
     max_rotation_degrees: float = 5.0
+    max_logo_instances: int = 16  # Largest candidate contours analyzed per image
+    geometry_localization_size: int = 1024  # Longest side used to localize logos in larger images (0 disables)
+    geometry_localization_padding: float = 0.1  # Fraction of a candidate's size added around it at full resolution
+    shape_index_path: Optional[str] = None  # Reference-shape index (default: <cache_dir>/shape_index.npy)
+    shape_match_max_distance: float = 0.045  # RMS radial signature difference accepted as a reference match
+    shape_match_max_hu_distance: float = 1.0  # Log-scaled Hu moment distance accepted as a reference match
+    
+    # Dominant color extraction settings
+    dominant_color_sample_size: int = 65536  # Pixels sampled for the color histogram
+    dominant_color_refine_iterations: int = 2  # Lloyd refinement passes (0 disables)
+    
+    # Brand palette settings (the golden arches color is always included)
+    approved_palette: dict[str, tuple[int, int, int]] = {
+        "white": (255, 255, 255),
+        "black": (0, 0, 0),
+    }
+    # Spot colors from the Heritage Marks library swatches, converted to sRGB
+    heritage_palette: dict[str, tuple[int, int, int]] = {
+        "pantone_1235c": (255, 184, 29),
+        "pantone_2035c": (220, 0, 28),
+        "pantone_2728c": (0, 71, 187),
+        "pantone_1685c": (134, 58, 32),
+        "pantone_7472c": (83, 183, 181),
+        "pantone_black_c": (45, 42, 38),
+        "pantone_1655cp": (225, 73, 12),
+        "pantone_317cp": (192, 225, 226),
+        "pantone_3564c": (231, 101, 0),
+        "pantone_3935cp": (255, 241, 101),
+    }
+    palette_lut_bits: int = 7  # Bits per channel in the palette lookup table
+    
+    # Heritage-first routing: heritage marks skip the Golden Arches color and geometry rules
+    heritage_first: bool = True
+    heritage_min_coverage: float = 0.05  # Share of pixels in heritage palette colors to classify as heritage
+    heritage_sample_size: int = 256  # Longest side of the strided sample classified
+    
+    # Color distance mode: "rgb" (Euclidean, color_tolerance) or "ciede2000"
+    color_distance_mode: str = "rgb"
+    perceptual_tolerance: float = 5.0  # Max Delta E 2000 from the golden color
+    perceptual_sample_size: int = 262144  # Pixels sampled for the Delta E map
+    
+    # Tiled color analysis for very large assets
+    color_tile_size: int = 1024  # Tile edge in pixels
+    color_tiling_threshold_pixels: int = 4096 * 4096  # Tile images larger than this
+    
+    # Coarse-to-fine analysis: decide on a downsampled level when the result is clear-cut
+    pyramid_mode: bool = False
+    pyramid_max_levels: int = 3  # Halved levels below full resolution
+    pyramid_min_size: int = 256  # Smallest side of the coarsest level
+    pyramid_margin: float = 0.25  # Escalate when a metric is within this fraction of its threshold
+    
+    # Cache settings
+    cache_dir: str = "./cache"
+    analysis_cache_size: int = 16  # Images whose analysis contexts are kept in memory
+    icc_transform_cache_size: int = 32  # ICC-to-sRGB transforms kept in memory
+    result_cache_path: Optional[str] = None  # Rule result store (default: <cache_dir>/rule_results.sqlite)
+    result_cache_memory_entries: int = 256  # Rule results kept in memory in front of the store
+    result_cache_max_bytes: int = 256 * 1024 * 1024  # Store size budget; least recently used results are evicted
+    
+    # Rule execution
+    rule_executor_workers: int = 4  # Threads running independent rules (1 runs them in order)
     
     # File upload settings
     max_file_size: int = 100 * 1024 * 1024  # 100MB (increased from 10MB)
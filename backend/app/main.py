@@ -13,6 +13,11 @@ import time
 from .core.config import settings
 from .core.azure_client import azure_client
 from .api.endpoints import upload, analysis, annotation
+from .rule_engine.palette import get_compiled_palette
+from .rule_engine.analysis_context import get_analysis_cache
+from .rule_engine.image_io import get_icc_transform_cache
+from .rule_engine.result_cache import get_result_cache
+from .rule_engine.shape_index import get_shape_index, shape_index_path
 
 
 @asynccontextmanager
@@ -48,6 +53,16 @@ async def lifespan(app: FastAPI):
         level=settings.log_level
     )
     
+    # Compile the brand palette lookup table (loaded from cache when unchanged)
+    try:
+        get_compiled_palette()
+    except Exception as e:
+        logger.error(f"Failed to compile brand palette: {e}")
+    
+    # Memory-map the reference-shape index, if one has been built
+    if get_shape_index() is None:
+        logger.info(f"No reference-shape index at {shape_index_path()}; geometry checks use heuristics only")
+    
     # Initialize Azure clients
     try:
         await azure_client.initialize()
@@ -119,7 +134,10 @@ async def health_check():
         "status": "healthy",
         "app_name": settings.app_name,
         "version": settings.app_version,
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "analysis_cache": get_analysis_cache().stats(),
+        "icc_transforms": get_icc_transform_cache().stats(),
+        "result_cache": get_result_cache().stats()
     }
 
 
@@ -0,0 +1,241 @@
+"""
+Filled outlines from PDF-compatible Adobe Illustrator (.ai) files.
+
+Illustrator saves a PDF page alongside its private data, so the artwork
+can be read from the page content stream without a PDF renderer. Only
+what brand marks use is interpreted: the path construction operators
+(m, l, c, v, y, h, re), the transformation matrix (q, Q, cm) and the
+painting operators. Bezier curves are flattened to polylines. Text,
+images, clipping and colors are ignored, since only the outlines of
+filled shapes are needed for shape descriptors.
+"""
+import re
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple, Union
+
+import cv2
+import numpy as np
+
+
+# Line segments per flattened Bezier curve
+CURVE_SEGMENTS = 8
+
+_OBJECT_PATTERN = re.compile(rb"(?<!\d)(\d+)\s+0\s+obj\b")
+_STREAM_PATTERN = re.compile(rb"stream\r?\n")
+_PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![s\w])")
+_CONTENTS_PATTERN = re.compile(rb"/Contents\s*(\[[^\]]*\]|\d+\s+0\s+R)")
+_MEDIA_BOX_PATTERN = re.compile(rb"/MediaBox\s*\[([^\]]*)\]")
+_REFERENCE_PATTERN = re.compile(rb"(\d+)\s+0\s+R")
+
+# Content stream tokens: strings, hex strings, dictionary delimiters, arrays, names, words
+_TOKEN_PATTERN = re.compile(
+    rb"\((?:\\.|[^\\)])*\)|<<|>>|<[0-9A-Fa-f\s]*>|[\[\]]|/[^\s/\[\]()<>{}%]*|%[^\r\n]*|[^\s/\[\]()<>{}%]+"
+)
+
+_FILL_OPERATORS = {b"f": False, b"F": False, b"f*": True, b"B": False, b"B*": True, b"b": False, b"b*": True}
+_DISCARD_OPERATORS = {b"S", b"s", b"n"}
+
+# Cubic Bezier basis sampled at CURVE_SEGMENTS points (t in (0, 1])
+_T = np.linspace(0, 1, CURVE_SEGMENTS + 1)[1:, None]
+_BEZIER_BASIS = np.hstack([(1 - _T) ** 3, 3 * (1 - _T) ** 2 * _T, 3 * (1 - _T) * _T ** 2, _T ** 3])
+
+
+@dataclass
+class FilledPath:
+    """A filled path: closed subpaths in page coordinates (points up) and its fill rule."""
+    subpaths: List[np.ndarray]
+    even_odd: bool
+
+
+AiSource = Union[bytes, str]
+
+
+def _read(source: AiSource) -> bytes:
+    if isinstance(source, bytes):
+        return source
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _object_offsets(data: bytes) -> Dict[int, int]:
+    """Offset just past "N 0 obj" for every object; the first definition wins."""
+    
+    offsets: Dict[int, int] = {}
+    for match in _OBJECT_PATTERN.finditer(data):
+        offsets.setdefault(int(match.group(1)), match.end())
+    return offsets
+
+
+def _stream(data: bytes, offset: int) -> bytes:
+    """Decoded stream of the object starting at offset."""
+    
+    start = _STREAM_PATTERN.search(data, offset)
+    if start is None:
+        raise ValueError("Object has no stream")
+    header = data[offset:start.start()]
+    
+    length = re.search(rb"/Length\s+(\d+)(\s+0\s+R)?", header)
+    if length is None or length.group(2):
+        end = data.index(b"endstream", start.end())
+    else:
+        end = start.end() + int(length.group(1))
+    raw = data[start.end():end]
+    
+    if b"/FlateDecode" in header:
+        return zlib.decompressobj().decompress(raw)
+    if b"/Filter" in header:
+        raise ValueError("Unsupported stream filter")
+    return raw
+
+
+def page_content(source: AiSource) -> Tuple[bytes, Tuple[float, float, float, float]]:
+    """Content stream and media box (x0, y0, x1, y1) of the first page."""
+    
+    data = _read(source)
+    if not data.startswith(b"%PDF"):
+        raise ValueError("Not a PDF-compatible Illustrator file")
+    
+    page = _PAGE_PATTERN.search(data)
+    if page is None:
+        raise ValueError("No page found")
+    
+    # The page dictionary surrounds the /Type entry; bound it by the enclosing objects
+    objects = list(_OBJECT_PATTERN.finditer(data, 0, page.start()))
+    dictionary_start = objects[-1].end() if objects else 0
+    dictionary_end = data.find(b"endobj", page.end())
+    dictionary = data[dictionary_start:dictionary_end]
+    
+    contents = _CONTENTS_PATTERN.search(dictionary)
+    if contents is None:
+        raise ValueError("Page has no content stream")
+    offsets = _object_offsets(data)
+    content = b"\n".join(
+        _stream(data, offsets[int(reference)]) for reference in _REFERENCE_PATTERN.findall(contents.group(1))
+    )
+    
+    media_box = _MEDIA_BOX_PATTERN.search(dictionary)
+    box = tuple(float(v) for v in media_box.group(1).split()) if media_box else (0.0, 0.0, 612.0, 792.0)
+    return content, box
+
+
+def _tokens(content: bytes) -> Iterator[bytes]:
+    """Operators and numeric operands; strings, names, arrays and dictionaries are skipped."""
+    
+    depth = 0
+    for match in _TOKEN_PATTERN.finditer(content):
+        token = match.group()
+        if token in (b"[", b"<<"):
+            depth += 1
+        elif token in (b"]", b">>"):
+            depth -= 1
+        elif depth == 0 and token[:1] not in b"(</%":
+            yield token
+
+
+def filled_paths(content: bytes) -> List[FilledPath]:
+    """Interpret a content stream and return its filled paths in page coordinates."""
+    
+    paths: List[FilledPath] = []
+    operands: List[float] = []
+    ctm = np.eye(3)
+    stack: List[np.ndarray] = []
+    subpaths: List[List[np.ndarray]] = []
+    current = np.zeros(2)
+    in_text = False
+    
+    def transform(*coordinates: float) -> np.ndarray:
+        points = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        return points @ ctm[:2, :2] + ctm[2, :2]
+    
+    def curve(p1: np.ndarray, p2: np.ndarray, p3: np.ndarray) -> np.ndarray:
+        return _BEZIER_BASIS @ np.vstack([current, p1, p2, p3])
+    
+    for token in _tokens(content):
+        try:
+            operands.append(float(token))
+            continue
+        except ValueError:
+            pass
+        
+        if in_text:
+            in_text = token != b"ET"
+        elif token == b"BT":
+            in_text = True
+        elif token == b"q":
+            stack.append(ctm.copy())
+        elif token == b"Q":
+            ctm = stack.pop() if stack else np.eye(3)
+        elif token == b"cm" and len(operands) >= 6:
+            a, b, c, d, e, f = operands[-6:]
+            ctm = np.array([[a, b, 0], [c, d, 0], [e, f, 1]]) @ ctm
+        elif token == b"m" and len(operands) >= 2:
+            current = transform(*operands[-2:])[0]
+            subpaths.append([current[None]])
+        elif token == b"l" and len(operands) >= 2 and subpaths:
+            current = transform(*operands[-2:])[0]
+            subpaths[-1].append(current[None])
+        elif token == b"c" and len(operands) >= 6 and subpaths:
+            p1, p2, p3 = transform(*operands[-6:])
+            subpaths[-1].append(curve(p1, p2, p3))
+            current = p3
+        elif token == b"v" and len(operands) >= 4 and subpaths:
+            p2, p3 = transform(*operands[-4:])
+            subpaths[-1].append(curve(current, p2, p3))
+            current = p3
+        elif token == b"y" and len(operands) >= 4 and subpaths:
+            p1, p3 = transform(*operands[-4:])
+            subpaths[-1].append(curve(p1, p3, p3))
+            current = p3
+        elif token == b"re" and len(operands) >= 4:
+            x, y, width, height = operands[-4:]
+            corners = transform(x, y, x + width, y, x + width, y + height, x, y + height)
+            subpaths.append([corners])
+            current = corners[0]
+        elif token in _FILL_OPERATORS or token in _DISCARD_OPERATORS:
+            if token in _FILL_OPERATORS:
+                closed = [np.vstack(parts) for parts in subpaths if sum(len(p) for p in parts) >= 3]
+                if closed:
+                    paths.append(FilledPath(closed, _FILL_OPERATORS[token]))
+            subpaths = []
+        operands = []
+    
+    return paths
+
+
+def read_ai_outlines(source: AiSource) -> Tuple[List[FilledPath], Tuple[float, float, float, float]]:
+    """Filled paths and media box of the first page of an .ai (or plain PDF) file."""
+    
+    content, media_box = page_content(source)
+    return filled_paths(content), media_box
+
+
+def render_path(path: FilledPath, size: int) -> np.ndarray:
+    """Rasterize one filled path into a binary mask whose longer side is size pixels.
+    
+    The mask covers the path's bounding box (with a one-pixel margin) and
+    is in image orientation, with y pointing down.
+    """
+    
+    points = np.vstack(path.subpaths)
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    scale = (size - 2) / max(x1 - x0, y1 - y0, 1e-6)
+    
+    width = int(np.ceil((x1 - x0) * scale)) + 2
+    height = int(np.ceil((y1 - y0) * scale)) + 2
+    mask = np.zeros((height, width), dtype=np.uint8)
+    
+    polygons = [
+        np.round(np.column_stack([(s[:, 0] - x0) * scale + 1, (y1 - s[:, 1]) * scale + 1])).astype(np.int32)
+        for s in path.subpaths
+    ]
+    # fillPoly fills overlapping subpaths by parity, which matches the even-odd rule; for
+    # nonzero paths, subpaths are filled one by one so overlaps stay filled (holes are
+    # lost, which does not change the outer outline)
+    if path.even_odd:
+        cv2.fillPoly(mask, polygons, 255)
+    else:
+        for polygon in polygons:
+            cv2.fillPoly(mask, [polygon], 255)
+    return mask
@@ -0,0 +1,120 @@
+"""
+Per-image analysis contexts shared by the rule checkers.
+
+An AnalysisContext holds everything already computed for one image, keyed
+by the name of the result and the checker configuration that produced it.
+Contexts are looked up by a digest of the pixel content in a small LRU, so
+recommendations, reports and later rules reuse earlier results instead of
+re-running the checkers on the same pixels.
+"""
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+from ..core.config import settings
+
+
+def image_digest(image: np.ndarray) -> str:
+    """Content digest of an image array, including its shape and dtype."""
+    
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.shape}|{image.dtype.str}".encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class AnalysisContext:
+    """Results computed so far for one image."""
+    
+    def __init__(self, digest: str):
+        self.digest = digest
+        self._values: Dict[Hashable, Any] = {}
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._values
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._values.get(key, default)
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        self._values[key] = value
+
+
+class AnalysisContextCache:
+    """Bounded LRU of analysis contexts keyed by image content digest."""
+    
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._contexts: "OrderedDict[str, AnalysisContext]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._contexts)
+    
+    def context_for(self, image: np.ndarray, digest: Optional[str] = None) -> AnalysisContext:
+        """Return the context for an image, creating it (and evicting the oldest) if needed."""
+        
+        digest = digest or image_digest(image)
+        with self._lock:
+            context = self._contexts.get(digest)
+            if context is None:
+                context = AnalysisContext(digest)
+                self._contexts[digest] = context
+                while len(self._contexts) > self.max_entries:
+                    self._contexts.popitem(last=False)
+            else:
+                self._contexts.move_to_end(digest)
+            return context
+    
+    def get_or_compute(self, context: AnalysisContext, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return a copy of the cached value for key, computing and storing it on a miss.
+        
+        Callers receive a deep copy so mutating a result never alters the
+        cached one. Exceptions from compute propagate and nothing is stored.
+        """
+        
+        if key in context:
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(context.get(key))
+        
+        with self._lock:
+            self.misses += 1
+        value = compute()
+        context.set(key, value)
+        return copy.deepcopy(value)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._contexts.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._contexts),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+_analysis_cache: Optional[AnalysisContextCache] = None
+
+
+def get_analysis_cache() -> AnalysisContextCache:
+    """Process-wide analysis context cache sized by settings.analysis_cache_size."""
+    
+    global _analysis_cache
+    
+    if _analysis_cache is None or _analysis_cache.max_entries != settings.analysis_cache_size:
+        _analysis_cache = AnalysisContextCache(settings.analysis_cache_size)
+    return _analysis_cache
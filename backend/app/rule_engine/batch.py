@@ -0,0 +1,35 @@
+"""
+Helpers for running rule checks over batches of images.
+"""
+from collections import defaultdict
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+
+ImageBatch = Union[Sequence[np.ndarray], np.ndarray]
+
+
+def group_images_by_shape(images: ImageBatch) -> List[Tuple[List[int], np.ndarray]]:
+    """Split a batch into (original indices, stacked array) groups of equal shape.
+    
+    A 4D (N, H, W, C) array is used as a single group without copying.
+    Lists are grouped by image shape; a group of one is a view of that image.
+    """
+    
+    if isinstance(images, np.ndarray):
+        if images.ndim != 4:
+            raise ValueError("Image batch arrays must be 4D (N, H, W, C)")
+        return [(list(range(len(images))), images)] if len(images) else []
+    
+    groups = defaultdict(list)
+    for index, image in enumerate(images):
+        groups[(image.shape, image.dtype)].append(index)
+    
+    stacked = []
+    for indices in groups.values():
+        if len(indices) == 1:
+            stacked.append((indices, images[indices[0]][np.newaxis]))
+        else:
+            stacked.append((indices, np.stack([images[i] for i in indices])))
+    return stacked
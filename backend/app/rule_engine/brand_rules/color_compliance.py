@@ -2,171 +2,822 @@
 Color compliance checker for McDonald's Golden Arches.
 """
 import numpy as np
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Sequence, Union
 from PIL import Image
 import cv2
 from loguru import logger
 
 from ...core.config import settings
+from ..dominant_colors import ColorHistogram, extract_dominant_colors, sampling_step
+from ..palette import get_compiled_palette, palette_entries_from_settings
+from ..perceptual import PerceptualDistanceMap, delta_e_2000, srgb_to_lab
+from ..batch import ImageBatch, group_images_by_shape
+from ..tiling import TiledRegionMerger, iter_tiles
+from ..pyramid import near_threshold, run_coarse_to_fine
+from ..analysis_context import get_analysis_cache
+from ..color_statistics import AssetKey, ColorStatistics, ColorStatisticsStore
+from ..roi import PixelBox, resolve_roi
+from ..svg_colors import SvgSource, extract_svg_colors
+from ..image_context import ImageContext, ImageInput, rgb_view
+
+
+# Largest possible squared RGB distance: 3 * 255**2
+MAX_SQUARED_DISTANCE = 3 * 255 * 255
+
+
+def _squared_distance_luts(target_rgb: Tuple[int, int, int]) -> np.ndarray:
+    """Per-channel lookup tables of squared differences to the target color."""
+    
+    levels = np.arange(256, dtype=np.int32)
+    return np.stack([(levels - int(c)) ** 2 for c in target_rgb])
+
+
+# sqrt lookup for every possible squared distance, clipped to the 0-255 range
+# used by the region confidence score. Built once at import (~190KB).
+_DISTANCE_LUT = np.minimum(
+    np.sqrt(np.arange(MAX_SQUARED_DISTANCE + 1, dtype=np.float32)), 255
+).astype(np.uint8)
+
+
+class ColorDistanceMap:
+    """Per-pixel distance to the golden arches color, computed once per image.
+    
+    Squared distances are accumulated in int32 through per-channel lookup
+    tables, so there is no uint8 wraparound, no sqrt and no float64 array.
+    The compliance mask and the uint8 distance map are derived lazily.
+    
+    A (N, H, W, C) stack can be passed to compute all maps in one pass;
+    split() then returns per-image maps that share the stacked arrays.
+    
+    valid_mask (e.g. the opaque pixels of an RGBA image) excludes pixels
+    from every metric: they are neither compliant nor non-compliant.
+    """
+    
+    def __init__(self, image: np.ndarray, target_rgb: Tuple[int, int, int], tolerance: float,
+                 valid_mask: Optional[np.ndarray] = None):
+        luts = _squared_distance_luts(target_rgb)
+        
+        squared = np.take(luts[0], image[..., 0])
+        scratch = np.empty_like(squared)
+        for channel in (1, 2):
+            np.take(luts[channel], image[..., channel], out=scratch)
+            squared += scratch
+        
+        self._init_from_squared(squared, int(np.floor(tolerance * tolerance)), valid_mask=valid_mask)
+    
+    def _init_from_squared(self, squared: np.ndarray, squared_tolerance: int,
+                           compliant_mask: Optional[np.ndarray] = None,
+                           valid_mask: Optional[np.ndarray] = None) -> None:
+        self.squared = squared
+        self.squared_tolerance = squared_tolerance
+        self.shape = squared.shape
+        self.scale = 1
+        self.valid_mask = valid_mask
+        self._compliant_mask = compliant_mask
+        self._distances: Optional[np.ndarray] = None
+        self._total_pixels: Optional[int] = None
+    
+    def split(self) -> List["ColorDistanceMap"]:
+        """Per-image maps of a stacked map, sharing the squared distances and mask."""
+        
+        mask = self.compliant_mask
+        maps = []
+        for index in range(self.shape[0]):
+            distance_map = ColorDistanceMap.__new__(ColorDistanceMap)
+            distance_map._init_from_squared(self.squared[index], self.squared_tolerance, mask[index])
+            maps.append(distance_map)
+        return maps
+    
+    @property
+    def total_pixels(self) -> int:
+        """Pixels taking part in the metrics (all, or those in valid_mask)."""
+        if self._total_pixels is None:
+            if self.valid_mask is None:
+                self._total_pixels = self.shape[0] * self.shape[1]
+            else:
+                self._total_pixels = int(np.count_nonzero(self.valid_mask))
+        return self._total_pixels
+    
+    @property
+    def compliant_mask(self) -> np.ndarray:
+        """Boolean mask of valid pixels within tolerance of the target color."""
+        if self._compliant_mask is None:
+            self._compliant_mask = self.squared <= self.squared_tolerance
+            if self.valid_mask is not None:
+                self._compliant_mask &= self.valid_mask
+        return self._compliant_mask
+    
+    @property
+    def non_compliant_mask(self) -> np.ndarray:
+        """Boolean mask of valid pixels outside the tolerance."""
+        non_compliant = ~self.compliant_mask
+        if self.valid_mask is not None:
+            non_compliant &= self.valid_mask
+        return non_compliant
+    
+    @property
+    def distances(self) -> np.ndarray:
+        """Euclidean distance per pixel as uint8, clipped at 255."""
+        if self._distances is None:
+            self._distances = _DISTANCE_LUT[self.squared]
+        return self._distances
+    
+    def compliant_count(self) -> int:
+        return int(np.count_nonzero(self.compliant_mask))
+
+
+DistanceMap = Union[ColorDistanceMap, PerceptualDistanceMap]
+
+
+# Hex digit value per character code; -1 for anything else
+_HEX_DIGIT_VALUES = np.full(256, -1, dtype=np.int16)
+_HEX_DIGIT_VALUES[np.frombuffer(b"0123456789abcdef", dtype=np.uint8)] = np.arange(16)
+_HEX_DIGIT_VALUES[np.frombuffer(b"ABCDEF", dtype=np.uint8)] = np.arange(10, 16)
+
+
+def _parse_hex_colors(hex_colors: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Parse hex color strings in bulk to (N, 3) uint8 RGB and a validity mask.
+    
+    Like validate_hex_color, leading "#" are dropped and the first six
+    digits are read; invalid strings get RGB (0, 0, 0) and False.
+    """
+    
+    stripped = np.array([str(color).lstrip("#") for color in hex_colors], dtype="<U6")
+    codes = stripped.view(np.uint32).reshape(len(stripped), 6)
+    digits = _HEX_DIGIT_VALUES[np.minimum(codes, 255)]
+    valid = (digits >= 0).all(axis=1)
+    
+    rgb = ((digits[:, 0::2] << 4) | digits[:, 1::2]).astype(np.uint8)
+    rgb[~valid] = 0
+    return rgb, valid
+
+
+def _summed_area_table(distances: np.ndarray) -> np.ndarray:
+    """Integral image of a uint8 distance map.
+    
+    int32 sums are exact while the whole map sums below 2**31; larger maps
+    fall back to float64.
+    """
+    
+    depth = cv2.CV_32S if distances.size * 255 < 2**31 else cv2.CV_64F
+    return cv2.integral(distances, sdepth=depth)
+
+
+def _box_sums(integral: np.ndarray, x, y, w, h):
+    """Sum of the source values inside each box, from its summed-area table."""
+    
+    return (integral[y + h, x + w] - integral[y, x + w]
+            - integral[y + h, x] + integral[y, x]).astype(np.int64)
 
 
 class ColorComplianceChecker:
     """Checker for McDonald's golden arches color compliance."""
     
+    # Attributes that change the analysis result; part of the analysis cache key
+    _CONFIG_ATTRIBUTES = (
+        "golden_arches_rgb", "color_tolerance", "dominant_color_sample_size",
+        "dominant_color_refine_iterations", "color_distance_mode", "perceptual_tolerance",
+        "perceptual_sample_size", "color_tile_size", "color_tiling_threshold_pixels",
+        "pyramid_mode", "pyramid_max_levels", "pyramid_min_size", "pyramid_margin"
+    )
+    
     def __init__(self):
         self.golden_arches_rgb = settings.golden_arches_rgb
         self.color_tolerance = settings.color_tolerance
+        self.dominant_color_sample_size = settings.dominant_color_sample_size
+        self.dominant_color_refine_iterations = settings.dominant_color_refine_iterations
+        self.palette = get_compiled_palette()
+        self.color_distance_mode = settings.color_distance_mode
+        self.perceptual_tolerance = settings.perceptual_tolerance
+        self.perceptual_sample_size = settings.perceptual_sample_size
+        self.color_tile_size = settings.color_tile_size
+        self.color_tiling_threshold_pixels = settings.color_tiling_threshold_pixels
+        self.pyramid_mode = settings.pyramid_mode
+        self.pyramid_max_levels = settings.pyramid_max_levels
+        self.pyramid_min_size = settings.pyramid_min_size
+        self.pyramid_margin = settings.pyramid_margin
+        self.analysis_cache = get_analysis_cache()
     
-    def check_color_compliance(self, image: np.ndarray) -> dict:
-        """Check if image colors comply with McDonald's brand guidelines."""
+    def check_color_compliance(self, image: ImageInput, roi=None) -> dict:
+        """Check if image colors comply with McDonald's brand guidelines.
+        
+        roi restricts every metric to the logo's bounding box: a geometry
+        result, an ML logo_detection dict, a normalized BoundingBox-like dict
+        or an (x, y, width, height) box (see resolve_roi). Without a usable
+        region the full frame is analyzed.
+        
+        image is a BGR(A) array or an ImageContext, whose RGB view, pyramid
+        levels and distance maps are reused and kept for other checkers.
+        Results are memoized per image content and checker configuration, so
+        repeated checks of the same pixels return the cached analysis.
+        """
         
         try:
-            # Convert to RGB if needed
-            if len(image.shape) == 3 and image.shape[2] == 3:
-                # Assume BGR from OpenCV, convert to RGB
-                image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            context = ImageContext.of(image)
+            box = resolve_roi(roi, context.shape)
+            if box is None:
+                analyzed, key = context, self._cache_key()
             else:
-                image_rgb = image
+                # Only the region's pixels are hashed; the key pins its place in the frame
+                analyzed = context.crop(box)
+                key = self._cache_key() + (box, context.shape[:2])
             
-            # Extract dominant colors
-            dominant_colors = self._extract_dominant_colors(image_rgb)
+            return self.analysis_cache.get_or_compute(
+                self.analysis_cache.context_for(analyzed.image, digest=analyzed.digest), key,
+                lambda: self._compute_color_compliance(context, box)
+            )
             
-            # Check for golden arches color
-            golden_match = self._check_golden_color_presence(dominant_colors)
+        except Exception as e:
+            logger.error(f"Color compliance check failed: {e}")
+            return self._error_result(e)
+    
+    def _analyze_color(self, context: ImageContext) -> dict:
+        """Color metrics for one image at its own resolution."""
+        
+        image = context.image
+        
+        # Very large assets are analyzed tile by tile in bounded memory
+        if image.shape[0] * image.shape[1] > self.color_tiling_threshold_pixels:
+            return self._check_color_compliance_tiled(image)
+        
+        # Assume BGR(A) from OpenCV; read it through a zero-copy RGB view.
+        # Fully transparent pixels are masked out of every metric.
+        image_rgb, opaque = context.rgb, context.opaque
+        
+        # Extract dominant colors
+        dominant_colors = self._extract_dominant_colors(image_rgb, mask=opaque)
+        
+        # Check for golden arches color
+        golden_match = self._check_golden_color_presence(dominant_colors)
+        
+        # Per-pixel distance to the golden color, shared by all metrics below
+        distance_map = self._context_distance_map(context)
+        
+        # Calculate color accuracy score
+        accuracy_score = self._calculate_color_accuracy(distance_map)
+        
+        # Find non-compliant regions
+        non_compliant_regions = self._find_non_compliant_regions(distance_map)
+        
+        result = {
+            "dominant_colors": dominant_colors,
+            "golden_arches_color_match": golden_match,
+            "color_accuracy_score": accuracy_score,
+            "non_compliant_regions": non_compliant_regions,
+            "total_pixels": image_rgb.shape[0] * image_rgb.shape[1],
+            "compliant_pixel_ratio": self._calculate_compliant_pixel_ratio(distance_map),
+            "palette_coverage": self.palette.coverage(image_rgb, opaque)
+        }
+        
+        if image.ndim == 3 and image.shape[2] == 4:
+            opaque_pixels = result["total_pixels"] if opaque is None else int(np.count_nonzero(opaque))
+            result["transparent_pixel_ratio"] = 1.0 - opaque_pixels / max(1, result["total_pixels"])
+        
+        return result
+    
+    def _check_color_compliance_pyramid(self, context: ImageContext) -> dict:
+        """Coarse-to-fine variant of check_color_compliance.
+        
+        Levels are analyzed coarsest first; the golden color decision is
+        accepted once the closest dominant color is not within the pyramid
+        margin of the tolerance. Region areas and the pixel total are
+        reported at full resolution, along with the deciding level.
+        """
+        
+        levels = context.pyramid(self.pyramid_max_levels, self.pyramid_min_size)
+        
+        def analyze(level_image: np.ndarray, level: int) -> dict:
+            return self._analyze_color(context if level == 0 else ImageContext(level_image))
+        
+        result, level = run_coarse_to_fine(levels, analyze, self._is_color_decision_marginal)
+        
+        if level > 0:
+            full_pixels = context.shape[0] * context.shape[1]
+            area_scale = full_pixels / (levels[level].shape[0] * levels[level].shape[1])
+            for region in result["non_compliant_regions"]:
+                region["area"] = int(round(region["area"] * area_scale))
+            result["total_pixels"] = full_pixels
+        
+        result["pyramid_level"] = level
+        return result
+    
+    def _is_color_decision_marginal(self, result: dict) -> bool:
+        """Whether the golden color match is too close to call at this level."""
+        
+        if not result["dominant_colors"]:
+            return True
+        
+        closest = min(self._golden_color_distance(color) for color in result["dominant_colors"])
+        return near_threshold(closest, self._golden_tolerance, self.pyramid_margin)
+    
+    def _cache_key(self) -> tuple:
+        config = tuple(getattr(self, name) for name in self._CONFIG_ATTRIBUTES)
+        return ("color_compliance", self.palette.digest) + config
+    
+    def _compute_color_compliance(self, context: ImageContext, box: Optional[PixelBox] = None) -> dict:
+        if box is not None:
+            return self._check_color_compliance_roi(context, box)
+        
+        if self.pyramid_mode:
+            return self._check_color_compliance_pyramid(context)
+        
+        return self._analyze_color(context)
+    
+    def _check_color_compliance_roi(self, context: ImageContext, box: PixelBox) -> dict:
+        """Analyze only the pixels inside a bounding box.
+        
+        The box is a zero-copy view of the image, so work scales with the
+        logo area. Region coordinates are mapped back to the full frame.
+        """
+        
+        x, y, w, h = box
+        result = self._compute_color_compliance(context.crop(box))
+        
+        height, width = context.shape[:2]
+        for region in result["non_compliant_regions"]:
+            region["x"] = (x + region["x"] * w) / width
+            region["y"] = (y + region["y"] * h) / height
+            region["width"] = region["width"] * w / width
+            region["height"] = region["height"] * h / height
+        
+        result["roi"] = {"x": x, "y": y, "width": w, "height": h}
+        return result
+    
+    @staticmethod
+    def _error_result(error: Exception) -> dict:
+        return {
+            "dominant_colors": [],
+            "golden_arches_color_match": False,
+            "color_accuracy_score": 0.0,
+            "non_compliant_regions": [],
+            "error": str(error)
+        }
+    
+    def check_color_compliance_batch(self, images: ImageBatch, rois: Optional[Sequence] = None) -> List[dict]:
+        """Check a batch of images (list of arrays or ImageContexts, or an (N, H, W, 3) array).
+        
+        Returns one result per image, identical to check_color_compliance.
+        Images of equal shape are stacked so their pixel metrics are computed
+        in single vectorized passes; images that need the tiled or pyramid
+        path or are not 3-channel fall back to the single-image check.
+        
+        rois optionally holds one region of interest per image (anything
+        check_color_compliance accepts); images with a usable region are
+        analyzed inside it, the rest as full frames.
+        """
+        
+        results: List[Optional[dict]] = [None] * len(images)
+        
+        # Single-image fallbacks get the caller's context so its derived arrays are shared
+        singles = images
+        if not isinstance(images, np.ndarray):
+            singles = list(images)
+            images = [ImageContext.of(image).image for image in images]
+        
+        full_frame = list(range(len(images)))
+        if rois is not None:
+            full_frame = []
+            for index, roi in enumerate(rois):
+                if resolve_roi(roi, images[index].shape) is None:
+                    full_frame.append(index)
+                else:
+                    results[index] = self.check_color_compliance(singles[index], roi=roi)
+            if not full_frame:
+                return results
+            if len(full_frame) < len(images):
+                images = [images[index] for index in full_frame]
+        
+        for indices, stack in group_images_by_shape(images):
+            indices = [full_frame[index] for index in indices]
+            height, width = stack.shape[1:3]
+            if (stack.ndim != 4 or stack.shape[3] != 3 or self.pyramid_mode
+                    or height * width > self.color_tiling_threshold_pixels):
+                for index in indices:
+                    results[index] = self.check_color_compliance(singles[index])
+                continue
             
-            # Calculate color accuracy score
-            accuracy_score = self._calculate_color_accuracy(image_rgb)
+            try:
+                group_results = self._check_color_stack(stack)
+            except Exception as e:
+                logger.error(f"Batch color compliance check failed: {e}")
+                group_results = [self._error_result(e) for _ in indices]
             
-            # Find non-compliant regions
-            non_compliant_regions = self._find_non_compliant_regions(image_rgb)
+            for index, result in zip(indices, group_results):
+                results[index] = result
+        
+        return results
+    
+    def _check_color_stack(self, stack: np.ndarray) -> List[dict]:
+        """Color metrics for an (N, H, W, 3) BGR stack of equal-sized images."""
+        
+        # Zero-copy BGR->RGB view of the whole stack
+        stack_rgb = stack[..., ::-1]
+        n_images, height, width = stack.shape[:3]
+        
+        # Dominant color histograms for every image in one binning pass
+        step = sampling_step(height, width, self.dominant_color_sample_size)
+        histograms = ColorHistogram.for_batch(stack_rgb[:, ::step, ::step].reshape(n_images, -1, 3))
+        
+        # Distance maps, compliant masks and counts over the whole stack
+        if self.color_distance_mode == "ciede2000":
+            distance_maps = [self._compute_distance_map(image) for image in stack_rgb]
+            compliant_counts = [distance_map.compliant_count() for distance_map in distance_maps]
+        else:
+            stacked_map = ColorDistanceMap(stack_rgb, self.golden_arches_rgb, self.color_tolerance)
+            compliant_counts = np.count_nonzero(stacked_map.compliant_mask, axis=(1, 2)).tolist()
+            distance_maps = stacked_map.split()
+        
+        palette_cells = self.palette.lookup(stack_rgb)
+        
+        results = []
+        for index in range(n_images):
+            distance_map = distance_maps[index]
+            compliant_ratio = compliant_counts[index] / distance_map.total_pixels
+            dominant_colors = histograms[index].dominant_colors(5, self.dominant_color_refine_iterations)
             
-            return {
+            results.append({
                 "dominant_colors": dominant_colors,
-                "golden_arches_color_match": golden_match,
-                "color_accuracy_score": accuracy_score,
-                "non_compliant_regions": non_compliant_regions,
-                "total_pixels": image_rgb.shape[0] * image_rgb.shape[1],
-                "compliant_pixel_ratio": self._calculate_compliant_pixel_ratio(image_rgb)
-            }
-            
-        except Exception as e:
-            logger.error(f"Color compliance check failed: {e}")
-            return {
-                "dominant_colors": [],
-                "golden_arches_color_match": False,
-                "color_accuracy_score": 0.0,
-                "non_compliant_regions": [],
-                "error": str(e)
-            }
+                "golden_arches_color_match": self._check_golden_color_presence(dominant_colors),
+                "color_accuracy_score": self._scale_accuracy(compliant_ratio),
+                "non_compliant_regions": self._find_non_compliant_regions(distance_map),
+                "total_pixels": height * width,
+                "compliant_pixel_ratio": compliant_ratio,
+                "palette_coverage": self.palette.coverage_from_counts(
+                    np.bincount(palette_cells[index].reshape(-1), minlength=256)
+                )
+            })
+        
+        return results
     
-    def _extract_dominant_colors(self, image: np.ndarray, k: int = 5) -> List[Tuple[int, int, int]]:
-        """Extract dominant colors using K-means clustering."""
+    def _check_color_compliance_tiled(self, image: np.ndarray) -> dict:
+        """Tiled variant of check_color_compliance with bounded peak memory.
+        
+        Tiles are read as zero-copy BGR->RGB views with their alpha mask.
+        Compliant counts, the dominant color histogram and palette cell
+        counts are accumulated per tile, and non-compliant regions are
+        stitched across tile borders.
+        Region confidence needs the mean distance over each merged bounding
+        box, which a second pass collects from per-tile integral images.
+        """
+        
+        height, width = image.shape[:2]
+        has_alpha = image.ndim == 3 and image.shape[2] == 4
+        
+        # Distance maps are evaluated on a grid of `scale` (1 in RGB mode)
+        scale = 1
+        if self.color_distance_mode == "ciede2000":
+            scale = sampling_step(height, width, self.perceptual_sample_size)
+        tile_size = -(-self.color_tile_size // scale) * scale
+        grid_height, grid_width = -(-height // scale), -(-width // scale)
+        
+        sample_step = sampling_step(height, width, self.dominant_color_sample_size)
+        histogram = ColorHistogram()
+        palette_counts = np.zeros(256, dtype=np.int64)
+        compliant = analyzed = opaque_pixels = 0
+        merger = TiledRegionMerger(grid_height, grid_width, min_area=grid_width * grid_height * 0.01)
         
-        # Reshape image to be a list of pixels
-        pixels = image.reshape(-1, 3)
+        def tiles():
+            for y0, y1, x0, x1 in iter_tiles(height, width, tile_size):
+                tile, opaque = rgb_view(image[y0:y1, x0:x1])
+                yield y0, x0, tile, opaque
         
-        # Use K-means to find dominant colors
-        from sklearn.cluster import KMeans
+        for y0, x0, tile, opaque in tiles():
+            sample = (slice(-y0 % sample_step, None, sample_step), slice(-x0 % sample_step, None, sample_step))
+            if opaque is None:
+                histogram.add(tile[sample].reshape(-1, 3))
+                opaque_pixels += tile.shape[0] * tile.shape[1]
+            else:
+                histogram.add(tile[sample][opaque[sample]])
+                opaque_pixels += int(np.count_nonzero(opaque))
+            palette_counts += self.palette.cell_counts(tile, opaque)
+            
+            distance_map = self._compute_tile_distance_map(tile, scale, opaque)
+            compliant += distance_map.compliant_count()
+            analyzed += distance_map.total_pixels
+            merger.add_tile(distance_map.non_compliant_mask, y0 // scale, x0 // scale)
         
-        kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-        kmeans.fit(pixels)
+        boxes = merger.regions()
+        distance_sums = [0] * len(boxes)
+        if boxes:
+            for y0, x0, tile, _ in tiles():
+                gy0, gx0 = y0 // scale, x0 // scale
+                gy1, gx1 = gy0 + -(-tile.shape[0] // scale), gx0 + -(-tile.shape[1] // scale)
+                hits = [
+                    i for i, box in enumerate(boxes)
+                    if box["x"] < gx1 and box["x"] + box["width"] > gx0
+                    and box["y"] < gy1 and box["y"] + box["height"] > gy0
+                ]
+                if not hits:
+                    continue
+                
+                integral = _summed_area_table(self._compute_tile_distance_map(tile, scale).distances)
+                for i in hits:
+                    box = boxes[i]
+                    ry0, ry1 = max(box["y"], gy0) - gy0, min(box["y"] + box["height"], gy1) - gy0
+                    rx0, rx1 = max(box["x"], gx0) - gx0, min(box["x"] + box["width"], gx1) - gx0
+                    distance_sums[i] += int(_box_sums(integral, rx0, ry0, rx1 - rx0, ry1 - ry0))
         
-        # Get cluster centers (dominant colors)
-        colors = kmeans.cluster_centers_.astype(int)
+        non_compliant_regions = [
+            self._region_entry(
+                box["x"], box["y"], box["width"], box["height"],
+                distance_sum / (box["width"] * box["height"]),
+                (grid_height, grid_width), scale
+            )
+            for box, distance_sum in zip(boxes, distance_sums)
+        ]
         
-        # Convert to list of tuples
-        return [tuple(color) for color in colors]
+        dominant_colors = histogram.dominant_colors(5, self.dominant_color_refine_iterations)
+        compliant_ratio = compliant / max(1, analyzed)
+        
+        result = {
+            "dominant_colors": dominant_colors,
+            "golden_arches_color_match": self._check_golden_color_presence(dominant_colors),
+            "color_accuracy_score": self._scale_accuracy(compliant_ratio),
+            "non_compliant_regions": non_compliant_regions,
+            "total_pixels": height * width,
+            "compliant_pixel_ratio": compliant_ratio,
+            "palette_coverage": self.palette.coverage_from_counts(palette_counts),
+            "tiled": True
+        }
+        
+        if has_alpha:
+            result["transparent_pixel_ratio"] = 1.0 - opaque_pixels / max(1, height * width)
+        
+        return result
+    
+    def _compute_tile_distance_map(self, tile: np.ndarray, scale: int,
+                                   valid_mask: Optional[np.ndarray] = None) -> DistanceMap:
+        """Distance map for one tile on the image-wide sampling grid."""
+        
+        if self.color_distance_mode == "ciede2000":
+            return PerceptualDistanceMap(
+                tile, self.golden_arches_rgb, self.perceptual_tolerance, scale=scale, valid_mask=valid_mask
+            )
+        
+        return ColorDistanceMap(tile, self.golden_arches_rgb, self.color_tolerance, valid_mask=valid_mask)
+    
+    def _extract_dominant_colors(self, image: np.ndarray, k: int = 5,
+                                 mask: Optional[np.ndarray] = None) -> List[Tuple[int, int, int]]:
+        """Extract dominant colors from a coarse color histogram of a pixel subsample."""
+        
+        return extract_dominant_colors(
+            image,
+            k=k,
+            sample_size=self.dominant_color_sample_size,
+            refine_iterations=self.dominant_color_refine_iterations,
+            mask=mask
+        )
     
     def _check_golden_color_presence(self, dominant_colors: List[Tuple[int, int, int]]) -> bool:
         """Check if McDonald's golden color is present in dominant colors."""
         
-        target_r, target_g, target_b = self.golden_arches_rgb
+        return any(self._matches_golden_color(color) for color in dominant_colors)
+    
+    def _matches_golden_color(self, rgb: Tuple[int, int, int]) -> bool:
+        """Check a single color against the golden color in the configured distance mode."""
         
-        for r, g, b in dominant_colors:
-            # Calculate Euclidean distance in RGB space
-            distance = np.sqrt((r - target_r)**2 + (g - target_g)**2 + (b - target_b)**2)
-            
-            if distance <= self.color_tolerance:
-                return True
+        return bool(self._golden_color_distance(rgb) <= self._golden_tolerance)
+    
+    @property
+    def _golden_tolerance(self) -> float:
+        """Match tolerance in the units of the configured distance mode."""
         
-        return False
+        if self.color_distance_mode == "ciede2000":
+            return self.perceptual_tolerance
+        return self.color_tolerance
     
-    def _calculate_color_accuracy(self, image: np.ndarray) -> float:
-        """Calculate overall color accuracy score."""
+    def _golden_color_distance(self, rgb: Tuple[int, int, int]) -> float:
+        """Distance of a single color to the golden color (RGB Euclidean or Delta E 2000)."""
+        
+        if self.color_distance_mode == "ciede2000":
+            return float(delta_e_2000(
+                srgb_to_lab(np.array(rgb, dtype=np.uint8)),
+                srgb_to_lab(np.array(self.golden_arches_rgb, dtype=np.uint8))
+            ))
         
+        # Calculate Euclidean distance in RGB space
+        r, g, b = rgb
         target_r, target_g, target_b = self.golden_arches_rgb
+        return float(np.sqrt((r - target_r)**2 + (g - target_g)**2 + (b - target_b)**2))
+    
+    def _context_distance_map(self, context: ImageContext) -> DistanceMap:
+        """The context's distance map for this checker's distance settings, computed once."""
         
-        # Calculate distance for each pixel
-        distances = np.sqrt(
-            (image[:, :, 0] - target_r)**2 + 
-            (image[:, :, 1] - target_g)**2 + 
-            (image[:, :, 2] - target_b)**2
+        key = (
+            "distance_map", self.color_distance_mode, tuple(self.golden_arches_rgb),
+            self.color_tolerance, self.perceptual_tolerance, self.perceptual_sample_size
         )
+        return context.derived(key, lambda: self._compute_distance_map(context.rgb, context.opaque))
+    
+    def _compute_distance_map(self, image: np.ndarray, valid_mask: Optional[np.ndarray] = None) -> DistanceMap:
+        """Compute the shared per-pixel distance map for an RGB image.
         
-        # Calculate percentage of pixels within tolerance
-        compliant_pixels = np.sum(distances <= self.color_tolerance)
-        total_pixels = image.shape[0] * image.shape[1]
+        In "ciede2000" mode this is a Delta E 2000 map over a pixel subsample.
+        Pixels outside valid_mask are excluded from all metrics.
+        """
+        
+        if self.color_distance_mode == "ciede2000":
+            return PerceptualDistanceMap(
+                image, self.golden_arches_rgb, self.perceptual_tolerance,
+                max_samples=self.perceptual_sample_size, valid_mask=valid_mask
+            )
+        
+        return ColorDistanceMap(image, self.golden_arches_rgb, self.color_tolerance, valid_mask=valid_mask)
+    
+    def _calculate_color_accuracy(self, distance_map: DistanceMap) -> float:
+        """Calculate overall color accuracy score."""
         
-        accuracy = compliant_pixels / total_pixels
-        return min(1.0, accuracy * 2)  # Scale to make it more meaningful
+        # Calculate percentage of pixels within tolerance
+        accuracy = distance_map.compliant_count() / max(1, distance_map.total_pixels)
+        return self._scale_accuracy(accuracy)
     
-    def _find_non_compliant_regions(self, image: np.ndarray) -> List[dict]:
-        """Find regions that don't match the golden color."""
+    @staticmethod
+    def _scale_accuracy(compliant_ratio: float) -> float:
+        """Map the compliant pixel ratio to the accuracy score."""
         
-        target_r, target_g, target_b = self.golden_arches_rgb
+        return min(1.0, compliant_ratio * 2)  # Scale to make it more meaningful
+    
+    def _find_non_compliant_regions(self, distance_map: DistanceMap) -> List[dict]:
+        """Find regions that don't match the golden color.
         
-        # Calculate distance for each pixel
-        distances = np.sqrt(
-            (image[:, :, 0] - target_r)**2 + 
-            (image[:, :, 1] - target_g)**2 + 
-            (image[:, :, 2] - target_b)**2
-        )
+        Regions come from connected-component stats; components whose bounding
+        box is under 1% of the image are dropped in one vectorized step, and
+        the mean distance over each remaining box is read from a summed-area
+        table instead of slicing the distance map per region.
+        """
         
         # Create mask for non-compliant pixels
-        non_compliant_mask = distances > self.color_tolerance
+        non_compliant_mask = distance_map.non_compliant_mask.view(np.uint8)
         
-        # Find contours of non-compliant regions
-        contours, _ = cv2.findContours(
-            non_compliant_mask.astype(np.uint8), 
-            cv2.RETR_EXTERNAL, 
-            cv2.CHAIN_APPROX_SIMPLE
-        )
+        # Label 8-connected non-compliant components
+        _, _, stats, _ = cv2.connectedComponentsWithStats(non_compliant_mask, connectivity=8)
         
-        regions = []
-        height, width = image.shape[:2]
+        height, width = distance_map.shape
+        x, y, w, h = (stats[1:, i] for i in range(4))
         
-        for contour in contours:
-            # Get bounding box
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Only include significant regions
-            if w * h > (width * height * 0.01):  # At least 1% of image
-                regions.append({
-                    "x": x / width,  # Normalized coordinates
-                    "y": y / height,
-                    "width": w / width,
-                    "height": h / height,
-                    "area": w * h,
-                    "confidence": 1.0 - (np.mean(distances[y:y+h, x:x+w]) / 255.0)
-                })
-        
-        return regions
-    
-    def _calculate_compliant_pixel_ratio(self, image: np.ndarray) -> float:
+        # Only include significant regions
+        significant = np.flatnonzero(w * h > (width * height * 0.01))  # At least 1% of image
+        if len(significant) == 0:
+            return []
+        
+        x, y, w, h = x[significant], y[significant], w[significant], h[significant]
+        mean_distances = _box_sums(_summed_area_table(distance_map.distances), x, y, w, h) / (w * h)
+        
+        return [
+            self._region_entry(
+                int(x[i]), int(y[i]), int(w[i]), int(h[i]), float(mean_distances[i]),
+                distance_map.shape, distance_map.scale
+            )
+            for i in range(len(significant))
+        ]
+    
+    @staticmethod
+    def _region_entry(x: int, y: int, w: int, h: int, mean_distance: float,
+                      shape: Tuple[int, int], scale: int) -> dict:
+        """Build a non-compliant region from distance map coordinates."""
+        
+        height, width = shape
+        return {
+            "x": x / width,  # Normalized coordinates
+            "y": y / height,
+            "width": w / width,
+            "height": h / height,
+            "area": w * h * scale * scale,
+            "confidence": 1.0 - (mean_distance / 255.0)
+        }
+    
+    def _calculate_compliant_pixel_ratio(self, distance_map: DistanceMap) -> float:
         """Calculate ratio of pixels that match the golden color."""
         
-        target_r, target_g, target_b = self.golden_arches_rgb
+        return distance_map.compliant_count() / max(1, distance_map.total_pixels)
+    
+    def collect_color_statistics(self, image: ImageInput, roi=None) -> ColorStatistics:
+        """Collect re-scoring statistics for an image (BGR(A) or ImageContext, like check_color_compliance).
         
-        distances = np.sqrt(
-            (image[:, :, 0] - target_r)**2 + 
-            (image[:, :, 1] - target_g)**2 + 
-            (image[:, :, 2] - target_b)**2
-        )
+        roi restricts the statistics to the logo's bounding box exactly as in
+        check_color_compliance, so re-scored metrics match the live ones.
+        """
         
-        compliant_pixels = np.sum(distances <= self.color_tolerance)
-        total_pixels = image.shape[0] * image.shape[1]
+        context = ImageContext.of(image)
+        box = resolve_roi(roi, context.shape)
+        analyzed = context if box is None else context.crop(box)
+        return ColorStatistics.from_image(analyzed.rgb, palette_entries_from_settings(), mask=analyzed.opaque, roi=box)
+    
+    def record_color_statistics(self, image: ImageInput, asset_id: AssetKey,
+                                store: Optional[ColorStatisticsStore] = None, roi=None) -> ColorStatistics:
+        """Collect an asset's color statistics (over roi, if given) and persist them for later re-scoring."""
         
-        return compliant_pixels / total_pixels
+        statistics = self.collect_color_statistics(image, roi=roi)
+        (store or ColorStatisticsStore()).save(asset_id, statistics)
+        return statistics
+    
+    def rescore_color_statistics(self, statistics: ColorStatistics) -> dict:
+        """Recompute the color metrics from stored statistics with the current settings.
+        
+        Uses golden_arches_rgb and color_tolerance without touching pixels.
+        "exact" is False when the compliant ratio had to be estimated from
+        the coarse histogram (a reference outside the recorded palette or a
+        non-integer tolerance). Regions need pixels and are not re-scored.
+        "roi" is the pixel box the statistics were recorded over (None for
+        the full frame); the ratios are only comparable with a live analysis
+        of the same region.
+        """
+        
+        if self.color_distance_mode != "rgb":
+            raise ValueError("Re-scoring from color statistics requires the rgb distance mode")
+        
+        dominant_colors = statistics.histogram.dominant_colors(5, self.dominant_color_refine_iterations)
+        compliant, exact = statistics.compliant_count(self.golden_arches_rgb, self.color_tolerance)
+        compliant_ratio = compliant / max(1, statistics.total_pixels)
+        
+        # Within-tolerance share per recorded palette color
+        limit = int(np.floor(self.color_tolerance)) + 1
+        in_tolerance = statistics.distance_histograms[:, :limit].sum(axis=1) / max(1, statistics.total_pixels)
+        palette_coverage = {name: float(share) for name, share in zip(statistics.palette_names, in_tolerance)}
+        palette_coverage["off_palette"] = max(0.0, 1.0 - float(in_tolerance.sum()))
+        
+        return {
+            "dominant_colors": dominant_colors,
+            "golden_arches_color_match": self._check_golden_color_presence(dominant_colors),
+            "color_accuracy_score": self._scale_accuracy(compliant_ratio),
+            "total_pixels": statistics.total_pixels,
+            "compliant_pixel_ratio": compliant_ratio,
+            "palette_coverage": palette_coverage,
+            "roi": list(statistics.roi) if statistics.roi is not None else None,
+            "exact": exact
+        }
+    
+    def _golden_color_distances(self, rgb: np.ndarray) -> np.ndarray:
+        """Vectorized _golden_color_distance for (N, 3) uint8 colors."""
+        
+        if self.color_distance_mode == "ciede2000":
+            return delta_e_2000(
+                srgb_to_lab(rgb),
+                srgb_to_lab(np.array(self.golden_arches_rgb, dtype=np.uint8))
+            ).astype(np.float64)
+        
+        difference = rgb.astype(np.float64) - np.array(self.golden_arches_rgb, dtype=np.float64)
+        return np.sqrt((difference ** 2).sum(axis=-1))
+    
+    def validate_hex_colors(self, hex_colors: Sequence[str]) -> np.ndarray:
+        """Vectorized validate_hex_color: one bool per color, False for invalid strings."""
+        
+        rgb, valid = _parse_hex_colors(hex_colors)
+        return valid & (self._golden_color_distances(rgb) <= self._golden_tolerance)
+    
+    def check_svg_color_compliance(self, svg: SvgSource) -> dict:
+        """Check the paint colors of an SVG document (bytes or path) without rasterizing.
+        
+        Metrics are exact and counted over paint occurrences (each painted
+        element's fill and stroke and each gradient stop) instead of pixels,
+        so compliant_pixel_ratio is the compliant share of occurrences.
+        """
+        
+        try:
+            colors = extract_svg_colors(svg)
+            return self._score_vector_colors(list(colors), list(colors.values()))
+        except Exception as e:
+            logger.error(f"SVG color compliance check failed: {e}")
+            return self._error_result(e)
+    
+    def _score_vector_colors(self, hex_colors: List[str], counts: List[int]) -> dict:
+        """Color metrics from "#RRGGBB" paint colors and their occurrence counts."""
+        
+        counts = np.array(counts, dtype=np.int64)
+        total = max(1, int(counts.sum()))
+        rgb, _ = _parse_hex_colors(hex_colors)
+        compliant = self.validate_hex_colors(hex_colors)
+        compliant_ratio = float(counts[compliant].sum()) / total
+        
+        order = np.argsort(-counts, kind="stable")
+        dominant_colors = [tuple(int(v) for v in rgb[i]) for i in order[:5]]
+        
+        # Exact nearest palette color per paint color, no LUT quantization
+        references = np.array([entry.rgb for entry in self.palette.entries], dtype=np.float64)
+        squared = ((rgb[:, None, :].astype(np.float64) - references[None]) ** 2).sum(axis=2)
+        nearest = squared.argmin(axis=1)
+        within = squared[np.arange(len(rgb)), nearest] <= self.palette.tolerance ** 2
+        palette_coverage = {
+            name: float(counts[within & (nearest == index)].sum()) / total
+            for index, name in enumerate(self.palette.names)
+        }
+        palette_coverage["off_palette"] = float(counts[~within].sum()) / total
+        
+        return {
+            "dominant_colors": dominant_colors,
+            # Every paint color is deliberate, so any compliant one counts
+            "golden_arches_color_match": bool(compliant.any()),
+            "color_accuracy_score": self._scale_accuracy(compliant_ratio),
+            "non_compliant_regions": [],
+            "paint_count": int(counts.sum()),
+            "compliant_pixel_ratio": compliant_ratio,
+            "palette_coverage": palette_coverage,
+            "paint_colors": [
+                {"hex": hex_colors[i], "count": int(counts[i]), "compliant": bool(compliant[i])}
+                for i in order
+            ],
+            "vector": True
+        }
     
     def validate_hex_color(self, hex_color: str) -> bool:
         """Validate if a hex color matches McDonald's golden color."""
@@ -181,22 +832,25 @@ class ColorComplianceChecker:
             b = int(hex_color[4:6], 16)
             
             # Check distance from target color
-            target_r, target_g, target_b = self.golden_arches_rgb
-            distance = np.sqrt((r - target_r)**2 + (g - target_g)**2 + (b - target_b)**2)
-            
-            return distance <= self.color_tolerance
+            return self._matches_golden_color((r, g, b))
             
         except Exception as e:
             logger.error(f"Hex color validation failed: {e}")
             return False
     
-    def get_color_recommendations(self, image: np.ndarray) -> List[str]:
-        """Get recommendations for color compliance."""
+    def get_color_recommendations(self, image: ImageInput, analysis: Optional[dict] = None,
+                                  roi=None) -> List[str]:
+        """Get recommendations for color compliance.
+        
+        Pass an existing analysis to skip the check; otherwise the memoized
+        analysis of the image (restricted to roi, if given) is used.
+        """
         
         recommendations = []
         
         try:
-            analysis = self.check_color_compliance(image)
+            if analysis is None:
+                analysis = self.check_color_compliance(image, roi=roi)
             
             if not analysis["golden_arches_color_match"]:
                 recommendations.append(
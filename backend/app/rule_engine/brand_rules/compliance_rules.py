@@ -0,0 +1,192 @@
+"""
+Brand compliance rules registered for the rule executor.
+
+Artifact steps turn an ImageContext into the color and geometry analyses;
+rule checks read those analyses and return their violations and
+recommendations. Callers that already have an analysis pass it as an input
+artifact, and the step producing it is not run.
+
+run_compliance_rules classifies heritage marks first: a heritage asset is
+routed to heritage review and none of the Golden Arches rules run. Without
+an image (or a classification) there is no heritage evidence, and every
+Golden Arches rule runs.
+
+Each rule lists the settings it reads as its parameters, so a changed
+threshold only invalidates the rules reading it when re-analyzing. Rule
+weights follow how decisive a rule is for the report (heritage routing,
+then critical, high and medium severity checks); artifact steps have no
+weight of their own and are scheduled for the checks they unblock.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from ...core.config import settings
+from ..registry import RuleExecution, RuleExecutor, RuleRegistry
+from .color_compliance import ColorComplianceChecker
+from .geometry_rules import GeometryChecker
+from .heritage_rules import HeritageChecker
+
+
+HERITAGE_RULE = "heritage_detection"
+HERITAGE_RECOMMENDATION = "Heritage mark detected - review against the heritage mark guidelines"
+
+# Settings read by the palette, geometry and color checkers
+PALETTE_PARAMETERS = ("golden_arches_rgb", "color_tolerance", "approved_palette", "heritage_palette", "palette_lut_bits")
+PYRAMID_PARAMETERS = ("pyramid_mode", "pyramid_max_levels", "pyramid_min_size", "pyramid_margin")
+GEOMETRY_PARAMETERS = (
+    "max_rotation_degrees", "min_logo_size", "max_logo_instances", "shape_index_path",
+    "shape_match_max_distance", "shape_match_max_hu_distance",
+    "geometry_localization_size", "geometry_localization_padding"
+) + PYRAMID_PARAMETERS
+COLOR_PARAMETERS = PALETTE_PARAMETERS + (
+    "dominant_color_sample_size", "dominant_color_refine_iterations", "color_distance_mode",
+    "perceptual_tolerance", "perceptual_sample_size", "color_tile_size", "color_tiling_threshold_pixels"
+) + PYRAMID_PARAMETERS
+HERITAGE_PARAMETERS = PALETTE_PARAMETERS + (
+    "heritage_min_coverage", "heritage_sample_size", "perceptual_tolerance",
+    "shape_index_path", "shape_match_max_distance", "shape_match_max_hu_distance"
+)
+
+compliance_rules = RuleRegistry()
+
+
+def _outcome(violations: List[Dict[str, Any]], recommendation: str) -> Dict[str, Any]:
+    """Result of a rule check: its violations, and the recommendation if there are any."""
+    
+    return {"violations": violations, "recommendations": [recommendation] if violations else []}
+
+
+@compliance_rules.rule(HERITAGE_RULE, consumes=("image_context",), produces=("heritage_classification",),
+                       parameters=HERITAGE_PARAMETERS, weight=4.0)
+def detect_heritage(image_context) -> Dict[str, Any]:
+    classification = HeritageChecker().check_heritage(image_context)
+    return {
+        "heritage_classification": classification,
+        "violations": [],
+        "recommendations": [HERITAGE_RECOMMENDATION] if classification["is_heritage"] else []
+    }
+
+
+@compliance_rules.rule("geometry", consumes=("image_context",), produces=("geometry_analysis",),
+                       parameters=GEOMETRY_PARAMETERS, weight=0.0)
+def analyze_geometry(image_context) -> Dict[str, Any]:
+    return {"geometry_analysis": GeometryChecker().check_geometry_compliance(image_context)}
+
+
+@compliance_rules.rule("color", consumes=("image_context", "geometry_analysis"), produces=("color_analysis",),
+                       parameters=COLOR_PARAMETERS, weight=0.0)
+def analyze_color(image_context, geometry_analysis: Dict[str, Any]) -> Dict[str, Any]:
+    # Color metrics are restricted to the logo found by the geometry analysis
+    return {"color_analysis": ColorComplianceChecker().check_color_compliance(image_context, roi=geometry_analysis)}
+
+
+@compliance_rules.rule("no_rotation", consumes=("geometry_analysis",), version="2",
+                       parameters=("max_rotation_degrees",))
+def check_no_rotation(geometry_analysis: Dict[str, Any]) -> Dict[str, Any]:
+    # Every detected logo counts, not only the main one; older analyses only have the main logo
+    aggregate = geometry_analysis.get("aggregate", {})
+    rotation = aggregate.get("max_rotation_angle", geometry_analysis["rotation_angle"])
+    violations = []
+    if rotation > settings.max_rotation_degrees:
+        violations.append({
+            "rule": "no_rotation",
+            "severity": "medium",
+            "confidence": 0.92,
+            "description": f"Logo rotated by {rotation}° (max allowed: {settings.max_rotation_degrees}°)"
+        })
+    return _outcome(violations, "Ensure logo is not rotated - use original orientation")
+
+
+@compliance_rules.rule("no_flipping", consumes=("geometry_analysis",), version="2", weight=2.0)
+def check_no_flipping(geometry_analysis: Dict[str, Any]) -> Dict[str, Any]:
+    aggregate = geometry_analysis.get("aggregate", {})
+    violations = []
+    if aggregate.get("flipped_logos", int(geometry_analysis["is_flipped"])):
+        violations.append({
+            "rule": "no_flipping",
+            "severity": "high",
+            "confidence": 0.98,
+            "description": "Logo appears to be horizontally flipped"
+        })
+    return _outcome(violations, "Do not flip or mirror the Golden Arches logo")
+
+
+@compliance_rules.rule("gold_color_only", consumes=("color_analysis",), weight=3.0)
+def check_gold_color_only(color_analysis: Dict[str, Any]) -> Dict[str, Any]:
+    violations = []
+    if not color_analysis["golden_arches_color_match"]:
+        violations.append({
+            "rule": "gold_color_only",
+            "severity": "critical",
+            "confidence": 0.85,
+            "description": "Logo color does not match McDonald's gold (RGB: 255,188,13)"
+        })
+    return _outcome(violations, "Use only McDonald's approved gold color (RGB: 255,188,13)")
+
+
+def run_compliance_rules(executor: RuleExecutor, inputs: Dict[str, Any],
+                         heritage_first: Optional[bool] = None,
+                         fingerprints: Optional[Dict[str, Optional[str]]] = None,
+                         previous: Optional[Dict[str, Any]] = None,
+                         deadline: Optional[float] = None) -> RuleExecution:
+    """Run the compliance rules on the input artifacts, heritage classification first.
+    
+    The heritage rule runs on its own (unless "heritage_classification" is
+    an input); when it classifies the asset as heritage, the other rules are
+    not run at all. heritage_first defaults to settings.heritage_first;
+    without it every rule runs in one pass. fingerprints, previous and
+    deadline are passed to RuleExecutor.run; when the deadline leaves the
+    heritage rule pending, so is every other rule.
+    """
+    
+    classify = "heritage_classification" not in inputs and "image_context" in inputs
+    if not _heritage_first(heritage_first):
+        return executor.run(
+            inputs, targets=_golden_arches_rules(executor, inputs) + ([HERITAGE_RULE] if classify else []),
+            fingerprints=fingerprints, previous=previous, deadline=deadline
+        )
+    
+    execution = executor.run(
+        inputs, targets=[HERITAGE_RULE] if classify else [],
+        fingerprints=fingerprints, previous=previous, deadline=deadline
+    )
+    classification = execution.artifacts.get("heritage_classification")
+    if classification is not None and classification["is_heritage"]:
+        return execution
+    
+    remaining = _golden_arches_rules(executor, execution.artifacts)
+    if HERITAGE_RULE in execution.pending:
+        execution.pending.extend(remaining)
+        return execution
+    return execution.extend(executor.run(
+        execution.artifacts, targets=remaining, fingerprints=execution.fingerprints,
+        previous=previous, deadline=deadline
+    ))
+
+
+def complete_compliance_rules(executor: RuleExecutor, execution: RuleExecution,
+                              heritage_first: Optional[bool] = None) -> RuleExecution:
+    """Run the rules a deadline left pending, on the artifacts computed so far."""
+    
+    pending, execution.pending = execution.pending, []
+    if not pending:
+        return execution
+    if HERITAGE_RULE in pending and _heritage_first(heritage_first):
+        # Nothing but the heritage stage was planned; route the asset as usual
+        rest = run_compliance_rules(executor, execution.artifacts, True, fingerprints=execution.fingerprints)
+    else:
+        rest = executor.run(execution.artifacts, targets=pending, fingerprints=execution.fingerprints)
+    return execution.extend(rest)
+
+
+def _golden_arches_rules(executor: RuleExecutor, available: Iterable[str]) -> List[str]:
+    """Every rule but the heritage rule, except artifact steps whose artifacts are all available."""
+    
+    available = set(available)
+    return [
+        rule.name for rule in executor.registry
+        if rule.name != HERITAGE_RULE and (not rule.produces or not available.issuperset(rule.produces))
+    ]
+
+
+def _heritage_first(heritage_first: Optional[bool]) -> bool:
+    return settings.heritage_first if heritage_first is None else heritage_first
@@ -7,267 +7,501 @@ from typing import Dict, List, Tuple, Optional
 from loguru import logger
 
 from ...core.config import settings
+from ..batch import ImageBatch, group_images_by_shape
+from ..pyramid import near_threshold, run_coarse_to_fine
+from ..analysis_context import get_analysis_cache
+from ..image_context import BLUR_KERNEL_SIZE, ImageContext, ImageInput, to_gray
+from ..roi import merge_overlapping_boxes, pad_box
+from ..contour_features import ContourFeatureTable, bounding_rects
+from ..shape_index import ShapeMatches, get_shape_index
 
 
 class GeometryChecker:
     """Checker for geometric compliance of McDonald's Golden Arches."""
     
+    # Golden Arches should have a specific aspect ratio
+    EXPECTED_ASPECT_RATIO = 1.2  # Approximate expected ratio
+    ASPECT_RATIO_TOLERANCE = 0.2  # Relative difference before the score is penalized
+    
+    # Golden Arches should have moderate circularity (4π * area / perimeter²)
+    MIN_CIRCULARITY = 0.2
+    MAX_CIRCULARITY = 0.8
+    
+    # Attributes that change the analysis result; part of the analysis cache key
+    _CONFIG_ATTRIBUTES = (
+        "max_rotation_degrees", "min_logo_size", "max_logo_instances",
+        "shape_match_max_distance", "shape_match_max_hu_distance",
+        "localization_size", "localization_padding",
+        "pyramid_mode", "pyramid_max_levels", "pyramid_min_size", "pyramid_margin"
+    )
+    
     def __init__(self):
         self.max_rotation_degrees = settings.max_rotation_degrees
         self.min_logo_size = settings.min_logo_size
+        self.max_logo_instances = settings.max_logo_instances
+        self.shape_match_max_distance = settings.shape_match_max_distance
+        self.shape_match_max_hu_distance = settings.shape_match_max_hu_distance
+        self.shape_index = get_shape_index()
+        self.localization_size = settings.geometry_localization_size
+        self.localization_padding = settings.geometry_localization_padding
+        self.pyramid_mode = settings.pyramid_mode
+        self.pyramid_max_levels = settings.pyramid_max_levels
+        self.pyramid_min_size = settings.pyramid_min_size
+        self.pyramid_margin = settings.pyramid_margin
+        self.analysis_cache = get_analysis_cache()
     
-    def check_geometry_compliance(self, image: np.ndarray) -> Dict:
-        """Check geometric compliance of the logo in the image."""
+    def check_geometry_compliance(self, image: ImageInput) -> Dict:
+        """Check geometric compliance of the logos in the image.
+        
+        The top-level fields describe the main (largest) logo; "logos" holds
+        the same fields for every detected instance, largest first, and
+        "aggregate" summarizes them.
+        
+        image is a BGR(A) array or an ImageContext whose grayscale and Otsu
+        mask are reused (and kept for other checkers). Results are memoized
+        per image content and checker configuration.
+        """
         
         try:
-            # Convert to grayscale for analysis
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            else:
-                gray = image
-            
-            # Detect logo contours
-            logo_contours = self._detect_logo_contours(gray)
-            
-            if not logo_contours:
-                return {
-                    "rotation_angle": 0.0,
-                    "is_flipped": False,
-                    "is_warped": False,
-                    "aspect_ratio": 1.0,
-                    "scale_factor": 1.0,
-                    "geometry_score": 0.0,
-                    "error": "No logo detected"
-                }
-            
-            # Analyze the largest contour (assumed to be the main logo)
-            main_contour = max(logo_contours, key=cv2.contourArea)
-            
-            # Check rotation
-            rotation_angle = self._detect_rotation(main_contour)
-            
-            # Check if flipped
-            is_flipped = self._detect_flipping(main_contour, image.shape)
-            
-            # Check for warping/stretching
-            is_warped = self._detect_warping(main_contour)
-            
-            # Calculate aspect ratio
-            aspect_ratio = self._calculate_aspect_ratio(main_contour)
+            context = ImageContext.of(image)
+            return self.analysis_cache.get_or_compute(
+                self.analysis_cache.context_for(context.image, digest=context.digest), self._cache_key(),
+                lambda: self._compute_geometry_compliance(context)
+            )
+        
+        except Exception as e:
+            logger.error(f"Geometry compliance check failed: {e}")
+            return self._empty_result(str(e))
+    
+    def check_geometry_compliance_batch(self, images: ImageBatch) -> List[Dict]:
+        """Check a batch of images (list of arrays or ImageContexts, or an (N, H, W, C) array).
+        
+        Returns one result per image, identical to check_geometry_compliance.
+        Equal-sized color images are converted to grayscale with a single
+        cvtColor call over the stacked rows; the grayscale of each context
+        is kept for later checks. In pyramid mode every image goes through
+        the single-image check.
+        """
+        
+        if self.pyramid_mode:
+            return [self.check_geometry_compliance(image) for image in images]
+        
+        results: List[Optional[Dict]] = [None] * len(images)
+        
+        contexts: List[Optional[ImageContext]] = [None] * len(images)
+        if not isinstance(images, np.ndarray):
+            contexts = [image if isinstance(image, ImageContext) else None for image in images]
+            images = [ImageContext.of(image).image for image in images]
+        
+        for indices, stack in group_images_by_shape(images):
+            if self._should_localize(stack.shape):
+                for index in indices:
+                    try:
+                        context = contexts[index] if contexts[index] is not None else ImageContext(images[index])
+                        results[index] = self._check_localized_geometry(context)
+                    except Exception as e:
+                        logger.error(f"Geometry compliance check failed: {e}")
+                        results[index] = self._empty_result(str(e))
+                continue
             
-            # Calculate scale factor
-            scale_factor = self._calculate_scale_factor(main_contour, image.shape)
+            try:
+                if stack.ndim == 4:
+                    n_images, height, width, channels = stack.shape
+                    rows = np.ascontiguousarray(stack).reshape(n_images * height, width, channels)
+                    grays = to_gray(rows).reshape(n_images, height, width)
+                else:
+                    grays = stack
+            except Exception as e:
+                logger.error(f"Batch geometry compliance check failed: {e}")
+                for index in indices:
+                    results[index] = self._empty_result(str(e))
+                continue
             
-            # Calculate overall geometry score
-            geometry_score = self._calculate_geometry_score(
-                rotation_angle, is_flipped, is_warped, aspect_ratio
+            for index, gray in zip(indices, grays):
+                try:
+                    binary = None
+                    if contexts[index] is not None:
+                        gray = contexts[index].derived("gray", lambda: gray)
+                        binary = contexts[index].otsu_mask
+                    results[index] = self._check_gray_geometry(gray, stack.shape[1:], binary=binary)
+                except Exception as e:
+                    logger.error(f"Geometry compliance check failed: {e}")
+                    results[index] = self._empty_result(str(e))
+        
+        return results
+    
+    def _cache_key(self) -> tuple:
+        index_digest = self.shape_index.digest if self.shape_index is not None else None
+        return (("geometry_compliance",) + tuple(getattr(self, name) for name in self._CONFIG_ATTRIBUTES)
+                + (index_digest,))
+    
+    def _compute_geometry_compliance(self, context: ImageContext) -> Dict:
+        if self.pyramid_mode:
+            return self._check_geometry_pyramid(context)
+        if self._should_localize(context.shape):
+            return self._check_localized_geometry(context)
+        
+        return self._check_gray_geometry(context.gray, context.shape, binary=context.otsu_mask)
+    
+    @staticmethod
+    def _empty_result(error: str) -> Dict:
+        return {
+            "rotation_angle": 0.0,
+            "is_flipped": False,
+            "is_warped": False,
+            "aspect_ratio": 1.0,
+            "scale_factor": 1.0,
+            "geometry_score": 0.0,
+            "logo_count": 0,
+            "logos": [],
+            "error": error
+        }
+    
+    def _check_geometry_pyramid(self, context: ImageContext) -> Dict:
+        """Coarse-to-fine geometry analysis of the context's grayscale.
+        
+        Levels are analyzed coarsest first and a level decides the result
+        unless no logo was found there or the rotation or aspect ratio lies
+        within the pyramid margin of its threshold. Contour area and bounding
+        box are reported in full-resolution pixels.
+        """
+        
+        width = context.shape[1]
+        levels = context.pyramid(self.pyramid_max_levels, self.pyramid_min_size, gray=True)
+        
+        def analyze(level_gray: np.ndarray, level: int) -> Dict:
+            if level == 0:
+                return self._check_gray_geometry(context.gray, context.shape, binary=context.otsu_mask)
+            return self._check_gray_geometry(level_gray, level_gray.shape, width / level_gray.shape[1])
+        
+        result, level = run_coarse_to_fine(levels, analyze, self._is_geometry_decision_marginal)
+        result["pyramid_level"] = level
+        return result
+    
+    def _is_geometry_decision_marginal(self, result: Dict) -> bool:
+        """Whether a level's rotation or aspect ratio decision is too close to call."""
+        
+        if "error" in result:
+            return True
+        
+        # Any logo instance close to a threshold sends the image to the next level
+        for logo in result["logos"]:
+            ratio_diff = abs(logo["aspect_ratio"] - self.EXPECTED_ASPECT_RATIO) / self.EXPECTED_ASPECT_RATIO
+            if (near_threshold(logo["rotation_angle"], self.max_rotation_degrees, self.pyramid_margin)
+                    or near_threshold(ratio_diff, self.ASPECT_RATIO_TOLERANCE, self.pyramid_margin)):
+                return True
+        return False
+    
+    def _should_localize(self, image_shape: Tuple[int, ...]) -> bool:
+        return 0 < self.localization_size < max(image_shape[:2])
+    
+    def _check_localized_geometry(self, context: ImageContext) -> Dict:
+        """Geometry analysis that only processes the logo regions at full resolution.
+        
+        Candidates are localized on a subsampled copy whose longer side is
+        at most localization_size pixels. Each candidate box is padded, and contours
+        are re-extracted at full resolution inside the (merged) padded boxes,
+        using the Otsu threshold found on the small copy. Only those regions
+        are converted, blurred and thresholded at full size, so the cost
+        follows the logo area rather than the megapixels.
+        """
+        
+        # Every n-th pixel: far cheaper than an area resize, and the blur below smooths the aliasing
+        height, width = context.shape[:2]
+        downscale = -(-max(height, width) // self.localization_size)
+        small_gray = context.derived(
+            ("localization_gray", downscale),
+            lambda: to_gray(np.ascontiguousarray(context.image[::downscale, ::downscale]))
+        )
+        
+        threshold, small_binary = cv2.threshold(
+            cv2.GaussianBlur(small_gray, BLUR_KERNEL_SIZE, 0), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+        )
+        located = self._detect_logo_contours(small_gray, self.min_logo_size / downscale, binary=small_binary)
+        if not len(located):
+            return self._empty_result("No logo detected")
+        
+        # Padded full-resolution regions of the largest candidates; the margin covers the
+        # blur kernel and the localization rounding
+        order = np.argsort(-located.areas, kind="stable")[:self.max_logo_instances]
+        margin = BLUR_KERNEL_SIZE[0] + downscale
+        regions = merge_overlapping_boxes([
+            pad_box(box * downscale, margin + self.localization_padding * max(box[2:]) * downscale, context.shape)
+            for box in located.bounding_rects[order]
+        ])
+        
+        contours = []
+        for x, y, w, h in regions:
+            region_gray = to_gray(context.image[y:y + h, x:x + w])
+            _, region_binary = cv2.threshold(
+                cv2.GaussianBlur(region_gray, BLUR_KERNEL_SIZE, 0), threshold, 255, cv2.THRESH_BINARY
+            )
+            region_contours, _ = cv2.findContours(
+                region_binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y)
             )
             
-            return {
-                "rotation_angle": rotation_angle,
-                "is_flipped": is_flipped,
-                "is_warped": is_warped,
-                "aspect_ratio": aspect_ratio,
-                "scale_factor": scale_factor,
-                "geometry_score": geometry_score,
-                "contour_area": cv2.contourArea(main_contour),
-                "bounding_box": cv2.boundingRect(main_contour)
+            # Contours cut by a region edge inside the image belong to a neighboring object
+            rects = bounding_rects(region_contours)
+            cut = (
+                ((rects[:, 0] == x) & (x > 0))
+                | ((rects[:, 1] == y) & (y > 0))
+                | ((rects[:, 0] + rects[:, 2] == x + w) & (x + w < width))
+                | ((rects[:, 1] + rects[:, 3] == y + h) & (y + h < height))
+            )
+            keep = ~cut & self._bounding_box_mask(rects, self.min_logo_size)
+            contours.extend(contour for contour, kept in zip(region_contours, keep) if kept)
+        
+        candidates = self._filter_logo_contours(ContourFeatureTable(contours), self.min_logo_size)
+        result = self._analyze_logo_candidates(candidates, context.shape)
+        result["localized_regions"] = len(regions)
+        return result
+    
+    def _check_gray_geometry(self, gray: np.ndarray, image_shape: Tuple[int, ...],
+                             downscale: float = 1.0, binary: Optional[np.ndarray] = None) -> Dict:
+        """Geometry analysis of a grayscale image.
+        
+        downscale is the ratio of the original image size to this one; the
+        minimum logo size, contour area and bounding box are converted so the
+        result is expressed in original pixels. binary is the precomputed
+        Otsu mask of gray, if available.
+        """
+        
+        # Detect logo contours
+        candidates = self._detect_logo_contours(gray, self.min_logo_size / downscale, binary=binary)
+        return self._analyze_logo_candidates(candidates, image_shape, downscale)
+    
+    def _analyze_logo_candidates(self, candidates: ContourFeatureTable, image_shape: Tuple[int, ...],
+                                 downscale: float = 1.0) -> Dict:
+        """Geometry result for the largest candidate contours (see _check_gray_geometry)."""
+        
+        if not len(candidates):
+            return self._empty_result("No logo detected")
+        
+        # Analyze the largest contours, largest first (the first is assumed to be the main logo)
+        order = np.argsort(-candidates.areas, kind="stable")[:self.max_logo_instances]
+        logos = candidates.subset(order)
+        
+        # Check rotation
+        rotation_angles = self._detect_rotation(logos)
+        
+        # Check if flipped
+        flipped = self._detect_flipping(logos)
+        
+        # Check for warping/stretching
+        warped = self._detect_warping(logos)
+        
+        # Calculate aspect ratio
+        aspect_ratios = self._calculate_aspect_ratio(logos)
+        
+        # Calculate scale factor
+        scale_factors = self._calculate_scale_factor(logos, image_shape)
+        
+        # Recognized reference marks get rotation and flipping from the matched variant
+        matches = self._match_reference_shapes(logos)
+        recognized = np.zeros(len(logos), dtype=bool)
+        if matches is not None:
+            recognized = (
+                (matches.distances <= self.shape_match_max_distance)
+                & (matches.hu_distances <= self.shape_match_max_hu_distance)
+            )
+            rotation_angles = np.where(recognized, np.abs(matches.rotations), rotation_angles)
+            flipped = np.where(recognized, matches.mirrored, flipped)
+        
+        # Calculate overall geometry score
+        geometry_scores = self._calculate_geometry_scores(rotation_angles, flipped, warped, aspect_ratios)
+        
+        bounding_boxes = logos.bounding_rects
+        if downscale != 1.0:
+            bounding_boxes = np.rint(bounding_boxes * downscale)
+        contour_areas = logos.areas * downscale * downscale
+        
+        instances = [
+            {
+                "rotation_angle": float(rotation_angles[i]),
+                "is_flipped": bool(flipped[i]),
+                "is_warped": bool(warped[i]),
+                "aspect_ratio": float(aspect_ratios[i]),
+                "scale_factor": float(scale_factors[i]),
+                "geometry_score": float(geometry_scores[i]),
+                "contour_area": float(contour_areas[i]),
+                "bounding_box": tuple(int(v) for v in bounding_boxes[i]),
+                "reference_match": matches.as_dict(i) if recognized[i] else None
             }
-            
-        except Exception as e:
-            logger.error(f"Geometry compliance check failed: {e}")
-            return {
-                "rotation_angle": 0.0,
-                "is_flipped": False,
-                "is_warped": False,
-                "aspect_ratio": 1.0,
-                "scale_factor": 1.0,
-                "geometry_score": 0.0,
-                "error": str(e)
+            for i in range(len(logos))
+        ]
+        
+        result = dict(instances[0])
+        result.update({
+            "logo_count": len(instances),
+            "logos": instances,
+            "aggregate": {
+                "geometry_score": float(geometry_scores.min()),
+                "mean_geometry_score": float(geometry_scores.mean()),
+                "max_rotation_angle": float(rotation_angles.max()),
+                "rotated_logos": int(np.count_nonzero(rotation_angles > self.max_rotation_degrees)),
+                "flipped_logos": int(np.count_nonzero(flipped)),
+                "warped_logos": int(np.count_nonzero(warped))
             }
+        })
+        return result
     
-    def _detect_logo_contours(self, gray_image: np.ndarray) -> List:
-        """Detect potential logo contours in the image."""
+    def _match_reference_shapes(self, features: ContourFeatureTable) -> Optional[ShapeMatches]:
+        """Nearest reference-shape variant of each contour, or None without a shape index."""
         
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray_image, (5, 5), 0)
+        if self.shape_index is None or not len(self.shape_index):
+            return None
         
-        # Apply threshold to create binary image
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        try:
+            return self.shape_index.match(features.contours)
+        except Exception as e:
+            logger.error(f"Reference shape matching failed: {e}")
+            return None
+    
+    def _detect_logo_contours(self, gray_image: np.ndarray, min_logo_size: Optional[float] = None,
+                              binary: Optional[np.ndarray] = None) -> ContourFeatureTable:
+        """Feature table of potential logo contours in the image (or in its precomputed Otsu mask)."""
+        
+        if binary is not None:
+            thresh = binary
+        else:
+            # Blur to reduce noise, then threshold to a binary image
+            thresh = ImageContext(gray_image).otsu_mask
+        
+        if min_logo_size is None:
+            min_logo_size = self.min_logo_size
         
         # Find contours
         contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        # Filter contours by size and shape
-        filtered_contours = []
-        min_area = self.min_logo_size * self.min_logo_size
+        # Texture and noise give thousands of small contours; drop those that cannot
+        # pass the filter from their bounding boxes before computing full features
+        keep = self._bounding_box_mask(bounding_rects(contours), min_logo_size)
+        features = ContourFeatureTable([contour for contour, kept in zip(contours, keep) if kept])
+        return self._filter_logo_contours(features, min_logo_size)
+    
+    def _bounding_box_mask(self, rects: np.ndarray, min_logo_size: float) -> np.ndarray:
+        """Which contours could pass the size and shape filter, judging by bounding box alone.
         
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area > min_area:
-                # Check if contour could be a logo (roughly arch-shaped)
-                if self._is_potential_logo_shape(contour):
-                    filtered_contours.append(contour)
+        A contour runs through pixel centers, so its area is at most
+        (width - 1) * (height - 1) and its perimeter at least twice the
+        longer extent, which bounds its circularity by
+        pi * shorter / longer. Contours failing the filter even at these
+        bounds (noise specks, texture, thin lines) are dropped; the rest
+        still go through _filter_logo_contours.
+        """
         
-        return filtered_contours
+        extents = rects[:, 2:] - 1
+        longer, shorter = extents.max(axis=1), extents.min(axis=1)
+        max_circularity = np.zeros(len(rects))
+        np.divide(np.pi * shorter, longer, out=max_circularity, where=longer > 0)
+        return (longer * shorter > min_logo_size * min_logo_size) & (max_circularity > self.MIN_CIRCULARITY)
     
-    def _is_potential_logo_shape(self, contour) -> bool:
-        """Check if contour could potentially be a Golden Arches logo."""
+    def _filter_logo_contours(self, features: ContourFeatureTable, min_logo_size: float) -> ContourFeatureTable:
+        """Rows of the table that could be a logo, by size and shape."""
         
-        # Calculate basic shape properties
-        area = cv2.contourArea(contour)
-        perimeter = cv2.arcLength(contour, True)
+        # Filter contours by size and shape
+        min_area = min_logo_size * min_logo_size
         
-        if perimeter == 0:
-            return False
+        # Check if contour could be a logo (roughly arch-shaped)
+        keep = (features.areas > min_area) & self._potential_logo_shape_mask(features)
+        return features.subset(np.flatnonzero(keep))
+    
+    def _potential_logo_shape_mask(self, features: ContourFeatureTable) -> np.ndarray:
+        """Which contours could potentially be a Golden Arches logo."""
         
-        # Calculate circularity (4π * area / perimeter²)
-        circularity = 4 * np.pi * area / (perimeter * perimeter)
+        # Calculate circularity (4π * area / perimeter²); zero-length contours never qualify
+        perimeters = features.perimeters
+        circularity = np.zeros(len(features))
+        np.divide(4 * np.pi * features.areas, perimeters * perimeters, out=circularity, where=perimeters > 0)
         
         # Golden Arches should have moderate circularity (not too round, not too linear)
-        if 0.2 < circularity < 0.8:
-            return True
-        
-        return False
+        return (circularity > self.MIN_CIRCULARITY) & (circularity < self.MAX_CIRCULARITY)
     
-    def _detect_rotation(self, contour) -> float:
-        """Detect rotation angle of the logo."""
+    def _detect_rotation(self, features: ContourFeatureTable) -> np.ndarray:
+        """Detect the rotation angle of each contour in degrees."""
         
-        try:
-            # Fit an ellipse to the contour
-            if len(contour) >= 5:  # Minimum points needed for ellipse fitting
-                ellipse = cv2.fitEllipse(contour)
-                angle = ellipse[2]  # Rotation angle
-                
-                # Normalize angle to [-90, 90] range
-                if angle > 90:
-                    angle = angle - 180
-                
-                return abs(angle)
-            else:
-                # Use minimum area rectangle as fallback
-                rect = cv2.minAreaRect(contour)
-                angle = rect[2]
-                
-                # Normalize angle
-                if angle < -45:
-                    angle = 90 + angle
-                
-                return abs(angle)
-                
-        except Exception as e:
-            logger.warning(f"Rotation detection failed: {e}")
-            return 0.0
+        angles = np.zeros(len(features))
+        
+        # Fit an ellipse to the contour (needs at least five points); failed fits stay 0
+        ellipse_angles = features.ellipses[:, 4]
+        fitted = ~np.isnan(ellipse_angles)
+        
+        # Normalize angle to [-90, 90] range
+        normalized = np.where(ellipse_angles > 90, ellipse_angles - 180, ellipse_angles)
+        angles[fitted] = np.abs(normalized[fitted])
+        
+        # Use minimum area rectangle as fallback
+        short = features.point_counts < 5
+        if short.any():
+            rect_angles = features.min_area_rect_angles[short]
+            angles[short] = np.abs(np.where(rect_angles < -45, 90 + rect_angles, rect_angles))
+        
+        return angles
     
-    def _detect_flipping(self, contour, image_shape: Tuple[int, int]) -> bool:
-        """Detect if the logo is horizontally flipped."""
+    def _detect_flipping(self, features: ContourFeatureTable) -> np.ndarray:
+        """Detect which contours look horizontally flipped."""
         
-        try:
-            # Calculate moments to find centroid
-            M = cv2.moments(contour)
-            if M["m00"] == 0:
-                return False
-            
-            # Get bounding box
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Analyze the shape's orientation
-            # This is a simplified check - in practice, you'd use more sophisticated methods
-            # like template matching or feature analysis
-            
-            # For Golden Arches, check if the arch opening faces the expected direction
-            # This is a mock implementation - real detection would be more complex
-            hull = cv2.convexHull(contour)
-            hull_area = cv2.contourArea(hull)
-            contour_area = cv2.contourArea(contour)
-            
-            # If the ratio is significantly different from expected, might be flipped
-            solidity = contour_area / hull_area if hull_area > 0 else 0
-            
-            # This is a placeholder - real flipping detection would require
-            # template matching or machine learning
-            return solidity < 0.7  # Arbitrary threshold for demo
-            
-        except Exception as e:
-            logger.warning(f"Flipping detection failed: {e}")
-            return False
+        # For Golden Arches, check if the arch opening faces the expected direction
+        # This is a mock implementation - real detection would be more complex
+        hull_areas = features.hull_areas
+        
+        # If the ratio is significantly different from expected, might be flipped
+        solidity = np.zeros(len(features))
+        np.divide(features.areas, hull_areas, out=solidity, where=hull_areas > 0)
+        
+        # This is a placeholder - real flipping detection would require
+        # template matching or machine learning. Zero-area contours are not flipped.
+        return (features.areas > 0) & (solidity < 0.7)  # Arbitrary threshold for demo
     
-    def _detect_warping(self, contour) -> bool:
-        """Detect if the logo is warped or stretched."""
+    def _detect_warping(self, features: ContourFeatureTable) -> np.ndarray:
+        """Detect which contours look warped or stretched."""
         
-        try:
-            # Fit ellipse and check if it's significantly non-circular
-            if len(contour) >= 5:
-                ellipse = cv2.fitEllipse(contour)
-                major_axis = max(ellipse[1])
-                minor_axis = min(ellipse[1])
-                
-                if minor_axis > 0:
-                    eccentricity = major_axis / minor_axis
-                    # If eccentricity is too high, logo might be warped
-                    return eccentricity > 2.0
-            
-            return False
-            
-        except Exception as e:
-            logger.warning(f"Warping detection failed: {e}")
-            return False
+        # Check whether the fitted ellipse is significantly non-circular
+        axes = features.ellipses[:, 2:4]
+        major_axis = axes.max(axis=1)
+        minor_axis = axes.min(axis=1)
+        
+        # If eccentricity is too high, logo might be warped (contours without an ellipse are not)
+        eccentricity = np.zeros(len(features))
+        np.divide(major_axis, minor_axis, out=eccentricity, where=minor_axis > 0)
+        return eccentricity > 2.0
     
-    def _calculate_aspect_ratio(self, contour) -> float:
-        """Calculate the aspect ratio of the logo."""
+    def _calculate_aspect_ratio(self, features: ContourFeatureTable) -> np.ndarray:
+        """Calculate the bounding box aspect ratio (width / height) of each contour."""
         
-        try:
-            x, y, w, h = cv2.boundingRect(contour)
-            if h > 0:
-                return w / h
-            return 1.0
-            
-        except Exception as e:
-            logger.warning(f"Aspect ratio calculation failed: {e}")
-            return 1.0
+        widths, heights = features.bounding_rects[:, 2], features.bounding_rects[:, 3]
+        return np.where(heights > 0, widths / np.maximum(heights, 1), 1.0)
     
-    def _calculate_scale_factor(self, contour, image_shape: Tuple[int, int]) -> float:
-        """Calculate the scale factor of the logo relative to image size."""
+    def _calculate_scale_factor(self, features: ContourFeatureTable,
+                                image_shape: Tuple[int, int]) -> np.ndarray:
+        """Calculate the scale factor of each contour relative to image size."""
         
-        try:
-            contour_area = cv2.contourArea(contour)
-            image_area = image_shape[0] * image_shape[1]
-            
-            if image_area > 0:
-                return np.sqrt(contour_area / image_area)
-            return 1.0
-            
-        except Exception as e:
-            logger.warning(f"Scale factor calculation failed: {e}")
-            return 1.0
+        image_area = image_shape[0] * image_shape[1]
+        if image_area > 0:
+            return np.sqrt(features.areas / image_area)
+        return np.ones(len(features))
     
-    def _calculate_geometry_score(self, rotation_angle: float, is_flipped: bool, 
-                                 is_warped: bool, aspect_ratio: float) -> float:
-        """Calculate overall geometry compliance score."""
+    def _calculate_geometry_scores(self, rotation_angles: np.ndarray, flipped: np.ndarray,
+                                   warped: np.ndarray, aspect_ratios: np.ndarray) -> np.ndarray:
+        """Calculate the geometry compliance score of each logo instance."""
         
-        score = 1.0
+        scores = np.ones(len(rotation_angles))
         
         # Penalize rotation
-        if rotation_angle > self.max_rotation_degrees:
-            rotation_penalty = min(0.5, (rotation_angle - self.max_rotation_degrees) / 45.0)
-            score -= rotation_penalty
+        excess_rotation = rotation_angles - self.max_rotation_degrees
+        scores -= np.where(excess_rotation > 0, np.minimum(0.5, excess_rotation / 45.0), 0.0)
         
         # Penalize flipping
-        if is_flipped:
-            score -= 0.3
+        scores -= np.where(flipped, 0.3, 0.0)
         
         # Penalize warping
-        if is_warped:
-            score -= 0.4
+        scores -= np.where(warped, 0.4, 0.0)
         
-        # Penalize unusual aspect ratios
-        # Golden Arches should have a specific aspect ratio
-        expected_ratio = 1.2  # Approximate expected ratio
-        ratio_diff = abs(aspect_ratio - expected_ratio) / expected_ratio
-        if ratio_diff > 0.2:  # More than 20% difference
-            score -= min(0.2, ratio_diff)
+        # Penalize unusual aspect ratios (more than 20% difference)
+        ratio_diff = np.abs(aspect_ratios - self.EXPECTED_ASPECT_RATIO) / self.EXPECTED_ASPECT_RATIO
+        scores -= np.where(ratio_diff > self.ASPECT_RATIO_TOLERANCE, np.minimum(0.2, ratio_diff), 0.0)
         
-        return max(0.0, score)
+        return np.maximum(0.0, scores)
     
     def get_geometry_recommendations(self, analysis: Dict) -> List[str]:
         """Get recommendations for geometry compliance."""
@@ -307,6 +541,20 @@ class GeometryChecker:
                 "Logo appears too large relative to image. Consider appropriate sizing"
             )
         
+        # Other logo instances in the image
+        aggregate = analysis.get("aggregate")
+        if aggregate and analysis.get("logo_count", 1) > 1:
+            issues = [
+                f"{aggregate[key]} {label}" for key, label in (
+                    ("rotated_logos", "rotated"), ("flipped_logos", "flipped"), ("warped_logos", "warped")
+                ) if aggregate[key]
+            ]
+            if issues:
+                recommendations.append(
+                    f"{analysis['logo_count']} logos detected ({', '.join(issues)}). "
+                    "Every instance must follow the geometry rules"
+                )
+        
         if not recommendations:
             recommendations.append("Logo geometry meets compliance requirements")
         
@@ -0,0 +1,166 @@
+"""
+Heritage mark classifier.
+
+Heritage marks (retired logos and packaging from the Heritage Marks
+library) are printed in their own spot colors rather than the Golden
+Arches gold, and are reviewed under heritage rules instead of the Golden
+Arches color and geometry rules. Because a heritage classification skips
+those rules, it needs two pieces of evidence: heritage spot colors, and a
+shape in those colors matching a heritage outline from the reference-shape
+index. Spot colors that a gold check would accept as gold are not counted,
+so an off-gold logo is never taken for a heritage mark. The classifier
+only looks at a strided sample of the image, so it is cheap enough to run
+before every other rule.
+"""
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from ...core.config import settings
+from ..analysis_context import get_analysis_cache
+from ..image_context import ImageContext, ImageInput, rgb_view
+from ..palette import PaletteEntry, get_compiled_palette
+from ..perceptual import delta_e_2000, srgb_to_lab
+from ..shape_index import get_shape_index
+
+
+# Smallest heritage-colored shape (longer side, in sample pixels) matched against the outlines
+MIN_SHAPE_SIZE = 16
+
+
+class HeritageChecker:
+    """Classifier routing heritage marks away from the Golden Arches rules."""
+    
+    # Attributes that change the classification; part of the analysis cache key
+    _CONFIG_ATTRIBUTES = (
+        "heritage_min_coverage", "heritage_sample_size", "perceptual_tolerance",
+        "shape_match_max_distance", "shape_match_max_hu_distance"
+    )
+    
+    def __init__(self):
+        self.heritage_min_coverage = settings.heritage_min_coverage
+        self.heritage_sample_size = settings.heritage_sample_size
+        self.perceptual_tolerance = settings.perceptual_tolerance
+        self.shape_match_max_distance = settings.shape_match_max_distance
+        self.shape_match_max_hu_distance = settings.shape_match_max_hu_distance
+        self.palette = get_compiled_palette()
+        self.shape_index = get_shape_index()
+        self.heritage_entries = self._heritage_entries()
+        self.analysis_cache = get_analysis_cache()
+    
+    def _heritage_entries(self) -> List[PaletteEntry]:
+        """Heritage palette colors outside the gold tolerance (RGB or CIEDE2000)."""
+        
+        gold = next(entry for entry in self.palette.entries if entry.name == "golden_arches")
+        heritage = [entry for entry in self.palette.entries if entry.group == "heritage"]
+        if not heritage:
+            return []
+        
+        colors = np.array([entry.rgb for entry in heritage], dtype=np.uint8)
+        rgb_distances = np.linalg.norm(colors.astype(np.float32) - np.float32(gold.rgb), axis=1)
+        delta_e = delta_e_2000(srgb_to_lab(colors), srgb_to_lab(np.array(gold.rgb, dtype=np.uint8)))
+        near_gold = (rgb_distances <= self.palette.tolerance) | (delta_e <= self.perceptual_tolerance)
+        return [entry for entry, excluded in zip(heritage, near_gold) if not excluded]
+    
+    def check_heritage(self, image: ImageInput) -> Dict:
+        """Classify an image as a heritage mark.
+        
+        An image is heritage when the heritage palette colors (other than
+        those within the gold tolerance) cover at least heritage_min_coverage
+        of its (opaque) pixels and more of them than the Golden Arches gold
+        does, and a shape in those colors matches an outline of the
+        reference-shape index's heritage group. Without heritage outlines
+        nothing is classified as heritage. Results are memoized per image content and checker
+        configuration.
+        """
+        
+        try:
+            context = ImageContext.of(image)
+            index_digest = self.shape_index.digest if self.shape_index is not None else None
+            key = (("heritage", self.palette.digest, index_digest)
+                   + tuple(getattr(self, name) for name in self._CONFIG_ATTRIBUTES))
+            return self.analysis_cache.get_or_compute(
+                self.analysis_cache.context_for(context.image, digest=context.digest), key,
+                lambda: self._classify(context)
+            )
+        
+        except Exception as e:
+            logger.error(f"Heritage classification failed: {e}")
+            return {
+                "is_heritage": False,
+                "confidence": 0.0,
+                "heritage_probability": 0.0,
+                "heritage_coverage": 0.0,
+                "golden_arches_coverage": 0.0,
+                "heritage_colors": {},
+                "heritage_shape_match": None,
+                "error": str(e)
+            }
+    
+    def _classify(self, context: ImageContext) -> Dict:
+        # Every n-th pixel so the longer side is at most heritage_sample_size
+        step = max(1, -(-max(context.shape[:2]) // self.heritage_sample_size))
+        sample_rgb, opaque = context.derived(
+            ("heritage_sample", step),
+            lambda: rgb_view(np.ascontiguousarray(context.image[::step, ::step]))
+        )
+        if sample_rgb.ndim == 2:
+            sample_rgb = np.repeat(sample_rgb[..., np.newaxis], 3, axis=2)
+        coverage = self.palette.coverage(sample_rgb, opaque)
+        
+        heritage_colors = {
+            entry.name: coverage[entry.name] for entry in self.heritage_entries if coverage[entry.name] > 0
+        }
+        heritage_coverage = float(sum(heritage_colors.values()))
+        golden_coverage = coverage.get("golden_arches", 0.0)
+        
+        shape_match = None
+        if heritage_coverage >= self.heritage_min_coverage and heritage_coverage > golden_coverage:
+            shape_match = self._match_heritage_shape(sample_rgb, opaque)
+        
+        # Share of the branded colors that are heritage colors, when a heritage outline backs them up
+        branded = heritage_coverage + golden_coverage
+        probability = heritage_coverage / branded if branded > 0 and shape_match is not None else 0.0
+        is_heritage = shape_match is not None
+        
+        return {
+            "is_heritage": is_heritage,
+            "confidence": probability if is_heritage else 1.0 - probability,
+            "heritage_probability": probability,
+            "heritage_coverage": heritage_coverage,
+            "golden_arches_coverage": golden_coverage,
+            "heritage_colors": dict(sorted(heritage_colors.items(), key=lambda item: -item[1])),
+            "heritage_shape_match": shape_match
+        }
+    
+    def _match_heritage_shape(self, sample_rgb: np.ndarray, opaque: Optional[np.ndarray]) -> Optional[Dict]:
+        """Closest heritage outline matched by a shape in the heritage colors, or None."""
+        
+        if self.shape_index is None or not len(self.shape_index):
+            return None
+        
+        indices, in_tolerance = self.palette.classify(sample_rgb)
+        heritage_indices = [self.palette.entries.index(entry) for entry in self.heritage_entries]
+        mask = in_tolerance & np.isin(indices, heritage_indices)
+        if opaque is not None:
+            mask &= opaque
+        
+        contours, _ = cv2.findContours(mask.astype(np.uint8) * 255, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        contours = [
+            contour for contour in contours
+            if len(contour) >= 5 and max(cv2.boundingRect(contour)[2:]) >= MIN_SHAPE_SIZE
+        ]
+        if not contours:
+            return None
+        
+        # Approved Golden Arches outlines in heritage colors are not heritage marks
+        matches = self.shape_index.match(contours, group="heritage")
+        recognized = np.flatnonzero(
+            (matches.distances <= self.shape_match_max_distance)
+            & (matches.hu_distances <= self.shape_match_max_hu_distance)
+        )
+        if not len(recognized):
+            return None
+        return matches.as_dict(int(recognized[np.argmin(matches.distances[recognized])]))
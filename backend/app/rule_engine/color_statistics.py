@@ -0,0 +1,224 @@
+"""
+Persisted per-asset color statistics for re-scoring without pixels.
+
+ColorStatistics is a compact sufficient statistic of an asset's colors:
+
+- for every palette entry, a histogram of pixel counts per integer RGB
+  distance (ceiling of the Euclidean distance, 0-442), which gives exact
+  compliant counts for any integer tolerance;
+- the coarse color histogram (counts and channel sums per 5-bit bin) over
+  all pixels, from which dominant colors are re-derived and compliance to
+  a reference color outside the palette is estimated.
+
+Like the live color analysis, statistics can be restricted to the logo's
+region of interest; the pixel box they cover is stored with them.
+
+Statistics are stored as one compressed .npz per asset under
+settings.cache_dir, so a change of tolerance or gold reference can be
+re-scored across the catalog without downloading or decoding assets.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ..core.config import settings
+from .dominant_colors import ColorHistogram
+from .palette import PaletteEntry
+
+
+# Largest integer RGB distance: ceil(sqrt(3 * 255**2))
+MAX_RGB_DISTANCE = 442
+
+# Rows of pixels packed per pass when counting exact colors
+_COUNT_BLOCK_PIXELS = 1 << 22
+
+
+def exact_color_counts(image: np.ndarray, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct RGB colors of an (H, W, 3) image (or its masked pixels) and their pixel counts.
+    
+    Packed 24-bit color keys are counted per block of rows by sorting, and
+    the per-block counts merged, so memory follows the block size and the
+    number of distinct colors rather than the 2**24 possible ones.
+    """
+    
+    height, width = image.shape[:2]
+    rows_per_block = max(1, _COUNT_BLOCK_PIXELS // max(1, width))
+    block_keys: List[np.ndarray] = []
+    block_counts: List[np.ndarray] = []
+    
+    for y0 in range(0, height, rows_per_block):
+        block = image[y0:y0 + rows_per_block, :, :3]
+        key = block[..., 0].astype(np.int32) << 16
+        key |= block[..., 1].astype(np.int32) << 8
+        key |= block[..., 2]
+        if mask is not None:
+            key = key[mask[y0:y0 + rows_per_block]]
+        keys, counts = np.unique(key.reshape(-1), return_counts=True)
+        block_keys.append(keys)
+        block_counts.append(counts)
+    
+    colors = np.concatenate(block_keys)
+    counts = np.concatenate(block_counts).astype(np.int64)
+    if len(block_keys) > 1 and len(colors):
+        # Colors seen in several blocks: sum their counts over runs of equal keys
+        order = np.argsort(colors, kind="stable")
+        colors, counts = colors[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, colors[1:] != colors[:-1]])
+        colors, counts = colors[starts], np.add.reduceat(counts, starts)
+    
+    rgb = np.stack([colors >> 16, (colors >> 8) & 255, colors & 255], axis=1).astype(np.uint8)
+    return rgb, counts
+
+
+@dataclass
+class ColorStatistics:
+    """Distance histograms per palette entry plus a coarse color histogram."""
+    total_pixels: int
+    palette_names: List[str]
+    palette_rgb: np.ndarray  # (E, 3) uint8
+    distance_histograms: np.ndarray  # (E, MAX_RGB_DISTANCE + 1) int64
+    histogram: ColorHistogram
+    roi: Optional[Tuple[int, int, int, int]] = None  # (x, y, width, height) covered; None for the full frame
+    
+    @classmethod
+    def from_image(cls, image_rgb: np.ndarray, entries: List[PaletteEntry],
+                   mask: Optional[np.ndarray] = None,
+                   roi: Optional[Tuple[int, int, int, int]] = None) -> "ColorStatistics":
+        """Collect statistics from an RGB image (or its masked pixels) in one exact color count.
+        
+        roi only records which pixel box of the asset image_rgb was cropped from.
+        """
+        
+        colors, counts = exact_color_counts(image_rgb, mask)
+        palette_rgb = np.array([entry.rgb for entry in entries], dtype=np.uint8)
+        
+        weights = counts.astype(np.float64)
+        signed = colors.astype(np.int32)
+        distance_histograms = np.empty((len(entries), MAX_RGB_DISTANCE + 1), dtype=np.int64)
+        for index, reference in enumerate(palette_rgb.astype(np.int32)):
+            squared = ((signed - reference) ** 2).sum(axis=1)
+            # ceil(distance) <= t exactly when distance <= t, for integer t
+            distance = np.ceil(np.sqrt(squared)).astype(np.int64)
+            distance_histograms[index] = np.rint(
+                np.bincount(distance, weights=weights, minlength=MAX_RGB_DISTANCE + 1)
+            ).astype(np.int64)
+        
+        histogram = ColorHistogram()
+        histogram.add_counts(colors, counts)
+        
+        return cls(
+            total_pixels=int(counts.sum()),
+            palette_names=[entry.name for entry in entries],
+            palette_rgb=palette_rgb,
+            distance_histograms=distance_histograms,
+            histogram=histogram,
+            roi=tuple(int(value) for value in roi) if roi is not None else None
+        )
+    
+    def entry_index(self, rgb: Tuple[int, int, int]) -> Optional[int]:
+        """Index of the palette entry with exactly this color, if any."""
+        
+        matches = np.flatnonzero((self.palette_rgb == np.array(rgb, dtype=np.uint8)).all(axis=1))
+        return int(matches[0]) if len(matches) else None
+    
+    def compliant_count(self, reference_rgb: Tuple[int, int, int], tolerance: float) -> Tuple[int, bool]:
+        """Pixels within tolerance of the reference and whether the count is exact.
+        
+        Counts are exact for integer tolerances when the reference is one of
+        the recorded palette colors; otherwise they are estimated from the
+        mean color of each coarse histogram bin.
+        """
+        
+        index = self.entry_index(reference_rgb)
+        if index is not None:
+            limit = int(np.floor(tolerance))
+            count = int(self.distance_histograms[index, :max(0, limit + 1)].sum())
+            return count, float(tolerance) == limit
+        
+        counts, means = self.histogram.occupied()
+        distances = np.sqrt(((means - np.array(reference_rgb, dtype=np.float64)) ** 2).sum(axis=1))
+        return int(counts[distances <= tolerance].sum()), False
+    
+    def save(self, path: str) -> None:
+        """Write the statistics to a compressed .npz file atomically."""
+        
+        occupied = np.flatnonzero(self.histogram.counts)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                total_pixels=np.int64(self.total_pixels),
+                palette_names=np.array(self.palette_names),
+                palette_rgb=self.palette_rgb,
+                distance_histograms=self.distance_histograms,
+                histogram_bits=np.int64(self.histogram.bits),
+                histogram_bins=occupied,
+                histogram_counts=self.histogram.counts[occupied],
+                histogram_sums=self.histogram.sums[:, occupied],
+                roi=np.array(self.roi if self.roi is not None else (), dtype=np.int64)
+            )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "ColorStatistics":
+        with np.load(path) as data:
+            histogram = ColorHistogram(int(data["histogram_bits"]))
+            histogram.counts[data["histogram_bins"]] = data["histogram_counts"]
+            histogram.sums[:, data["histogram_bins"]] = data["histogram_sums"]
+            return cls(
+                total_pixels=int(data["total_pixels"]),
+                palette_names=[str(name) for name in data["palette_names"]],
+                palette_rgb=data["palette_rgb"],
+                distance_histograms=data["distance_histograms"],
+                histogram=histogram,
+                # Files written before regions were recorded cover the full frame
+                roi=tuple(int(value) for value in data["roi"]) if "roi" in data and len(data["roi"]) else None
+            )
+
+
+AssetKey = Union[int, str]
+
+_ASSET_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class ColorStatisticsStore:
+    """Directory of per-asset color statistics files."""
+    
+    SUFFIX = ".npz"
+    
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(settings.cache_dir, "color_stats")
+    
+    def path(self, asset_id: AssetKey) -> str:
+        key = str(asset_id)
+        if not _ASSET_KEY_PATTERN.match(key) or key.startswith("."):
+            raise ValueError(f"Invalid asset id for color statistics: {asset_id!r}")
+        return os.path.join(self.directory, key + self.SUFFIX)
+    
+    def save(self, asset_id: AssetKey, statistics: ColorStatistics) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(asset_id)
+        statistics.save(path)
+        return path
+    
+    def load(self, asset_id: AssetKey) -> ColorStatistics:
+        return ColorStatistics.load(self.path(asset_id))
+    
+    def __contains__(self, asset_id: AssetKey) -> bool:
+        return os.path.exists(self.path(asset_id))
+    
+    def asset_ids(self) -> List[str]:
+        """Ids of all assets with stored statistics, sorted."""
+        
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-len(self.SUFFIX)] for name in os.listdir(self.directory) if name.endswith(self.SUFFIX)
+        )
+    
+    def __iter__(self) -> Iterator[Tuple[str, ColorStatistics]]:
+        for asset_id in self.asset_ids():
+            yield asset_id, self.load(asset_id)
@@ -0,0 +1,132 @@
+"""
+Array-backed shape features for a set of contours.
+
+Each contour is a row. Area, perimeter, bounding rectangle and centroid
+are computed for all rows at once from the concatenated contour points
+(shoelace and segment-length sums per contour), matching cv2.contourArea,
+cv2.arcLength(closed=True), cv2.boundingRect and cv2.moments. Features
+that need a per-contour OpenCV call (convex hull area, fitted ellipse,
+minimum-area rectangle angle) are computed on first access, so filter the
+table with subset() before reading them. bounding_rects() gives just the
+rectangles, for discarding contours before the table is built.
+"""
+from typing import List, Optional, Sequence
+
+import cv2
+import numpy as np
+from loguru import logger
+
+
+def bounding_rects(contours: Sequence[np.ndarray]) -> np.ndarray:
+    """cv2.boundingRect of every contour as (x, y, width, height) rows."""
+    
+    if not len(contours):
+        return np.zeros((0, 4), dtype=np.int64)
+    
+    counts = np.fromiter((len(c) for c in contours), dtype=np.int64, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    minimums = np.minimum.reduceat(points, starts, axis=0).astype(np.int64)
+    maximums = np.maximum.reduceat(points, starts, axis=0).astype(np.int64)
+    return np.hstack([minimums, maximums - minimums + 1])
+
+
+class ContourFeatureTable:
+    """Shape features of contours, one row per contour."""
+    
+    def __init__(self, contours: Sequence[np.ndarray]):
+        self.contours: List[np.ndarray] = list(contours)
+        n_contours = len(self.contours)
+        self.point_counts = np.fromiter((len(c) for c in self.contours), dtype=np.int64, count=n_contours)
+        self._hull_areas: Optional[np.ndarray] = None
+        self._ellipses: Optional[np.ndarray] = None
+        self._rect_angles: Optional[np.ndarray] = None
+        
+        if n_contours == 0:
+            self.areas = np.zeros(0)
+            self.perimeters = np.zeros(0)
+            self.bounding_rects = np.zeros((0, 4), dtype=np.int64)
+            self.centroids = np.zeros((0, 2))
+            return
+        
+        points = np.concatenate(self.contours).reshape(-1, 2)
+        starts = np.concatenate(([0], np.cumsum(self.point_counts)[:-1]))
+        ends = starts + self.point_counts - 1
+        
+        # Coordinates as contiguous float columns, and the next point along each
+        # closed contour: the column shifted by one, wrapping at contour ends
+        x, y = points[:, 0].astype(np.float64), points[:, 1].astype(np.float64)
+        next_x, next_y = np.roll(x, -1), np.roll(y, -1)
+        next_x[ends], next_y[ends] = x[starts], y[starts]
+        
+        cross = x * next_y - next_x * y
+        signed_doubled_areas = np.add.reduceat(cross, starts)
+        self.areas = np.abs(signed_doubled_areas) / 2
+        
+        dx, dy = next_x - x, next_y - y
+        self.perimeters = np.add.reduceat(np.sqrt(dx * dx + dy * dy), starts)
+        
+        minimums = np.minimum.reduceat(points, starts, axis=0).astype(np.int64)
+        maximums = np.maximum.reduceat(points, starts, axis=0).astype(np.int64)
+        self.bounding_rects = np.hstack([minimums, maximums - minimums + 1])
+        
+        # First-order moments by Green's theorem; undefined for zero-area contours
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m10 = np.add.reduceat((x + next_x) * cross, starts)
+            m01 = np.add.reduceat((y + next_y) * cross, starts)
+            scale = 3 * signed_doubled_areas
+            self.centroids = np.stack([m10 / scale, m01 / scale], axis=1)
+    
+    def __len__(self) -> int:
+        return len(self.contours)
+    
+    def subset(self, indices) -> "ContourFeatureTable":
+        """Table of the given rows, keeping any features already computed."""
+        
+        indices = np.asarray(indices, dtype=np.int64)
+        table = ContourFeatureTable.__new__(ContourFeatureTable)
+        table.contours = [self.contours[i] for i in indices]
+        table.point_counts = self.point_counts[indices]
+        table.areas = self.areas[indices]
+        table.perimeters = self.perimeters[indices]
+        table.bounding_rects = self.bounding_rects[indices]
+        table.centroids = self.centroids[indices]
+        table._hull_areas = None if self._hull_areas is None else self._hull_areas[indices]
+        table._ellipses = None if self._ellipses is None else self._ellipses[indices]
+        table._rect_angles = None if self._rect_angles is None else self._rect_angles[indices]
+        return table
+    
+    @property
+    def hull_areas(self) -> np.ndarray:
+        """Area of each contour's convex hull."""
+        if self._hull_areas is None:
+            self._hull_areas = np.array(
+                [cv2.contourArea(cv2.convexHull(c)) for c in self.contours], dtype=np.float64
+            )
+        return self._hull_areas
+    
+    @property
+    def ellipses(self) -> np.ndarray:
+        """Fitted ellipses as (center x, center y, width, height, angle) rows.
+        
+        Rows are NaN for contours with fewer than five points or where the
+        fit fails.
+        """
+        if self._ellipses is None:
+            self._ellipses = np.full((len(self), 5), np.nan)
+            for index in np.flatnonzero(self.point_counts >= 5):
+                try:
+                    (cx, cy), (width, height), angle = cv2.fitEllipse(self.contours[index])
+                    self._ellipses[index] = (cx, cy, width, height, angle)
+                except cv2.error as e:
+                    logger.warning(f"Ellipse fitting failed: {e}")
+        return self._ellipses
+    
+    @property
+    def min_area_rect_angles(self) -> np.ndarray:
+        """cv2.minAreaRect angle for contours too short for an ellipse fit, NaN otherwise."""
+        if self._rect_angles is None:
+            self._rect_angles = np.full(len(self), np.nan)
+            for index in np.flatnonzero(self.point_counts < 5):
+                self._rect_angles[index] = cv2.minAreaRect(self.contours[index])[2]
+        return self._rect_angles
@@ -0,0 +1,184 @@
+"""
+Histogram-based dominant color extraction.
+
+Replaces per-pixel K-means with a coarse 3D color histogram built over a
+deterministic pixel subsample, followed by an optional weighted Lloyd
+refinement on the occupied histogram bins.
+"""
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# Bits kept per channel when binning colors (5 bits -> 32x32x32 bins)
+HISTOGRAM_BITS = 5
+
+# Peaks closer than this (RGB Euclidean) are treated as the same color
+MIN_PEAK_SEPARATION = 24.0
+
+
+def sampling_step(height: int, width: int, max_samples: int) -> int:
+    """Grid step that keeps a height x width image under max_samples samples."""
+    
+    return max(1, math.ceil(math.sqrt(height * width / max(1, max_samples))))
+
+
+def sample_pixels(image: np.ndarray, max_samples: int, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Return an (N, 3) pixel subsample taken on a regular grid.
+    
+    The grid is a strided view of the image, so only the sampled pixels are
+    copied. Sampling is deterministic for a given image size. Grid points
+    outside mask, if given, are dropped.
+    """
+    
+    step = sampling_step(image.shape[0], image.shape[1], max_samples)
+    grid = image[::step, ::step, :3]
+    if mask is not None:
+        return grid[mask[::step, ::step]]
+    return grid.reshape(-1, 3)
+
+
+class ColorHistogram:
+    """Coarse 3D color histogram that can be accumulated over several pixel batches."""
+    
+    def __init__(self, bits: int = HISTOGRAM_BITS):
+        self.bits = bits
+        n_bins = 1 << (3 * bits)
+        self.counts = np.zeros(n_bins, dtype=np.int64)
+        self.sums = np.zeros((3, n_bins), dtype=np.float64)
+    
+    @staticmethod
+    def _bin_index(pixels: np.ndarray, bits: int) -> np.ndarray:
+        shift = 8 - bits
+        quantized = (pixels >> shift).astype(np.int32)
+        return (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits) | quantized[:, 2]
+    
+    @classmethod
+    def for_batch(cls, pixels: np.ndarray, bits: int = HISTOGRAM_BITS) -> List["ColorHistogram"]:
+        """One histogram per image from (N, M, 3) pixel samples, binned in a single pass."""
+        
+        n_images, n_samples = pixels.shape[:2]
+        n_bins = 1 << (3 * bits)
+        flat = pixels.reshape(-1, 3)
+        bin_index = cls._bin_index(flat, bits) + np.repeat(np.arange(n_images) * n_bins, n_samples)
+        
+        counts = np.bincount(bin_index, minlength=n_images * n_bins).reshape(n_images, n_bins)
+        sums = np.stack([
+            np.bincount(bin_index, weights=flat[:, channel], minlength=n_images * n_bins).reshape(n_images, n_bins)
+            for channel in range(3)
+        ], axis=1)
+        
+        histograms = []
+        for index in range(n_images):
+            histogram = cls(bits)
+            histogram.counts = counts[index]
+            histogram.sums = sums[index]
+            histograms.append(histogram)
+        return histograms
+    
+    def add(self, pixels: np.ndarray) -> None:
+        """Add (N, 3) uint8 pixels to the histogram."""
+        
+        if len(pixels) == 0:
+            return
+        
+        bin_index = self._bin_index(pixels, self.bits)
+        n_bins = len(self.counts)
+        self.counts += np.bincount(bin_index, minlength=n_bins)
+        for channel in range(3):
+            self.sums[channel] += np.bincount(bin_index, weights=pixels[:, channel], minlength=n_bins)
+    
+    def add_counts(self, colors: np.ndarray, counts: np.ndarray) -> None:
+        """Add (N, 3) uint8 colors, each occurring counts[i] times."""
+        
+        if len(colors) == 0:
+            return
+        
+        bin_index = self._bin_index(colors, self.bits)
+        n_bins = len(self.counts)
+        weights = counts.astype(np.float64)
+        self.counts += np.rint(np.bincount(bin_index, weights=weights, minlength=n_bins)).astype(np.int64)
+        for channel in range(3):
+            self.sums[channel] += np.bincount(bin_index, weights=weights * colors[:, channel], minlength=n_bins)
+    
+    def occupied(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Pixel count and mean RGB color of every occupied bin."""
+        
+        occupied = np.flatnonzero(self.counts)
+        counts = self.counts[occupied]
+        return counts, (self.sums[:, occupied] / counts).T
+    
+    def dominant_colors(self, k: int = 5, refine_iterations: int = 2) -> List[Tuple[int, int, int]]:
+        """Up to k dominant colors, most prominent first."""
+        
+        counts, means = self.occupied()
+        if len(counts) == 0:
+            return []
+        
+        centers = _pick_peaks(counts, means, k)
+        centers, weights = _refine(counts, means, centers, refine_iterations)
+        
+        order = np.argsort(weights, kind="stable")[::-1]
+        colors = np.clip(np.rint(centers[order]), 0, 255).astype(int)
+        
+        return [tuple(int(c) for c in color) for color in colors]
+
+
+def _pick_peaks(counts: np.ndarray, means: np.ndarray, k: int) -> np.ndarray:
+    """Greedily pick the k most populated bins that are distinct colors."""
+    
+    peaks = []
+    min_separation_sq = MIN_PEAK_SEPARATION * MIN_PEAK_SEPARATION
+    
+    for index in np.argsort(counts, kind="stable")[::-1]:
+        color = means[index]
+        if all(np.sum((color - peak) ** 2) > min_separation_sq for peak in peaks):
+            peaks.append(color)
+            if len(peaks) == k:
+                break
+    
+    return np.array(peaks)
+
+
+def _assign(means: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Index of the nearest center for every bin mean."""
+    
+    distances = ((means[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    return np.argmin(distances, axis=1)
+
+
+def _refine(counts: np.ndarray, means: np.ndarray, centers: np.ndarray,
+            iterations: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted Lloyd iterations over the occupied bins.
+    
+    Returns the refined centers and the number of sampled pixels each covers.
+    """
+    
+    weights = counts.astype(np.float64)
+    n_centers = len(centers)
+    
+    for _ in range(iterations):
+        labels = _assign(means, centers)
+        cluster_weights = np.bincount(labels, weights=weights, minlength=n_centers)
+        nonempty = cluster_weights > 0
+        for channel in range(3):
+            sums = np.bincount(labels, weights=weights * means[:, channel], minlength=n_centers)
+            centers[nonempty, channel] = sums[nonempty] / cluster_weights[nonempty]
+    
+    labels = _assign(means, centers)
+    return centers, np.bincount(labels, weights=weights, minlength=n_centers)
+
+
+def extract_dominant_colors(image: np.ndarray, k: int = 5, sample_size: int = 65536,
+                            refine_iterations: int = 2,
+                            mask: Optional[np.ndarray] = None) -> List[Tuple[int, int, int]]:
+    """Extract up to k dominant RGB colors, most prominent first.
+    
+    Fewer than k colors are returned when the image has fewer distinct
+    colors than that. Pixels outside mask, if given, are ignored.
+    """
+    
+    histogram = ColorHistogram()
+    histogram.add(sample_pixels(image, sample_size, mask))
+    return histogram.dominant_colors(k, refine_iterations)
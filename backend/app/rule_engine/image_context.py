@@ -0,0 +1,151 @@
+"""
+Decoded image plus the derived arrays the rule checkers share.
+
+An ImageContext is created once per request, from encoded bytes or an
+array, and handed to every checker. Derived arrays are computed on first
+use and kept for the lifetime of the context, so no checker repeats work
+another one already did:
+
+- rgb / opaque: zero-copy RGB view of the BGR(A) pixels and the alpha mask;
+- gray, blurred, otsu_mask: the contour preprocessing chain;
+- digest: the content digest used by the analysis cache;
+- pyramid(): downscaled levels of the image or of its grayscale;
+- crop(): a child context for a region of interest;
+- derived(): anything else, keyed by the caller (e.g. a distance map for
+  a given checker configuration).
+
+A context may be shared by the rules of a request running on several
+threads: each derived array is computed once, under a lock of its own
+key, and only published once it is complete.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .analysis_context import image_digest
+from .image_io import decode_image
+from .pyramid import build_pyramid
+from .roi import PixelBox
+
+
+# Noise suppression before Otsu thresholding
+BLUR_KERNEL_SIZE = (5, 5)
+
+
+def rgb_view(image: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Zero-copy RGB view of a BGR or BGRA image, plus its opaque-pixel mask.
+    
+    The mask excludes fully transparent pixels and is None when the image
+    has no alpha channel or no transparent pixels.
+    """
+    
+    if image.ndim == 3 and image.shape[2] == 4:
+        opaque = image[..., 3] > 0
+        return image[..., 2::-1], (None if opaque.all() else opaque)
+    if image.ndim == 3 and image.shape[2] == 3:
+        return image[..., ::-1], None
+    return image, None
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Grayscale for contour analysis; fully transparent RGBA pixels become background (0)."""
+    
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGBA2GRAY)
+        gray[image[..., 3] == 0] = 0
+        return gray
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+class ImageContext:
+    """One decoded image and its lazily computed, cached derived arrays."""
+    
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self._derived: Dict[Hashable, Any] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Optional["ImageContext"]:
+        """Decode encoded bytes (see decode_image); None when they are not a raster image."""
+        
+        image = decode_image(data)
+        return None if image is None else cls(image)
+    
+    @classmethod
+    def of(cls, image: "ImageInput") -> "ImageContext":
+        """The context itself, or a new context wrapping a raw array."""
+        
+        return image if isinstance(image, ImageContext) else cls(image)
+    
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.image.shape
+    
+    def derived(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the value stored under key, computing and storing it first if needed.
+        
+        Concurrent callers of the same key wait for one computation; other
+        keys (including those compute itself derives) are not blocked.
+        """
+        
+        if key in self._derived:
+            return self._derived[key]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._derived:
+                self._derived[key] = compute()
+        return self._derived[key]
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._derived
+    
+    @property
+    def digest(self) -> str:
+        return self.derived("digest", lambda: image_digest(self.image))
+    
+    @property
+    def rgb(self) -> np.ndarray:
+        return self.derived("rgb_view", lambda: rgb_view(self.image))[0]
+    
+    @property
+    def opaque(self) -> Optional[np.ndarray]:
+        return self.derived("rgb_view", lambda: rgb_view(self.image))[1]
+    
+    @property
+    def gray(self) -> np.ndarray:
+        return self.derived("gray", lambda: to_gray(self.image))
+    
+    @property
+    def blurred(self) -> np.ndarray:
+        return self.derived("blurred", lambda: cv2.GaussianBlur(self.gray, BLUR_KERNEL_SIZE, 0))
+    
+    @property
+    def otsu_mask(self) -> np.ndarray:
+        return self.derived(
+            "otsu_mask",
+            lambda: cv2.threshold(self.blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+        )
+    
+    def pyramid(self, max_levels: int, min_size: int, gray: bool = False) -> List[np.ndarray]:
+        """Pyramid levels of the image (or its grayscale); level 0 is the array itself."""
+        
+        return self.derived(
+            ("pyramid", gray, max_levels, min_size),
+            lambda: build_pyramid(self.gray if gray else self.image, max_levels, min_size)
+        )
+    
+    def crop(self, box: PixelBox) -> "ImageContext":
+        """Child context over a zero-copy view of an (x, y, width, height) box."""
+        
+        x, y, w, h = box
+        return self.derived(("crop", tuple(box)), lambda: ImageContext(self.image[y:y + h, x:x + w]))
+
+
+ImageInput = Union[np.ndarray, ImageContext]
@@ -0,0 +1,203 @@
+"""
+Decoding of uploaded image bytes for the rule checkers.
+
+Images are returned in sRGB with their EXIF orientation applied, so pixel
+values can be compared against the brand colors directly. Embedded ICC
+profiles other than sRGB (Adobe RGB, Display P3, CMYK) are converted with
+Little CMS transforms. Building a transform costs far more than applying
+one, so transforms are kept in a small LRU keyed by the profile digest.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+from PIL import Image, ImageCms
+
+from ..core.config import settings
+
+
+_SRGB_PROFILE = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB"))
+
+# Little CMS rendering intent and flags (numeric for compatibility across Pillow versions)
+_RELATIVE_COLORIMETRIC = 1
+_NO_CACHE = 0x0040  # Transforms are shared between threads
+
+# Pillow modes a transform can be built for
+_MANAGED_MODES = ("RGB", "RGBA", "CMYK", "L")
+
+_EXIF_ORIENTATION = 0x0112
+
+# EXIF orientation value -> operation that restores the upright image
+_ORIENTATION_OPS = {
+    2: lambda image: cv2.flip(image, 1),
+    3: lambda image: cv2.rotate(image, cv2.ROTATE_180),
+    4: lambda image: cv2.flip(image, 0),
+    5: cv2.transpose,
+    6: lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE),
+    7: lambda image: cv2.flip(cv2.transpose(image), -1),
+    8: lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE),
+}
+
+
+def profile_digest(icc_profile: bytes) -> str:
+    return hashlib.blake2b(icc_profile, digest_size=16).hexdigest()
+
+
+def _build_transform(icc_profile: bytes, mode: str) -> Optional[ImageCms.ImageCmsTransform]:
+    """Transform from an embedded profile to sRGB, or None when the profile already is sRGB."""
+    
+    profile = ImageCms.ImageCmsProfile(io.BytesIO(icc_profile))
+    if mode in ("RGB", "RGBA") and ImageCms.getProfileDescription(profile).strip().lower().startswith("srgb"):
+        return None
+    
+    return ImageCms.buildTransform(
+        profile, _SRGB_PROFILE, mode, "RGBA" if mode == "RGBA" else "RGB",
+        renderingIntent=_RELATIVE_COLORIMETRIC, flags=_NO_CACHE
+    )
+
+
+class IccTransformCache:
+    """Bounded LRU of ICC-to-sRGB transforms keyed by profile digest and image mode."""
+    
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._transforms: "OrderedDict[Tuple[str, str], Optional[ImageCms.ImageCmsTransform]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._transforms)
+    
+    def transform_for(self, icc_profile: bytes, mode: str) -> Optional[ImageCms.ImageCmsTransform]:
+        """Return the transform for a profile, building it on a miss.
+        
+        None means the profile is sRGB and no conversion is needed; that
+        answer is cached too. Errors from building propagate uncached.
+        """
+        
+        key = (profile_digest(icc_profile), mode)
+        with self._lock:
+            if key in self._transforms:
+                self.hits += 1
+                self._transforms.move_to_end(key)
+                return self._transforms[key]
+            self.misses += 1
+        
+        transform = _build_transform(icc_profile, mode)
+        with self._lock:
+            self._transforms[key] = transform
+            while len(self._transforms) > self.max_entries:
+                self._transforms.popitem(last=False)
+        return transform
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._transforms.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._transforms),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
+
+
+_icc_transform_cache: Optional[IccTransformCache] = None
+
+
+def get_icc_transform_cache() -> IccTransformCache:
+    """Process-wide transform cache sized by settings.icc_transform_cache_size."""
+    
+    global _icc_transform_cache
+    
+    if _icc_transform_cache is None or _icc_transform_cache.max_entries != settings.icc_transform_cache_size:
+        _icc_transform_cache = IccTransformCache(settings.icc_transform_cache_size)
+    return _icc_transform_cache
+
+
+def apply_exif_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Rotate or flip a decoded image so that it is upright for the given EXIF orientation."""
+    
+    operation = _ORIENTATION_OPS.get(orientation)
+    return operation(image) if operation else image
+
+
+def _decode_opencv(buffer: np.ndarray) -> Optional[np.ndarray]:
+    """Decode to 8-bit BGR(A) exactly as stored, without orientation or color management."""
+    
+    image = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+    
+    if image.dtype == np.uint8:
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        if image.shape[2] in (3, 4):
+            return image
+    
+    if image.dtype == np.uint16 and image.ndim == 3 and image.shape[2] in (3, 4):
+        return (image >> 8).astype(np.uint8)
+    
+    # Float or unusual channel layouts: let OpenCV normalize to 8-bit BGR
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+
+
+def _decode_color_managed(image: Image.Image, icc_profile: bytes) -> Optional[np.ndarray]:
+    """Convert a lazily opened image to sRGB BGR(A) through its embedded profile.
+    
+    Returns None when no conversion is needed or possible, in which case
+    the caller decodes the stored values as they are.
+    """
+    
+    try:
+        if image.mode == "P":
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        if image.mode not in _MANAGED_MODES:
+            return None
+        
+        transform = get_icc_transform_cache().transform_for(icc_profile, image.mode)
+        if transform is None:
+            return None
+        
+        converted = np.asarray(ImageCms.applyTransform(image, transform))
+        code = cv2.COLOR_RGBA2BGRA if converted.shape[2] == 4 else cv2.COLOR_RGB2BGR
+        return cv2.cvtColor(converted, code)
+    except Exception as e:
+        logger.warning(f"ICC conversion failed, using stored color values: {e}")
+        return None
+
+
+def decode_image(data: bytes) -> Optional[np.ndarray]:
+    """Decode encoded image bytes to upright 8-bit sRGB BGR, or BGRA when the image has alpha.
+    
+    The alpha channel is kept so the checkers can mask out transparent
+    pixels. Returns None when the data is not a decodable raster image.
+    """
+    
+    # Only the header is read here; pixels are decoded once, below
+    icc_profile, orientation, opened = None, 1, None
+    try:
+        opened = Image.open(io.BytesIO(data))
+        icc_profile = opened.info.get("icc_profile")
+        orientation = opened.getexif().get(_EXIF_ORIENTATION, 1)
+    except Exception:
+        pass
+    
+    image = _decode_color_managed(opened, icc_profile) if icc_profile else None
+    if image is None:
+        image = _decode_opencv(np.frombuffer(data, dtype=np.uint8))
+    
+    if image is None:
+        return None
+    return apply_exif_orientation(image, orientation)
@@ -0,0 +1,199 @@
+"""
+Compiled brand palette with a precomputed RGB lookup table.
+
+Every quantized RGB cell maps to the nearest approved palette color and a
+flag telling whether the cell center lies within tolerance of it, so a
+whole image is classified with a single fancy-indexing pass.
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from ..core.config import settings
+
+
+# High bit of a LUT cell flags "within tolerance"; the low bits hold the entry index
+IN_TOLERANCE_FLAG = 0x80
+MAX_PALETTE_ENTRIES = IN_TOLERANCE_FLAG - 1
+
+
+@dataclass(frozen=True)
+class PaletteEntry:
+    """A named palette color."""
+    name: str
+    rgb: Tuple[int, int, int]
+    group: str  # "approved" or "heritage"
+
+
+class CompiledPalette:
+    """Brand palette compiled into a quantized 3D lookup table."""
+    
+    def __init__(self, entries: List[PaletteEntry], tolerance: float, bits: int = 7,
+                 lut: Optional[np.ndarray] = None):
+        if not entries:
+            raise ValueError("Palette must contain at least one color")
+        if len(entries) > MAX_PALETTE_ENTRIES:
+            raise ValueError(f"Palette cannot exceed {MAX_PALETTE_ENTRIES} colors")
+        if not 1 <= bits <= 8:
+            raise ValueError("Palette LUT bits must be between 1 and 8")
+        
+        self.entries = list(entries)
+        self.tolerance = tolerance
+        self.bits = bits
+        self.lut = lut if lut is not None else self._build_lut()
+    
+    @property
+    def names(self) -> List[str]:
+        return [entry.name for entry in self.entries]
+    
+    @property
+    def digest(self) -> str:
+        return palette_digest(self.entries, self.tolerance, self.bits)
+    
+    def _build_lut(self) -> np.ndarray:
+        """Find the nearest entry for the center of every quantized cell."""
+        
+        size = 1 << self.bits
+        shift = 8 - self.bits
+        centers = (np.arange(size, dtype=np.float32) * (1 << shift)) + ((1 << shift) - 1) / 2.0
+        
+        best_distance = np.full((size, size, size), np.inf, dtype=np.float32)
+        best_index = np.zeros((size, size, size), dtype=np.uint8)
+        
+        for index, entry in enumerate(self.entries):
+            dr, dg, db = ((centers - np.float32(c)) ** 2 for c in entry.rgb)
+            distance = dr[:, None, None] + dg[None, :, None] + db[None, None, :]
+            closer = distance < best_distance
+            best_distance[closer] = distance[closer]
+            best_index[closer] = index
+        
+        lut = best_index
+        lut[best_distance <= np.float32(self.tolerance * self.tolerance)] |= IN_TOLERANCE_FLAG
+        return lut.reshape(-1)
+    
+    def lookup(self, image: np.ndarray) -> np.ndarray:
+        """Return the raw LUT cell (entry index | tolerance flag) for every pixel."""
+        
+        shift = 8 - self.bits
+        key = (image[..., 0] >> shift).astype(np.int32)
+        key <<= self.bits
+        key |= image[..., 1] >> shift
+        key <<= self.bits
+        key |= image[..., 2] >> shift
+        return self.lut[key]
+    
+    def classify(self, image: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the nearest entry index and the in-tolerance mask per pixel."""
+        
+        cells = self.lookup(image)
+        return cells & MAX_PALETTE_ENTRIES, (cells & IN_TOLERANCE_FLAG) != 0
+    
+    def cell_counts(self, image: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Histogram of the 256 possible LUT cell values over the image (or its masked pixels)."""
+        
+        cells = self.lookup(image)
+        if mask is not None:
+            cells = cells[mask]
+        return np.bincount(cells.reshape(-1), minlength=256)
+    
+    def coverage(self, image: np.ndarray, mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Share of pixels (within mask, if given) within tolerance of each palette color.
+        
+        The remaining share is reported under "off_palette".
+        """
+        
+        return self.coverage_from_counts(self.cell_counts(image, mask))
+    
+    def coverage_from_counts(self, counts: np.ndarray) -> Dict[str, float]:
+        """Coverage computed from (possibly accumulated) cell_counts output."""
+        
+        total = max(1, int(counts.sum()))
+        in_tolerance = counts[IN_TOLERANCE_FLAG:IN_TOLERANCE_FLAG + len(self.entries)]
+        
+        result = {name: float(count) / total for name, count in zip(self.names, in_tolerance)}
+        result["off_palette"] = float(counts[:IN_TOLERANCE_FLAG].sum()) / total
+        return result
+    
+    def save(self, path: str) -> None:
+        """Write the LUT to an .npy file atomically."""
+        
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.lut)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str, entries: List[PaletteEntry], tolerance: float, bits: int) -> "CompiledPalette":
+        """Load a previously saved LUT for the given palette definition."""
+        
+        lut = np.load(path)
+        if lut.dtype != np.uint8 or lut.shape != ((1 << bits) ** 3,):
+            raise ValueError(f"Cached palette LUT {path} does not match {bits}-bit layout")
+        return cls(entries, tolerance, bits, lut=lut)
+
+
+def palette_entries_from_settings() -> List[PaletteEntry]:
+    """Golden arches color first, then approved and heritage palette colors."""
+    
+    entries = [PaletteEntry("golden_arches", tuple(settings.golden_arches_rgb), "approved")]
+    entries += [PaletteEntry(name, tuple(rgb), "approved") for name, rgb in settings.approved_palette.items()]
+    entries += [PaletteEntry(name, tuple(rgb), "heritage") for name, rgb in settings.heritage_palette.items()]
+    return entries
+
+
+def palette_digest(entries: List[PaletteEntry], tolerance: float, bits: int) -> str:
+    """Stable hash of everything that affects the LUT contents."""
+    
+    payload = json.dumps({
+        "entries": [[entry.name, list(entry.rgb), entry.group] for entry in entries],
+        "tolerance": tolerance,
+        "bits": bits
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_compiled_palette: Optional[CompiledPalette] = None
+
+
+def get_compiled_palette() -> CompiledPalette:
+    """Return the palette for the current settings, compiling it only when they change.
+    
+    Compiled LUTs are cached on disk under settings.cache_dir, keyed by the
+    palette digest, so restarts with unchanged settings skip the build.
+    """
+    
+    global _compiled_palette
+    
+    entries = palette_entries_from_settings()
+    tolerance = settings.color_tolerance
+    bits = settings.palette_lut_bits
+    digest = palette_digest(entries, tolerance, bits)
+    
+    if _compiled_palette is not None and _compiled_palette.digest == digest:
+        return _compiled_palette
+    
+    cache_path = os.path.join(settings.cache_dir, f"palette_lut_{digest[:16]}.npy")
+    
+    palette = None
+    if os.path.exists(cache_path):
+        try:
+            palette = CompiledPalette.load(cache_path, entries, tolerance, bits)
+            logger.info(f"Loaded palette LUT from {cache_path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable palette LUT {cache_path}: {e}")
+    
+    if palette is None:
+        palette = CompiledPalette(entries, tolerance, bits)
+        try:
+            os.makedirs(settings.cache_dir, exist_ok=True)
+            palette.save(cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache palette LUT: {e}")
+    
+    _compiled_palette = palette
+    return palette
@@ -0,0 +1,176 @@
+"""
+Perceptual color distance (CIELAB / CIEDE2000).
+
+sRGB values are linearized through a 256-entry table and converted to Lab
+with float32 matrix math; Delta E 2000 is evaluated fully vectorized on a
+regular pixel subsample of the image.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def _build_linearization_table() -> np.ndarray:
+    levels = np.arange(256, dtype=np.float64) / 255.0
+    linear = np.where(levels <= 0.04045, levels / 12.92, ((levels + 0.055) / 1.055) ** 2.4)
+    return linear.astype(np.float32)
+
+
+# sRGB 8-bit value -> linear light, built once at import
+SRGB_TO_LINEAR = _build_linearization_table()
+
+# Linear sRGB -> XYZ (D65), with rows pre-divided by the D65 white point
+_RGB_TO_XYZ_NORMALIZED = (
+    np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]) / np.array([[0.95047], [1.0], [1.08883]])
+).astype(np.float32)
+
+_EPSILON = np.float32(216 / 24389)
+_KAPPA = np.float32(24389 / 27)
+
+
+def srgb_to_lab(pixels: np.ndarray) -> np.ndarray:
+    """Convert uint8 sRGB values of shape (..., 3) to float32 Lab."""
+    
+    linear = SRGB_TO_LINEAR[pixels[..., :3]]
+    xyz = linear @ _RGB_TO_XYZ_NORMALIZED.T
+    
+    f = np.where(xyz > _EPSILON, np.cbrt(xyz), (_KAPPA * xyz + 16) / 116).astype(np.float32)
+    
+    lab = np.empty_like(f)
+    lab[..., 0] = 116 * f[..., 1] - 16
+    lab[..., 1] = 500 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def delta_e_2000(lab: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """CIEDE2000 color difference between Lab values (..., 3) and a reference.
+    
+    The reference may be a single Lab color or broadcastable against lab.
+    """
+    
+    lab = np.asarray(lab, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    
+    L1, a1, b1 = lab[..., 0], lab[..., 1], lab[..., 2]
+    L2, a2, b2 = reference[..., 0], reference[..., 1], reference[..., 2]
+    
+    c_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    c_bar7 = c_bar ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + np.float32(25.0 ** 7))))
+    
+    a1p = a1 * (1 + g)
+    a2p = a2 * (1 + g)
+    c1p = np.hypot(a1p, b1)
+    c2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+    
+    delta_l = L2 - L1
+    delta_c = c2p - c1p
+    
+    chroma_product = c1p * c2p
+    dh = h2p - h1p
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(chroma_product == 0, 0, dh)
+    delta_h = 2 * np.sqrt(chroma_product) * np.sin(np.radians(dh) / 2)
+    
+    l_bar = (L1 + L2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(
+        chroma_product == 0,
+        h_sum,
+        np.where(np.abs(h1p - h2p) <= 180, h_sum / 2,
+                 np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    )
+    
+    t = (1
+         - 0.17 * np.cos(np.radians(h_bar - 30))
+         + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6))
+         - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    
+    l_bar_sq = (l_bar - 50) ** 2
+    s_l = 1 + 0.015 * l_bar_sq / np.sqrt(20 + l_bar_sq)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    
+    c_bar_p7 = c_bar_p ** 7
+    r_c = 2 * np.sqrt(c_bar_p7 / (c_bar_p7 + np.float32(25.0 ** 7)))
+    delta_theta = 30 * np.exp(-(((h_bar - 275) / 25) ** 2))
+    r_t = -np.sin(np.radians(2 * delta_theta)) * r_c
+    
+    term_l = delta_l / s_l
+    term_c = delta_c / s_c
+    term_h = delta_h / s_h
+    
+    return np.sqrt(term_l ** 2 + term_c ** 2 + term_h ** 2 + r_t * term_c * term_h).astype(np.float32)
+
+
+class PerceptualDistanceMap:
+    """Delta E 2000 to the target color on a regular grid subsample.
+    
+    Exposes the same interface as ColorDistanceMap; `scale` is the grid
+    step, so one sample stands for scale x scale source pixels. Passing an
+    explicit scale keeps the grid aligned across tiles of a larger image.
+    A full-resolution valid_mask is subsampled on the same grid.
+    """
+    
+    def __init__(self, image: np.ndarray, target_rgb: Tuple[int, int, int], tolerance: float,
+                 max_samples: int = 262144, scale: Optional[int] = None,
+                 valid_mask: Optional[np.ndarray] = None):
+        height, width = image.shape[:2]
+        self.scale = scale or max(1, math.ceil(math.sqrt(height * width / max(1, max_samples))))
+        grid = image[::self.scale, ::self.scale]
+        
+        target_lab = srgb_to_lab(np.array(target_rgb, dtype=np.uint8))
+        self.delta_e = delta_e_2000(srgb_to_lab(grid), target_lab)
+        self.tolerance = tolerance
+        self.shape = self.delta_e.shape
+        self.valid_mask = None if valid_mask is None else valid_mask[::self.scale, ::self.scale]
+        self._compliant_mask: Optional[np.ndarray] = None
+        self._distances: Optional[np.ndarray] = None
+        self._total_pixels: Optional[int] = None
+    
+    @property
+    def total_pixels(self) -> int:
+        """Samples taking part in the metrics (all, or those in valid_mask)."""
+        if self._total_pixels is None:
+            if self.valid_mask is None:
+                self._total_pixels = self.shape[0] * self.shape[1]
+            else:
+                self._total_pixels = int(np.count_nonzero(self.valid_mask))
+        return self._total_pixels
+    
+    @property
+    def compliant_mask(self) -> np.ndarray:
+        """Boolean mask of valid samples within the Delta E tolerance."""
+        if self._compliant_mask is None:
+            self._compliant_mask = self.delta_e <= self.tolerance
+            if self.valid_mask is not None:
+                self._compliant_mask &= self.valid_mask
+        return self._compliant_mask
+    
+    @property
+    def non_compliant_mask(self) -> np.ndarray:
+        """Boolean mask of valid samples outside the Delta E tolerance."""
+        non_compliant = ~self.compliant_mask
+        if self.valid_mask is not None:
+            non_compliant &= self.valid_mask
+        return non_compliant
+    
+    @property
+    def distances(self) -> np.ndarray:
+        """Delta E scaled to 0-255 (Delta E 100 -> 255) as uint8."""
+        if self._distances is None:
+            self._distances = np.clip(self.delta_e * np.float32(2.55), 0, 255).astype(np.uint8)
+        return self._distances
+    
+    def compliant_count(self) -> int:
+        return int(np.count_nonzero(self.compliant_mask))
@@ -0,0 +1,49 @@
+"""
+Coarse-to-fine resolution pyramid for early-exit rule checks.
+
+A check runs on the coarsest pyramid level first and only moves to a finer
+level when one of its decision metrics lands within a margin of the
+threshold it is compared against. Clear-cut assets are decided on a small
+downsampled image; borderline ones still get a full-resolution answer.
+"""
+from typing import Callable, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+
+def build_pyramid(image: np.ndarray, max_levels: int, min_size: int) -> List[np.ndarray]:
+    """Full-resolution image followed by up to max_levels halved levels.
+    
+    Halving stops before the shorter side of a level drops below min_size.
+    Level 0 is the input array itself (no copy).
+    """
+    
+    levels = [image]
+    while len(levels) <= max_levels:
+        height, width = levels[-1].shape[:2]
+        if min(height, width) // 2 < min_size:
+            break
+        levels.append(cv2.resize(levels[-1], (width // 2, height // 2), interpolation=cv2.INTER_AREA))
+    return levels
+
+
+def near_threshold(value: float, threshold: float, margin: float) -> bool:
+    """True when value lies within margin * |threshold| of threshold."""
+    
+    return abs(value - threshold) <= margin * abs(threshold)
+
+
+def run_coarse_to_fine(levels: List[np.ndarray],
+                       analyze: Callable[[np.ndarray, int], Dict],
+                       is_marginal: Callable[[Dict], bool]) -> Tuple[Dict, int]:
+    """Analyze levels coarsest first until a result is not marginal.
+    
+    Returns the deciding result and its level index (0 = full resolution).
+    The full-resolution result is always final.
+    """
+    
+    for level in range(len(levels) - 1, -1, -1):
+        result = analyze(levels[level], level)
+        if level == 0 or not is_marginal(result):
+            return result, level
@@ -0,0 +1,437 @@
+"""
+Rule registry and dependency-ordered rule execution.
+
+Each rule declares the artifacts it consumes (keyword arguments it is
+called with) and the artifacts it produces (keys of the dict it returns).
+Artifacts are intermediate results such as an ImageContext or a geometry
+analysis. The executor links every consumed artifact to the rule producing
+it, runs each rule once when its inputs are ready, and runs rules that do
+not depend on each other concurrently on a thread pool (NumPy and OpenCV
+release the GIL). Artifacts passed in as inputs are not recomputed.
+
+Every rule that runs is recorded with its provenance: its version, the
+values of the settings it reads and the fingerprints of the artifacts it
+consumed, folded into a fingerprint of its own that its artifacts inherit.
+Given the record of an earlier run, the executor reuses the stored output
+of every rule whose fingerprint is unchanged, so a new rule version or
+threshold only recomputes that rule and the rules downstream of it.
+
+Under a deadline the executor runs the most decisive rules per expected
+second first and stops starting rules once the budget is spent, leaving
+the rest pending for a later run.
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from ..core.config import settings
+
+
+RuleFunction = Callable[..., Dict[str, Any]]
+
+
+def _digest(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A rule check or artifact step, with the artifacts it consumes and produces."""
+    name: str
+    function: RuleFunction
+    consumes: Tuple[str, ...] = ()
+    produces: Tuple[str, ...] = ()
+    version: str = "1"  # Bump when the rule's results change for the same inputs
+    parameters: Tuple[str, ...] = ()  # Settings fields the rule reads
+    weight: float = 1.0  # How much the rule's outcome decides a report; weightier rules run first
+
+
+@dataclass
+class RuleExecution:
+    """Outcome of running a set of rules."""
+    artifacts: Dict[str, Any]
+    outputs: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # Return value of each rule that ran
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)  # Rules whose inputs failed
+    fingerprints: Dict[str, Optional[str]] = field(default_factory=dict)  # Of every artifact; None if unknown
+    provenance: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # Of each rule with an output
+    reused: List[str] = field(default_factory=list)  # Rules whose stored output was reused
+    pending: List[str] = field(default_factory=list)  # Rules not started before the deadline
+    
+    @property
+    def evaluations_avoided(self) -> int:
+        return len(self.reused)
+    
+    def record(self) -> Dict[str, Any]:
+        """Outputs and provenance to store for a later run's previous."""
+        
+        return {"outputs": self.outputs, "provenance": self.provenance}
+    
+    def extend(self, other: "RuleExecution") -> "RuleExecution":
+        """Add the results of a later run (over this run's artifacts)."""
+        
+        self.artifacts.update(other.artifacts)
+        self.outputs.update(other.outputs)
+        self.timings_ms.update(other.timings_ms)
+        self.errors.update(other.errors)
+        self.skipped.extend(other.skipped)
+        self.fingerprints.update(other.fingerprints)
+        self.provenance.update(other.provenance)
+        self.reused.extend(other.reused)
+        self.pending.extend(other.pending)
+        return self
+
+
+class RuleRegistry:
+    """Rules in registration order, with at most one producer per artifact."""
+    
+    def __init__(self):
+        self._rules: Dict[str, Rule] = {}
+        self._producers: Dict[str, str] = {}
+    
+    def __len__(self) -> int:
+        return len(self._rules)
+    
+    def __iter__(self) -> Iterator[Rule]:
+        return iter(self._rules.values())
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._rules
+    
+    def get(self, name: str) -> Rule:
+        return self._rules[name]
+    
+    @property
+    def version(self) -> str:
+        """Digest of every rule's name, version and artifacts; changes when any rule does."""
+        
+        payload = ";".join(
+            f"{rule.name}:{rule.version}:{','.join(rule.consumes)}:{','.join(rule.produces)}" for rule in self
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+    
+    def producer(self, artifact: str) -> Optional[Rule]:
+        """The rule producing an artifact, if any."""
+        
+        name = self._producers.get(artifact)
+        return None if name is None else self._rules[name]
+    
+    def add(self, rule: Rule) -> Rule:
+        if rule.name in self._rules:
+            raise ValueError(f"Rule '{rule.name}' is already registered")
+        for artifact in rule.produces:
+            if artifact in self._producers:
+                raise ValueError(f"Artifact '{artifact}' is already produced by '{self._producers[artifact]}'")
+        
+        self._rules[rule.name] = rule
+        for artifact in rule.produces:
+            self._producers[artifact] = rule.name
+        return rule
+    
+    def rule(self, name: str, consumes: Iterable[str] = (), produces: Iterable[str] = (), version: str = "1",
+             parameters: Iterable[str] = (), weight: float = 1.0):
+        """Decorator registering a function as a rule."""
+        
+        def decorator(function: RuleFunction) -> RuleFunction:
+            self.add(Rule(name, function, tuple(consumes), tuple(produces), version, tuple(parameters), weight))
+            return function
+        
+        return decorator
+
+
+class RuleExecutor:
+    """Runs the rules of a registry in dependency order on a worker pool."""
+    
+    COST_SMOOTHING = 0.3  # Weight of the latest run time in each rule's cost estimate
+    
+    def __init__(self, registry: RuleRegistry, max_workers: Optional[int] = None):
+        self.registry = registry
+        self.max_workers = settings.rule_executor_workers if max_workers is None else max_workers
+        self.cost_estimates: Dict[str, float] = {}  # Smoothed run time of each rule, in seconds
+        # Concurrent runs (e.g. one per request) share the estimates
+        self._cost_lock = threading.Lock()
+    
+    def plan(self, available: Iterable[str], targets: Optional[Iterable[str]] = None) -> List[Rule]:
+        """Rules needed to run targets, in dependency order.
+        
+        The default targets are every rule except those whose artifacts are
+        all available; producers of available artifacts only run when they
+        are targets themselves. Raises ValueError for an artifact nobody
+        produces or a dependency cycle.
+        """
+        
+        available = set(available)
+        if targets is None:
+            names = [rule.name for rule in self.registry if not rule.produces or not available.issuperset(rule.produces)]
+        else:
+            names = list(targets)
+        
+        # Targets and, transitively, the producers of what they consume
+        needed: Dict[str, Rule] = {}
+        stack = list(reversed(names))
+        while stack:
+            rule = self.registry.get(stack.pop())
+            if rule.name in needed:
+                continue
+            needed[rule.name] = rule
+            for artifact in rule.consumes:
+                if artifact in available:
+                    continue
+                producer = self.registry.producer(artifact)
+                if producer is None:
+                    raise ValueError(f"No rule produces artifact '{artifact}' needed by '{rule.name}'")
+                stack.append(producer.name)
+        
+        # Kahn's algorithm, keeping registration order among rules that are ready together
+        dependencies = self._dependencies(needed.values(), available)
+        order = [rule for rule in self.registry if rule.name in needed]
+        planned: List[Rule] = []
+        done: Set[str] = set()
+        while len(planned) < len(order):
+            ready = [rule for rule in order if rule.name not in done and dependencies[rule.name] <= done]
+            if not ready:
+                cycle = sorted(name for name in needed if name not in done)
+                raise ValueError(f"Rule dependencies form a cycle among: {', '.join(cycle)}")
+            planned.extend(ready)
+            done.update(rule.name for rule in ready)
+        return planned
+    
+    def plan_reanalysis(self, inputs: Dict[str, Any], fingerprints: Dict[str, Optional[str]],
+                        previous: Optional[Dict[str, Any]], targets: Optional[Iterable[str]] = None) -> Dict[str, List[str]]:
+        """Planned rules split into those whose stored output is reused and those recomputed."""
+        
+        rules = self.plan(inputs, targets)
+        provenance, _ = self.provenance(rules, fingerprints)
+        reuse = self._reusable(rules, provenance, previous)
+        return {
+            "reuse": [rule.name for rule in rules if rule.name in reuse],
+            "recompute": [rule.name for rule in rules if rule.name not in reuse]
+        }
+    
+    def provenance(self, rules: Iterable[Rule], fingerprints: Dict[str, Optional[str]]
+                   ) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Optional[str]]]:
+        """Provenance of each of the rules (in dependency order) and the fingerprints of every artifact.
+        
+        A rule's fingerprint digests its name, version, parameter values and
+        the fingerprints of the artifacts it consumes; the artifacts it
+        produces are fingerprinted from it. It is None when an input has no
+        fingerprint, and such a rule is never reused.
+        """
+        
+        fingerprints = dict(fingerprints)
+        provenance: Dict[str, Dict[str, Any]] = {}
+        for rule in rules:
+            parameters = {name: getattr(settings, name) for name in rule.parameters}
+            consumed = {artifact: fingerprints.get(artifact) for artifact in rule.consumes}
+            fingerprint = None
+            if None not in consumed.values():
+                fingerprint = _digest(rule.name, rule.version, parameters, consumed)
+            provenance[rule.name] = {
+                "version": rule.version,
+                "parameters": parameters,
+                "inputs": consumed,
+                "fingerprint": fingerprint
+            }
+            for artifact in rule.produces:
+                fingerprints.setdefault(artifact, None if fingerprint is None else _digest(fingerprint, artifact))
+        return provenance, fingerprints
+    
+    def run(self, inputs: Dict[str, Any], targets: Optional[Iterable[str]] = None,
+            fingerprints: Optional[Dict[str, Optional[str]]] = None,
+            previous: Optional[Dict[str, Any]] = None, deadline: Optional[float] = None) -> RuleExecution:
+        """Run the planned rules on the input artifacts.
+        
+        A rule that raises is logged and recorded in errors; rules that
+        consume its artifacts are skipped. Each rule's wall time is
+        recorded in timings_ms.
+        
+        fingerprints identify the input artifacts' contents. previous is the
+        record() of an earlier run on the same content: rules whose
+        fingerprint matches the one recorded there are not run, their
+        stored outputs are used instead and they are listed in reused.
+        
+        Ready rules are started weightiest per expected second first. With a
+        deadline (a time.perf_counter() value), a rule is only started when
+        its smoothed past run time (the mean of the known ones for a rule
+        that has not run yet) fits before it; rules never started, and
+        those waiting for them, are listed in pending. Reused and skipped
+        rules are settled regardless of the deadline. Rules already running
+        at the deadline are waited for.
+        """
+        
+        rules = self.plan(inputs, targets)
+        provenance, artifact_fingerprints = self.provenance(rules, fingerprints or {})
+        reuse = self._reusable(rules, provenance, previous)
+        execution = RuleExecution(artifacts=dict(inputs), fingerprints=artifact_fingerprints)
+        dependencies = self._dependencies(rules, inputs)
+        failed: Set[str] = set()
+        
+        def settle(rule: Rule, result: Dict[str, Any]) -> None:
+            execution.outputs[rule.name] = result
+            execution.provenance[rule.name] = provenance[rule.name]
+            for artifact in rule.produces:
+                execution.artifacts.setdefault(artifact, result[artifact])
+        
+        def settle_without_running(rule: Rule) -> bool:
+            """Settle a rule that needs no run (skipped or reused); False when it has to run."""
+            
+            if dependencies[rule.name] & failed:
+                failed.add(rule.name)
+                execution.skipped.append(rule.name)
+                return True
+            if rule.name in reuse:
+                settle(rule, previous["outputs"][rule.name])
+                execution.reused.append(rule.name)
+                return True
+            return False
+        
+        def finish(rule: Rule, result: Optional[Dict[str, Any]], elapsed: float, error: Optional[str]) -> None:
+            execution.timings_ms[rule.name] = elapsed * 1000
+            with self._cost_lock:
+                estimate = self.cost_estimates.get(rule.name, elapsed)
+                self.cost_estimates[rule.name] = estimate + self.COST_SMOOTHING * (elapsed - estimate)
+            if error is not None:
+                failed.add(rule.name)
+                execution.errors[rule.name] = error
+                return
+            settle(rule, result)
+        
+        # A rule is ready once every rule it waits for has finished (or been skipped)
+        dependents: Dict[str, List[Rule]] = {rule.name: [] for rule in rules}
+        for rule in rules:
+            for name in dependencies[rule.name]:
+                dependents[name].append(rule)
+        remaining = {rule.name: len(dependencies[rule.name]) for rule in rules}
+        priorities = self._priorities(rules, dependents)
+        workers = min(self.max_workers, len(rules))
+        default_cost = self._expected_costs()[1]
+        
+        def fits(rule: Rule) -> bool:
+            """Whether a rule is expected to finish before the deadline."""
+            
+            expected = self.cost_estimates.get(rule.name, default_cost)
+            return deadline is None or time.perf_counter() + expected <= deadline
+        
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rule") if workers > 1 else None
+        try:
+            running: Dict[Future, Rule] = {}
+            ready = [rule for rule in rules if not remaining[rule.name]]
+            while ready or running:
+                ready.sort(key=lambda rule: -priorities[rule.name])
+                finished: List[Rule] = []
+                while ready and len(running) < max(workers, 1):
+                    rule = ready.pop(0)
+                    # Skipped and reused rules cost nothing, so the deadline never holds them back
+                    if settle_without_running(rule):
+                        finished.append(rule)
+                        continue
+                    if not fits(rule):
+                        continue  # Left pending, with the rules waiting for it
+                    kwargs = {name: execution.artifacts[name] for name in rule.consumes}
+                    if pool is None:
+                        finish(rule, *self._run_rule(rule, kwargs))
+                        finished.append(rule)
+                        break  # Reprioritize with the rules it made ready
+                    else:
+                        running[pool.submit(self._run_rule, rule, kwargs)] = rule
+                
+                if not finished and running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rule = running.pop(future)
+                        finish(rule, *future.result())
+                        finished.append(rule)
+                
+                for rule in finished:
+                    for dependent in dependents[rule.name]:
+                        remaining[dependent.name] -= 1
+                        if not remaining[dependent.name]:
+                            ready.append(dependent)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        
+        settled = set(execution.outputs) | set(execution.errors) | set(execution.skipped)
+        execution.pending = [rule.name for rule in rules if rule.name not in settled]
+        return execution
+    
+    def _priorities(self, rules: List[Rule], dependents: Dict[str, List[Rule]]) -> Dict[str, float]:
+        """Scheduling priority of each rule: the weight it settles per expected second.
+        
+        A rule's weight includes the largest weight among the rules waiting
+        for it, so artifact steps are scheduled for the checks they unblock.
+        Rules that have not run yet are expected to take the average time.
+        """
+        
+        weights: Dict[str, float] = {}
+        for rule in reversed(rules):
+            unblocked = max((weights[dependent.name] for dependent in dependents[rule.name]), default=0.0)
+            weights[rule.name] = rule.weight + unblocked
+        
+        estimates, default_cost = self._expected_costs()
+        return {
+            name: weight / max(estimates.get(name, default_cost), 1e-6)
+            for name, weight in weights.items()
+        }
+    
+    def _expected_costs(self) -> Tuple[Dict[str, float], float]:
+        """Snapshot of the cost estimates, and the cost expected of a rule that has not run yet (their mean)."""
+        
+        with self._cost_lock:
+            estimates = dict(self.cost_estimates)
+        return estimates, sum(estimates.values()) / len(estimates) if estimates else 1e-3
+    
+    @staticmethod
+    def _reusable(rules: Iterable[Rule], provenance: Dict[str, Dict[str, Any]],
+                  previous: Optional[Dict[str, Any]]) -> Set[str]:
+        """Rules whose stored output in previous was computed with the same fingerprint."""
+        
+        if not previous:
+            return set()
+        outputs = previous.get("outputs", {})
+        recorded = previous.get("provenance", {})
+        return {
+            rule.name for rule in rules
+            if provenance[rule.name]["fingerprint"] is not None and rule.name in outputs
+            and recorded.get(rule.name, {}).get("fingerprint") == provenance[rule.name]["fingerprint"]
+        }
+    
+    def _dependencies(self, rules: Iterable[Rule], available: Iterable[str]) -> Dict[str, Set[str]]:
+        """Names of the rules each rule waits for, among the given ones."""
+        
+        available = set(available)
+        rules = list(rules)
+        names = {rule.name for rule in rules}
+        dependencies: Dict[str, Set[str]] = {}
+        for rule in rules:
+            producers = set()
+            for artifact in rule.consumes:
+                producer = None if artifact in available else self.registry.producer(artifact)
+                if producer is not None and producer.name in names:
+                    producers.add(producer.name)
+            dependencies[rule.name] = producers
+        return dependencies
+    
+    def _run_rule(self, rule: Rule, kwargs: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], float, Optional[str]]:
+        """Call a rule and return (result, elapsed seconds, error message)."""
+        
+        start = time.perf_counter()
+        try:
+            result = rule.function(**kwargs)
+            if not isinstance(result, dict):
+                raise TypeError(f"Rule returned {type(result).__name__}, expected a dict")
+            missing = [artifact for artifact in rule.produces if artifact not in result]
+            if missing:
+                raise ValueError(f"Rule did not produce {', '.join(missing)}")
+            return result, time.perf_counter() - start, None
+        except Exception as e:
+            logger.error(f"Rule '{rule.name}' failed: {e}")
+            return None, time.perf_counter() - start, str(e)
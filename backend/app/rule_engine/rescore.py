@@ -0,0 +1,87 @@
+"""
+Bulk re-scoring of the catalog from stored color statistics.
+
+    python -m app.rule_engine.rescore [--tolerance 12] [--golden-rgb 255,188,13] [--json]
+
+Recomputes golden-match, compliant ratio and accuracy for every asset with
+stored color statistics under new thresholds, without downloading or
+decoding any asset. Defaults come from the application settings.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+from .brand_rules.color_compliance import ColorComplianceChecker
+from .color_statistics import ColorStatisticsStore
+
+
+def rescore_catalog(checker: ColorComplianceChecker,
+                    store: ColorStatisticsStore) -> Iterator[Tuple[str, Dict]]:
+    """Yield (asset_id, re-scored color metrics) for every stored asset.
+    
+    Assets whose statistics cannot be read are logged and skipped.
+    """
+    
+    for asset_id in store.asset_ids():
+        try:
+            statistics = store.load(asset_id)
+        except Exception as e:
+            logger.error(f"Skipping unreadable color statistics for asset {asset_id}: {e}")
+            continue
+        yield asset_id, checker.rescore_color_statistics(statistics)
+
+
+def _parse_rgb(value: str) -> Tuple[int, int, int]:
+    parts = [int(part) for part in value.split(",")]
+    if len(parts) != 3 or not all(0 <= part <= 255 for part in parts):
+        raise argparse.ArgumentTypeError("expected R,G,B with values 0-255")
+    return tuple(parts)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Re-score stored color statistics with new thresholds")
+    parser.add_argument("--tolerance", type=float, help="RGB color tolerance (default: settings)")
+    parser.add_argument("--golden-rgb", type=_parse_rgb, help="Gold reference as R,G,B (default: settings)")
+    parser.add_argument("--store", help="Color statistics directory (default: <cache_dir>/color_stats)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per asset")
+    args = parser.parse_args(argv)
+    
+    checker = ColorComplianceChecker()
+    checker.color_distance_mode = "rgb"
+    if args.tolerance is not None:
+        checker.color_tolerance = args.tolerance
+    if args.golden_rgb is not None:
+        checker.golden_arches_rgb = args.golden_rgb
+    store = ColorStatisticsStore(args.store)
+    
+    start = time.perf_counter()
+    total = matched = 0
+    for asset_id, result in rescore_catalog(checker, store):
+        total += 1
+        matched += result["golden_arches_color_match"]
+        if args.json:
+            print(json.dumps({"asset_id": asset_id, **result}))
+        else:
+            print(
+                f"{asset_id}\tmatch={result['golden_arches_color_match']}\t"
+                f"ratio={result['compliant_pixel_ratio']:.4f}\t"
+                f"accuracy={result['color_accuracy_score']:.4f}"
+                + ("" if result["exact"] else "\t(estimated)")
+            )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    print(
+        f"Re-scored {total} assets in {elapsed_ms:.0f}ms "
+        f"(tolerance={checker.color_tolerance}, golden_rgb={tuple(checker.golden_arches_rgb)}, "
+        f"golden match: {matched}/{total})",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
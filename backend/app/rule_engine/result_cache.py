@@ -0,0 +1,238 @@
+"""
+Content-addressed cache of rule results.
+
+Results are keyed by the SHA-256 of the asset content, the version of the
+rule implementations, a hash of the settings that affect the rules and the
+model version, so any change to one of them is a miss rather than a stale
+hit. Two tiers are kept: a small in-memory LRU in front of a SQLite store
+under settings.cache_dir, whose total size is held to a byte budget by
+evicting the least recently used results. Values are stored as JSON, so
+every lookup returns a fresh copy.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+from loguru import logger
+
+from ..core.config import settings
+
+
+# Settings that change rule results; anything else (server, storage, logging) does not
+RESULT_SETTINGS_FIELDS = (
+    "golden_arches_rgb", "color_tolerance", "min_logo_size", "max_rotation_degrees",
+    "max_logo_instances", "geometry_localization_size", "geometry_localization_padding",
+    "shape_index_path", "shape_match_max_distance", "shape_match_max_hu_distance",
+    "dominant_color_sample_size", "dominant_color_refine_iterations",
+    "approved_palette", "heritage_palette", "palette_lut_bits",
+    "heritage_first", "heritage_min_coverage", "heritage_sample_size",
+    "color_distance_mode", "perceptual_tolerance", "perceptual_sample_size",
+    "color_tile_size", "color_tiling_threshold_pixels",
+    "pyramid_mode", "pyramid_max_levels", "pyramid_min_size", "pyramid_margin",
+    "confidence_threshold"
+)
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 of an asset's encoded content."""
+    
+    return hashlib.sha256(data).hexdigest()
+
+
+def settings_digest(fields: Iterable[str] = RESULT_SETTINGS_FIELDS) -> str:
+    """Hash of the given settings fields' current values."""
+    
+    values = {name: getattr(settings, name) for name in fields}
+    payload = json.dumps(values, sort_keys=True, default=_json_default)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def result_key(content_sha256: str, rule_version: str, settings_hash: Optional[str] = None,
+               model_version: Optional[str] = None) -> str:
+    """Cache key of a result; settings and model version default to the current ones."""
+    
+    parts = (
+        content_sha256, rule_version,
+        settings_digest() if settings_hash is None else settings_hash,
+        settings.model_version if model_version is None else model_version
+    )
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _json_default(value: Any) -> Any:
+    """JSON form of NumPy scalars and arrays, sets and other values json cannot encode."""
+    
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Cannot store {type(value).__name__} in the result cache")
+
+
+class ResultCache:
+    """In-memory LRU in front of a size-bounded SQLite store of JSON results."""
+    
+    def __init__(self, path: Optional[str], memory_entries: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        
+        if path is not None:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results "
+                    "(key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+                )
+                self._connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+                self._disk_bytes = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache store {path} unavailable, keeping results in memory only: {e}")
+                self._connection = None
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Cached result for key, or None."""
+        
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            elif self._connection is not None:
+                try:
+                    row = self._connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        value = bytes(row[0])
+                        self._connection.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                        self._remember(key, value)
+                        self.disk_hits += 1
+                except sqlite3.Error as e:
+                    logger.warning(f"Result cache lookup failed: {e}")
+            if value is None:
+                self.misses += 1
+                return None
+        return json.loads(value)
+    
+    def put(self, key: str, result: Any) -> None:
+        """Store a JSON-serializable result, evicting old results beyond the byte budget."""
+        
+        value = json.dumps(result, default=_json_default).encode()
+        with self._lock:
+            self._remember(key, value)
+            if self._connection is None:
+                return
+            try:
+                previous = self._connection.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), time.time())
+                )
+                self._disk_bytes += len(value) - (previous[0] if previous else 0)
+                self._evict()
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache store failed: {e}")
+    
+    def _remember(self, key: str, value: bytes) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _evict(self) -> None:
+        """Delete least recently used results until the store fits max_bytes."""
+        
+        while self._disk_bytes > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            for key, size in rows:
+                if self._disk_bytes <= self.max_bytes:
+                    break
+                self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self.evictions += 1
+    
+    def __len__(self) -> int:
+        with self._lock:
+            if self._connection is None:
+                return len(self._memory)
+            return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM results")
+            self._disk_bytes = 0
+            self.memory_hits = self.disk_hits = self.misses = self.evictions = 0
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+    
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self),
+            "memory_entries": len(self._memory),
+            "max_memory_entries": self.memory_entries,
+            "disk_bytes": self._disk_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def result_cache_path() -> str:
+    return settings.result_cache_path or os.path.join(settings.cache_dir, "rule_results.sqlite")
+
+
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache, reopened when its settings change."""
+    
+    global _result_cache
+    
+    path = result_cache_path()
+    if (_result_cache is None or _result_cache.path != path
+            or _result_cache.memory_entries != settings.result_cache_memory_entries
+            or _result_cache.max_bytes != settings.result_cache_max_bytes):
+        if _result_cache is not None:
+            _result_cache.close()
+        _result_cache = ResultCache(path, settings.result_cache_memory_entries, settings.result_cache_max_bytes)
+    return _result_cache
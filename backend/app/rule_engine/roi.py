@@ -0,0 +1,96 @@
+"""
+Region-of-interest helpers for restricting rule checks to a detected logo.
+"""
+import math
+import numbers
+from typing import Any, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Pixel box: x, y, width, height
+PixelBox = Tuple[int, int, int, int]
+
+
+def resolve_roi(roi: Any, image_shape: Tuple[int, ...]) -> Optional[PixelBox]:
+    """Resolve a region of interest to a pixel box clipped to the image.
+    
+    Accepts:
+    - a geometry result or an ML logo_detection dict (its "bounding_box" is
+      used; results with an "error" or detected=False have no region);
+    - a BoundingBox-like mapping with normalized x, y, width and height;
+    - an (x, y, width, height) sequence, read as pixels when the values are
+      integers and as normalized coordinates when they are floats in [0, 1].
+    
+    Returns None when there is no usable region, so callers fall back to
+    the full frame.
+    """
+    
+    if roi is None:
+        return None
+    
+    height, width = image_shape[:2]
+    
+    if isinstance(roi, np.ndarray):
+        roi = roi.tolist()
+    
+    if isinstance(roi, Mapping):
+        if "bounding_box" in roi:
+            if roi.get("error") or roi.get("detected") is False:
+                return None
+            return resolve_roi(roi["bounding_box"], image_shape)
+        if not all(key in roi for key in ("x", "y", "width", "height")):
+            return None
+        box = (roi["x"] * width, roi["y"] * height, roi["width"] * width, roi["height"] * height)
+    elif isinstance(roi, Sequence) and len(roi) == 4:
+        normalized = (
+            not all(isinstance(v, numbers.Integral) for v in roi)
+            and all(0.0 <= float(v) <= 1.0 for v in roi)
+        )
+        if normalized:
+            box = (roi[0] * width, roi[1] * height, roi[2] * width, roi[3] * height)
+        else:
+            box = tuple(float(v) for v in roi)
+    else:
+        return None
+    
+    # Round outward so a normalized box never loses edge pixels, then clip
+    x0, y0 = max(0, int(box[0])), max(0, int(box[1]))
+    x1 = min(width, math.ceil(box[0] + box[2]))
+    y1 = min(height, math.ceil(box[1] + box[3]))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def pad_box(box: Sequence[float], padding: float, image_shape: Tuple[int, ...]) -> PixelBox:
+    """Grow an (x, y, width, height) box by padding pixels on every side, clipped to the image."""
+    
+    height, width = image_shape[:2]
+    x0 = max(0, int(math.floor(box[0] - padding)))
+    y0 = max(0, int(math.floor(box[1] - padding)))
+    x1 = min(width, int(math.ceil(box[0] + box[2] + padding)))
+    y1 = min(height, int(math.ceil(box[1] + box[3] + padding)))
+    return x0, y0, max(0, x1 - x0), max(0, y1 - y0)
+
+
+def merge_overlapping_boxes(boxes: Sequence[PixelBox]) -> List[PixelBox]:
+    """Replace every group of overlapping boxes by its bounding box, until none overlap."""
+    
+    merged = [tuple(box) for box in boxes]
+    changed = True
+    while changed:
+        changed = False
+        result: List[PixelBox] = []
+        for box in merged:
+            x0, y0, x1, y1 = box[0], box[1], box[0] + box[2], box[1] + box[3]
+            for index, other in enumerate(result):
+                if x0 < other[0] + other[2] and other[0] < x1 and y0 < other[1] + other[3] and other[1] < y1:
+                    ox1, oy1 = max(x1, other[0] + other[2]), max(y1, other[1] + other[3])
+                    ox0, oy0 = min(x0, other[0]), min(y0, other[1])
+                    result[index] = (ox0, oy0, ox1 - ox0, oy1 - oy0)
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
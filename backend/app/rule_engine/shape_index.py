@@ -0,0 +1,421 @@
+"""
+Reference-shape descriptor index built from the brand asset library.
+
+    python -m app.rule_engine.shape_index [APPROVED ...] --heritage "../Uploads/Heritage Marks" \
+        [--output cache/shape_index.npy]
+
+The builder renders every reference mark (PDF-compatible .ai files, or
+raster images) and stores, for each outline, its group ("approved" for
+current marks, "heritage" for retired ones), its Hu moments and a radial
+contour signature: the largest distance from the centroid in each of
+SIGNATURE_BINS angular bins, normalized by the largest radius. Each
+outline is stored as 2 * SIGNATURE_BINS rows, one per mirroring and
+rotation by a whole bin, so a plain nearest-neighbor lookup answers
+identity, flipping and rotation together. Lookups can be restricted to
+one group.
+
+The index is a single structured .npy file, memory-mapped when loaded.
+Lookups first rank the outlines by Hu moment distance (rotation
+invariant) and then compare signatures against every variant of the
+closest few, vectorized over all candidate contours.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from loguru import logger
+
+from ..core.config import settings
+from .ai_outlines import read_ai_outlines, render_path
+from .image_context import ImageContext
+from .image_io import decode_image
+
+
+SIGNATURE_BINS = 64
+HU_MOMENTS = 7
+
+# Points each contour is resampled to (by arc length) before binning
+RESAMPLE_POINTS = 256
+
+# Fractions of a bin the query signature is also computed at
+QUERY_PHASES = (0.0, 0.5)
+
+# Outlines ranked by Hu distance whose variants are compared by signature
+HU_CANDIDATES = 4
+
+# Outlines this convex (area / hull area) carry little identity and are not indexed
+MAX_SOLIDITY = 0.98
+
+INDEX_DTYPE = np.dtype([
+    ("mark", "S48"),
+    ("group", "S16"),
+    ("shape", "<i4"),
+    ("mirrored", "?"),
+    ("rotation", "<f4"),
+    ("hu", "<f4", (HU_MOMENTS,)),
+    ("signature", "<f2", (SIGNATURE_BINS,)),
+])
+
+_VARIANTS_PER_SHAPE = 2 * SIGNATURE_BINS
+_BIN_DEGREES = 360.0 / SIGNATURE_BINS
+
+_AI_EXTENSIONS = (".ai", ".pdf")
+_RASTER_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp")
+
+
+def _outline_samples(contours: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Log-scaled Hu moments (N, 7), outline points resampled by arc length (N, P, 2) and centroids (N, 2)."""
+    
+    n_contours = len(contours)
+    hu = np.zeros((n_contours, HU_MOMENTS))
+    centroids = np.zeros((n_contours, 2))
+    resampled = np.zeros((n_contours, RESAMPLE_POINTS, 2))
+    
+    for index, contour in enumerate(contours):
+        points = contour.reshape(-1, 2).astype(np.float64)
+        moments = cv2.moments(points.astype(np.float32))
+        hu[index] = cv2.HuMoments(moments).ravel()
+        centroids[index] = (
+            (moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]) if moments["m00"]
+            else points.mean(axis=0)
+        )
+        
+        # Evenly spaced points along the closed outline
+        closed = np.vstack([points, points[:1]])
+        arc = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))))
+        positions = np.linspace(0, arc[-1], RESAMPLE_POINTS, endpoint=False)
+        resampled[index, :, 0] = np.interp(positions, arc, closed[:, 0])
+        resampled[index, :, 1] = np.interp(positions, arc, closed[:, 1])
+    
+    # Hu moments span many orders of magnitude; compare them on a signed log scale
+    magnitudes = np.abs(hu)
+    log_hu = np.zeros_like(hu)
+    nonzero = magnitudes > 0
+    log_hu[nonzero] = -np.sign(hu[nonzero]) * np.log10(magnitudes[nonzero])
+    
+    return log_hu.astype(np.float32), resampled, centroids
+
+
+def shape_descriptors(contours: Sequence[np.ndarray], phase: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """Log-scaled Hu moments (N, 7) and radial signatures (N, SIGNATURE_BINS) of contours.
+    
+    phase shifts the angular bin boundaries by a fraction of a bin.
+    """
+    
+    hu, points, centroids = _outline_samples(contours)
+    return hu, _radial_signatures(points, centroids, phase)
+
+
+def _radial_signatures(points: np.ndarray, centroids: np.ndarray, phase: float) -> np.ndarray:
+    """Largest centroid distance per angular bin of (N, P, 2) outline points, normalized per row."""
+    
+    n_contours = len(points)
+    offsets = points - centroids[:, None, :]
+    angles = np.arctan2(offsets[..., 1], offsets[..., 0])
+    bins = np.floor((angles + np.pi) / (2 * np.pi) * SIGNATURE_BINS - phase).astype(np.int64) % SIGNATURE_BINS
+    radii = np.hypot(offsets[..., 0], offsets[..., 1])
+    
+    signatures = np.zeros((n_contours, SIGNATURE_BINS))
+    rows = np.repeat(np.arange(n_contours), points.shape[1])
+    np.maximum.at(signatures, (rows, bins.ravel()), radii.ravel())
+    
+    # Light circular smoothing: a thin part of the outline crossing a bin boundary
+    # should not make the signature jump
+    signatures = 0.25 * np.roll(signatures, 1, axis=1) + 0.5 * signatures + 0.25 * np.roll(signatures, -1, axis=1)
+    largest = signatures.max(axis=1, keepdims=True)
+    np.divide(signatures, largest, out=signatures, where=largest > 0)
+    return signatures.astype(np.float32)
+
+
+def _variant_rows(mark: str, shape: int, contour: np.ndarray, group: str = "approved") -> np.ndarray:
+    """The 2 * SIGNATURE_BINS index rows of one outline: unmirrored, then mirrored, each rotation."""
+    
+    rows = np.zeros(_VARIANTS_PER_SHAPE, dtype=INDEX_DTYPE)
+    mirrored = contour.reshape(-1, 2) * np.array([-1, 1])
+    hu, signatures = shape_descriptors([contour, mirrored[::-1]])
+    
+    shifts = np.arange(SIGNATURE_BINS)
+    rotations = shifts * _BIN_DEGREES
+    rows["mark"] = mark.encode()[:INDEX_DTYPE["mark"].itemsize]
+    rows["group"] = group.encode()
+    rows["shape"] = shape
+    rows["mirrored"][SIGNATURE_BINS:] = True
+    rows["rotation"] = np.tile(np.where(rotations > 180, rotations - 360, rotations), 2)
+    rows["hu"] = np.repeat(hu, SIGNATURE_BINS, axis=0)
+    
+    # Rotating an outline clockwise (image y axis points down) by k bins shifts its signature by k
+    for variant, signature in enumerate(signatures):
+        shifted = signature[(shifts[None, :] - shifts[:, None]) % SIGNATURE_BINS]
+        rows["signature"][variant * SIGNATURE_BINS:(variant + 1) * SIGNATURE_BINS] = shifted
+    return rows
+
+
+@dataclass
+class ShapeMatches:
+    """Nearest reference variant for each queried contour."""
+    marks: List[str]
+    distances: np.ndarray  # RMS signature difference (normalized radius)
+    hu_distances: np.ndarray  # Euclidean distance of the log-scaled Hu moments
+    mirrored: np.ndarray
+    rotations: np.ndarray  # Degrees clockwise in (-180, 180]
+    groups: List[str]
+    
+    def as_dict(self, index: int) -> dict:
+        return {
+            "mark": self.marks[index],
+            "group": self.groups[index],
+            "distance": float(self.distances[index]),
+            "hu_distance": float(self.hu_distances[index]),
+            "mirrored": bool(self.mirrored[index]),
+            "rotation": float(self.rotations[index])
+        }
+
+
+class ShapeIndex:
+    """Descriptor rows of reference outlines and their mirrored and rotated variants."""
+    
+    def __init__(self, entries: np.ndarray):
+        if entries.dtype != INDEX_DTYPE or len(entries) % _VARIANTS_PER_SHAPE:
+            raise ValueError("Not a shape index with the current descriptor layout")
+        self.entries = entries
+        
+        # One row per (outline, mirroring) block: Hu moments do not change with rotation
+        self._block_hu = np.ascontiguousarray(entries["hu"][::SIGNATURE_BINS], dtype=np.float32)
+        self._block_groups = np.asarray(entries["group"][::SIGNATURE_BINS])
+        self._signatures = entries["signature"]
+        self._digest: Optional[str] = None
+    
+    def __len__(self) -> int:
+        return len(self.entries) // _VARIANTS_PER_SHAPE
+    
+    @property
+    def marks(self) -> List[str]:
+        return [mark.decode() for mark in self.entries["mark"][::_VARIANTS_PER_SHAPE]]
+    
+    @property
+    def groups(self) -> List[str]:
+        return [group.decode() for group in self.entries["group"][::_VARIANTS_PER_SHAPE]]
+    
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.blake2b(memoryview(np.ascontiguousarray(self.entries)).cast("B"),
+                                           digest_size=16).hexdigest()
+        return self._digest
+    
+    def match(self, contours: Sequence[np.ndarray], group: Optional[str] = None) -> ShapeMatches:
+        """Nearest reference variant of every contour, with sub-bin rotation.
+        
+        With a group, only outlines of that group are matched; without any,
+        no contour is matched.
+        """
+        
+        searched = np.arange(len(self._block_hu))
+        if group is not None:
+            searched = np.flatnonzero(self._block_groups == group.encode())
+        
+        n_contours = len(contours)
+        if n_contours == 0 or len(searched) == 0:
+            return ShapeMatches([], np.zeros(0), np.zeros(0), np.zeros(0, dtype=bool), np.zeros(0), [])
+        
+        hu, points, centroids = _outline_samples(contours)
+        
+        # Closest outline blocks by Hu moments, for every contour at once
+        hu_distances = np.linalg.norm(hu[:, None, :] - self._block_hu[searched][None, :, :], axis=2)
+        n_candidates = min(HU_CANDIDATES, len(searched))
+        nearest = np.argpartition(hu_distances, n_candidates - 1, axis=1)[:, :n_candidates]
+        blocks = searched[nearest]
+        
+        # Query signatures at fractional bin offsets, so rotations between two stored
+        # variants still line up with one of them: (contours, phases, bins)
+        signatures = np.stack([_radial_signatures(points, centroids, phase) for phase in QUERY_PHASES], axis=1)
+        
+        # Signature distance to every rotation of those blocks: (contours, phases, candidates, rotations)
+        rows = blocks[..., None] * SIGNATURE_BINS + np.arange(SIGNATURE_BINS)
+        references = np.asarray(self._signatures[rows.ravel()], dtype=np.float32).reshape(rows.shape + (SIGNATURE_BINS,))
+        distances = np.sqrt(np.mean((references[:, None] - signatures[:, :, None, None, :]) ** 2, axis=4))
+        
+        flat_best = distances.reshape(n_contours, -1).argmin(axis=1)
+        phase, candidate, shift = np.unravel_index(flat_best, distances.shape[1:])
+        contour_rows = np.arange(n_contours)
+        best_rows = rows[contour_rows, candidate, shift]
+        
+        # Parabolic interpolation between the neighboring rotations
+        rotation_distances = distances[contour_rows, phase, candidate]
+        below = rotation_distances[contour_rows, (shift - 1) % SIGNATURE_BINS]
+        at = rotation_distances[contour_rows, shift]
+        above = rotation_distances[contour_rows, (shift + 1) % SIGNATURE_BINS]
+        curvature = below - 2 * at + above
+        offset = np.zeros(n_contours)
+        np.divide(below - above, 2 * curvature, out=offset, where=curvature > 0)
+        
+        bins = shift + np.asarray(QUERY_PHASES)[phase] + np.clip(offset, -0.5, 0.5)
+        rotations = (bins * _BIN_DEGREES + 180) % 360 - 180
+        rotations[rotations == -180] = 180
+        
+        return ShapeMatches(
+            marks=[mark.decode() for mark in self.entries["mark"][best_rows]],
+            distances=at,
+            hu_distances=hu_distances[contour_rows, nearest[contour_rows, candidate]],
+            mirrored=np.asarray(self.entries["mirrored"][best_rows], dtype=bool),
+            rotations=rotations,
+            groups=[group.decode() for group in self.entries["group"][best_rows]]
+        )
+    
+    def save(self, path: str) -> None:
+        """Write the index to an .npy file atomically."""
+        
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(self.entries))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> "ShapeIndex":
+        """Memory-map a saved index."""
+        
+        return cls(np.load(path, mmap_mode="r"))
+
+
+def _reference_contours(path: str, size: int) -> Iterator[Tuple[str, np.ndarray]]:
+    """(mark name, outline) pairs of one asset file, outlines in pixels at the given size."""
+    
+    stem = os.path.splitext(os.path.basename(path))[0]
+    extension = os.path.splitext(path)[1].lower()
+    
+    if extension in _AI_EXTENSIONS:
+        outlines, _ = read_ai_outlines(path)
+        for number, outline in enumerate(outlines):
+            contours, _ = cv2.findContours(render_path(outline, size), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+            if contours:
+                yield f"{stem}#{number}", max(contours, key=cv2.contourArea)
+    else:
+        with open(path, "rb") as f:
+            image = decode_image(f.read())
+        if image is None:
+            raise ValueError("Not a decodable image")
+        contours, _ = cv2.findContours(ImageContext(image).otsu_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        for number, contour in enumerate(contours):
+            yield f"{stem}#{number}", contour
+
+
+def _asset_files(paths: Sequence[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                for name in sorted(files):
+                    if name.lower().endswith(_AI_EXTENSIONS + _RASTER_EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def build_shape_index(paths: Sequence[str], size: int = 256, min_size: int = 16,
+                      heritage_paths: Sequence[str] = ()) -> ShapeIndex:
+    """Index the outlines of every asset file under paths and heritage_paths (files or directories).
+    
+    Outlines from paths are approved marks, those from heritage_paths
+    heritage marks. Outlines smaller than min_size pixels (at the rendering
+    size), nearly convex outlines, and duplicates (patterns repeat their
+    motifs) are skipped. Unreadable files are logged and skipped.
+    """
+    
+    blocks: List[np.ndarray] = []
+    seen = set()
+    sources = ([(path, "approved") for path in _asset_files(paths)]
+               + [(path, "heritage") for path in _asset_files(heritage_paths)])
+    for path, group in sources:
+        try:
+            for mark, contour in _reference_contours(path, size):
+                area = cv2.contourArea(contour)
+                x, y, width, height = cv2.boundingRect(contour)
+                if max(width, height) < min_size or len(contour) < 5:
+                    continue
+                hull_area = cv2.contourArea(cv2.convexHull(contour))
+                if hull_area <= 0 or area / hull_area > MAX_SOLIDITY:
+                    continue
+                
+                # Patterns repeat motifs rotated and mirrored; Hu moments up to the sign of
+                # the last one are the same for all of those copies
+                rows = _variant_rows(mark, len(blocks), contour, group)
+                key = np.round(np.abs(rows["hu"][0]), 1).tobytes()
+                if key in seen:
+                    continue
+                seen.add(key)
+                blocks.append(rows)
+        except Exception as e:
+            logger.error(f"Skipping reference asset {path}: {e}")
+    
+    entries = np.concatenate(blocks) if blocks else np.zeros(0, dtype=INDEX_DTYPE)
+    return ShapeIndex(entries)
+
+
+def shape_index_path() -> str:
+    return settings.shape_index_path or os.path.join(settings.cache_dir, "shape_index.npy")
+
+
+_shape_index: Optional[ShapeIndex] = None
+_shape_index_key: Optional[tuple] = None
+
+
+def get_shape_index() -> Optional[ShapeIndex]:
+    """The memory-mapped index at shape_index_path(), or None when it has not been built.
+    
+    The file is mapped once and mapped again only when it is replaced.
+    """
+    
+    global _shape_index, _shape_index_key
+    
+    path = shape_index_path()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key != _shape_index_key:
+        try:
+            _shape_index = ShapeIndex.load(path)
+            logger.info(f"Loaded shape index with {len(_shape_index)} reference outlines from {path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable shape index {path}: {e}")
+            _shape_index = None
+        _shape_index_key = key
+    return _shape_index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build the reference-shape descriptor index")
+    parser.add_argument("paths", nargs="*", help="Approved asset files or directories (.ai, .pdf or raster images)")
+    parser.add_argument("--heritage", action="append", default=[], metavar="PATH",
+                        help="Heritage asset file or directory (repeatable)")
+    parser.add_argument("--output", help="Index file (default: settings.shape_index_path or <cache_dir>/shape_index.npy)")
+    parser.add_argument("--size", type=int, default=256, help="Rendering size of vector outlines in pixels")
+    args = parser.parse_args(argv)
+    if not args.paths and not args.heritage:
+        parser.error("no asset paths given")
+    
+    start = time.perf_counter()
+    index = build_shape_index(args.paths, size=args.size, heritage_paths=args.heritage)
+    output = args.output or shape_index_path()
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    index.save(output)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    print(
+        f"Indexed {len(index)} reference outlines ({index.groups.count('heritage')} heritage, "
+        f"{len(index.entries)} variants) "
+        f"into {output} in {elapsed_ms:.0f}ms",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
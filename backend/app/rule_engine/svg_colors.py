@@ -0,0 +1,178 @@
+"""
+Paint colors of SVG documents, read without rasterizing.
+
+The document is streamed with iterparse, so memory stays bounded by the
+nesting depth rather than the file size. Each painted element contributes
+one occurrence of its resolved fill and stroke color and each gradient stop
+one occurrence of its stop-color. Colors are resolved like a renderer does
+for the common cases:
+
+- presentation attributes, then matching <style> rules (type, .class and
+  #id selectors, in that order), then the style attribute;
+- fill, stroke and color inherit from the parent; "inherit" and
+  currentColor are honored;
+- unset fill is black, unset stroke and stop-color follow the SVG defaults;
+- "none", "transparent" and gradient references paint no solid color (the
+  gradient's stops are counted where they are defined);
+- content of <clipPath> and <mask> is never painted and is skipped.
+
+Rules of a <style> element apply to the elements that follow it, which is
+where editors such as Illustrator place them. Selectors other than simple
+type, class and id selectors are ignored.
+"""
+import io
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from xml.etree import ElementTree
+
+from PIL import ImageColor
+
+
+# Properties tracked while walking the tree and whether children inherit them
+_TRACKED_PROPERTIES = {"fill": True, "stroke": True, "color": True, "stop-color": False}
+_INITIAL_VALUES = {"fill": "black", "stroke": "none", "color": "black", "stop-color": "black"}
+
+_SHAPE_TAGS = frozenset({"path", "rect", "circle", "ellipse", "line", "polyline", "polygon", "text"})
+_UNPAINTED_TAGS = frozenset({"clipPath", "mask"})
+
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+_SIMPLE_SELECTOR = re.compile(r"^([.#]?)([A-Za-z_][\w-]*)$")
+
+SvgSource = Union[bytes, str]
+
+
+def is_svg(data: bytes) -> bool:
+    """Cheap sniff for SVG content in the first bytes of a file."""
+    
+    head = data[:4096].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    return head.startswith((b"<svg", b"<?xml", b"<!--", b"<!doctype svg")) and b"<svg" in head
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_declarations(text: str) -> Dict[str, str]:
+    """Tracked properties from a CSS declaration block ("fill: #fff; stroke: none")."""
+    
+    declarations = {}
+    for declaration in text.split(";"):
+        name, separator, value = declaration.partition(":")
+        name = name.strip().lower()
+        if separator and name in _TRACKED_PROPERTIES:
+            declarations[name] = value.replace("!important", "").strip()
+    return declarations
+
+
+def _parse_stylesheet(text: str, rules: Dict[Tuple[str, str], Dict[str, str]]) -> None:
+    """Add the simple-selector rules of a <style> element to rules, keyed by (kind, name)."""
+    
+    for selectors, body in _CSS_RULE.findall(_CSS_COMMENT.sub("", text)):
+        declarations = _parse_declarations(body)
+        if not declarations:
+            continue
+        for selector in selectors.split(","):
+            match = _SIMPLE_SELECTOR.match(selector.strip())
+            if match:
+                rules.setdefault((match.group(1), match.group(2)), {}).update(declarations)
+
+
+@lru_cache(maxsize=1024)
+def parse_paint(value: str) -> Optional[Tuple[int, int, int]]:
+    """RGB of a solid paint value, or None when it paints no solid color.
+    
+    Gradient references with a fallback color ("url(#g) #FFBC0D") resolve
+    to the fallback. currentColor must be substituted by the caller.
+    """
+    
+    value = value.strip()
+    if value.lower().startswith("url("):
+        value = value.partition(")")[2].strip()
+    if not value or value.lower() in ("none", "transparent"):
+        return None
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        return None
+
+
+def _to_hex(rgb: Tuple[int, int, int]) -> str:
+    return "#{:02X}{:02X}{:02X}".format(*rgb)
+
+
+def iter_svg_paints(source: SvgSource) -> Iterable[Tuple[str, str]]:
+    """Yield (property, "#RRGGBB") for every painted fill, stroke and stop-color.
+    
+    source is the SVG document as bytes or a file path. Raises ValueError
+    when the document is not SVG and ElementTree.ParseError when it is not
+    well-formed XML.
+    """
+    
+    stream = io.BytesIO(source) if isinstance(source, bytes) else source
+    rules: Dict[Tuple[str, str], Dict[str, str]] = {}
+    stack: List[Dict[str, str]] = [dict(_INITIAL_VALUES)]
+    unpainted_depth = 0
+    
+    for event, element in ElementTree.iterparse(stream, events=("start", "end")):
+        tag = _local_name(element.tag)
+        
+        if event == "end":
+            stack.pop()
+            if tag in _UNPAINTED_TAGS:
+                unpainted_depth -= 1
+            elif tag == "style" and element.text:
+                _parse_stylesheet(element.text, rules)
+            element.clear()
+            continue
+        
+        if len(stack) == 1 and tag != "svg":
+            raise ValueError(f"Not an SVG document (root element <{tag}>)")
+        
+        # Cascade: presentation attributes < stylesheet rules < style attribute
+        declared = {name: element.attrib[name] for name in _TRACKED_PROPERTIES if name in element.attrib}
+        declared.update(rules.get(("", tag), {}))
+        for class_name in element.attrib.get("class", "").split():
+            declared.update(rules.get((".", class_name), {}))
+        if "id" in element.attrib:
+            declared.update(rules.get(("#", element.attrib["id"]), {}))
+        declared.update(_parse_declarations(element.attrib.get("style", "")))
+        
+        parent = stack[-1]
+        state = {
+            name: parent[name] if inherited else _INITIAL_VALUES[name]
+            for name, inherited in _TRACKED_PROPERTIES.items()
+        }
+        for name, value in declared.items():
+            state[name] = parent[name] if value.strip().lower() == "inherit" else value
+        if state["color"].strip().lower() == "currentcolor":
+            state["color"] = parent["color"]
+        stack.append(state)
+        
+        if tag in _UNPAINTED_TAGS:
+            unpainted_depth += 1
+        if unpainted_depth:
+            continue
+        
+        if tag in _SHAPE_TAGS:
+            painted = ("fill", "stroke")
+        elif tag == "stop":
+            painted = ("stop-color",)
+        else:
+            continue
+        
+        for name in painted:
+            value = state[name]
+            if value.strip().lower() == "currentcolor":
+                value = state["color"]
+            rgb = parse_paint(value)
+            if rgb is not None:
+                yield name, _to_hex(rgb)
+
+
+def extract_svg_colors(source: SvgSource) -> Counter:
+    """Occurrences of each "#RRGGBB" paint color in an SVG document."""
+    
+    return Counter(color for _, color in iter_svg_paints(source))
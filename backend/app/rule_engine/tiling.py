@@ -0,0 +1,137 @@
+"""
+Helpers for walking large images in fixed-size tiles.
+
+TiledRegionMerger labels a binary mask tile by tile and stitches
+8-connected components across tile borders with a union-find, so region
+bounding boxes can be collected without holding a full-resolution label
+image in memory.
+"""
+from typing import Dict, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+
+
+def iter_tiles(height: int, width: int, tile_size: int) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (y0, y1, x0, x1) tile bounds in row-major order."""
+    
+    for y0 in range(0, height, tile_size):
+        for x0 in range(0, width, tile_size):
+            yield y0, min(y0 + tile_size, height), x0, min(x0 + tile_size, width)
+
+
+class TiledRegionMerger:
+    """Accumulate connected-component bounding boxes over row-major tiles.
+    
+    Tiles must be added in the order produced by iter_tiles. Memory held
+    between tiles is one image row of labels plus one label column, and the
+    stats of components that may still grow.
+    """
+    
+    def __init__(self, height: int, width: int, min_area: float = 0.0):
+        self.height = height
+        self.width = width
+        self.min_area = min_area
+        # Global labels of the last mask row of the previous tile row (-1 = background)
+        self._row_above = np.full(width, -1, dtype=np.int64)
+        self._left_column = None
+        self._bottom_rows: List[Tuple[int, np.ndarray]] = []
+        self._parent: List[int] = []
+        self._boxes: List[List[int]] = []  # x0, y0, x1, y1 (exclusive)
+        self._pixel_counts: List[int] = []
+    
+    def _find(self, label: int) -> int:
+        parent = self._parent
+        root = label
+        while parent[root] != root:
+            root = parent[root]
+        while parent[label] != root:
+            parent[label], label = root, parent[label]
+        return root
+    
+    def _union(self, a: int, b: int) -> None:
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return
+        if root_b < root_a:
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        box_a, box_b = self._boxes[root_a], self._boxes[root_b]
+        box_a[0] = min(box_a[0], box_b[0])
+        box_a[1] = min(box_a[1], box_b[1])
+        box_a[2] = max(box_a[2], box_b[2])
+        box_a[3] = max(box_a[3], box_b[3])
+        self._pixel_counts[root_a] += self._pixel_counts[root_b]
+    
+    def _union_pairs(self, a: np.ndarray, b: np.ndarray) -> None:
+        """Union label pairs where both sides are foreground."""
+        
+        both = (a >= 0) & (b >= 0)
+        if not both.any():
+            return
+        pairs = np.unique(np.stack([a[both], b[both]], axis=1), axis=0)
+        for label_a, label_b in pairs:
+            self._union(int(label_a), int(label_b))
+    
+    def add_tile(self, mask: np.ndarray, y0: int, x0: int) -> None:
+        """Label one tile of the mask (nonzero = foreground) at offset (y0, x0)."""
+        
+        tile_height, tile_width = mask.shape
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(
+            mask.view(np.uint8) if mask.dtype == np.bool_ else mask, connectivity=8
+        )
+        
+        # Components that touch no tile edge cannot merge with anything, so
+        # the ones too small to report are dropped before any bookkeeping
+        x, y, w, h, area = (stats[:, i] for i in range(5))
+        touches_edge = (x == 0) | (y == 0) | (x + w == tile_width) | (y + h == tile_height)
+        keep = touches_edge | (w * h > self.min_area)
+        keep[0] = False
+        
+        to_global = np.full(count, -1, dtype=np.int64)
+        kept = np.flatnonzero(keep)
+        to_global[kept] = np.arange(len(self._parent), len(self._parent) + len(kept))
+        for label in kept:
+            bx, by, bw, bh, pixel_count = (int(v) for v in stats[label])
+            self._parent.append(len(self._parent))
+            self._boxes.append([x0 + bx, y0 + by, x0 + bx + bw, y0 + by + bh])
+            self._pixel_counts.append(pixel_count)
+        
+        # Stitch to the tile row above (8-connected: dx in -1, 0, 1)
+        if y0 > 0:
+            top = to_global[labels[0]]
+            for dx in (-1, 0, 1):
+                lo, hi = x0 + dx, x0 + dx + tile_width
+                src_lo, src_hi = max(lo, 0), min(hi, self.width)
+                self._union_pairs(top[src_lo - lo:tile_width - (hi - src_hi)], self._row_above[src_lo:src_hi])
+        
+        # Stitch to the tile on the left (8-connected: dy in -1, 0, 1)
+        if x0 > 0:
+            left_edge = to_global[labels[:, 0]]
+            for dy in (-1, 0, 1):
+                lo, hi = max(0, -dy), tile_height - max(0, dy)
+                self._union_pairs(left_edge[lo:hi], self._left_column[lo + dy:hi + dy])
+        
+        self._left_column = to_global[labels[:, -1]]
+        self._bottom_rows.append((x0, to_global[labels[-1]]))
+        
+        # Once a tile row is complete, its bottom row becomes the row above
+        if x0 + tile_width >= self.width:
+            for start, row in self._bottom_rows:
+                self._row_above[start:start + len(row)] = row
+            self._bottom_rows = []
+    
+    def regions(self) -> List[Dict[str, int]]:
+        """Merged regions whose bounding box area exceeds min_area."""
+        
+        regions = []
+        for label in range(len(self._parent)):
+            if self._find(label) != label:
+                continue
+            x0, y0, x1, y1 = self._boxes[label]
+            if (x1 - x0) * (y1 - y0) > self.min_area:
+                regions.append({
+                    "x": x0, "y": y0, "width": x1 - x0, "height": y1 - y0,
+                    "pixel_count": self._pixel_counts[label]
+                })
+        return regions
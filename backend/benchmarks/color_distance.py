@@ -0,0 +1,52 @@
+"""
+Throughput of the RGB and CIEDE2000 color distance modes.
+
+    python -m benchmarks.color_distance [asset paths...]
+
+Both modes are timed end to end through ColorComplianceChecker's distance
+map plus the three pixel metrics that consume it.
+"""
+import sys
+
+from app.rule_engine.brand_rules.color_compliance import ColorComplianceChecker
+from benchmarks.common import load_assets, print_table, synthetic_assets, time_call
+
+
+def pixel_metrics(checker: ColorComplianceChecker, image):
+    distance_map = checker._compute_distance_map(image)
+    return (
+        checker._calculate_color_accuracy(distance_map),
+        checker._calculate_compliant_pixel_ratio(distance_map),
+        checker._find_non_compliant_regions(distance_map),
+    )
+
+
+def main(paths):
+    assets = synthetic_assets()
+    assets.update(load_assets(paths))
+    
+    rgb_checker = ColorComplianceChecker()
+    rgb_checker.color_distance_mode = "rgb"
+    lab_checker = ColorComplianceChecker()
+    lab_checker.color_distance_mode = "ciede2000"
+    
+    rows = []
+    for name, image in assets.items():
+        megapixels = image.shape[0] * image.shape[1] / 1e6
+        rgb_ms, (_, rgb_ratio, _) = time_call(pixel_metrics, rgb_checker, image)
+        lab_ms, (_, lab_ratio, _) = time_call(pixel_metrics, lab_checker, image)
+        rows.append([
+            name, f"{megapixels:.1f}",
+            f"{rgb_ms:.1f}", f"{megapixels / rgb_ms * 1000:.0f}",
+            f"{lab_ms:.1f}", f"{megapixels / lab_ms * 1000:.0f}",
+            f"{rgb_ratio:.3f}", f"{lab_ratio:.3f}",
+        ])
+    
+    print_table(
+        ["asset", "MP", "rgb ms", "rgb MP/s", "ciede2000 ms", "ciede2000 MP/s", "rgb ratio", "ciede2000 ratio"],
+        rows
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,72 @@
+"""
+Shared helpers for rule engine benchmarks.
+
+Run benchmarks from the backend directory, e.g.:
+    python -m benchmarks.dominant_colors [asset paths...]
+"""
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import cv2
+import numpy as np
+
+
+GOLD = (255, 188, 13)
+
+
+def synthetic_assets(seed: int = 7) -> Dict[str, np.ndarray]:
+    """Build a small corpus of synthetic RGB assets at realistic sizes."""
+    
+    rng = np.random.default_rng(seed)
+    assets = {}
+    
+    flat = np.full((1080, 1920, 3), 255, dtype=np.uint8)
+    cv2.ellipse(flat, (960, 700), (300, 420), 0, 180, 360, GOLD, 80)
+    assets["flat_logo_1080p"] = flat
+    
+    noisy = flat.astype(np.int16) + rng.normal(0, 6, flat.shape).astype(np.int16)
+    assets["noisy_logo_1080p"] = np.clip(noisy, 0, 255).astype(np.uint8)
+    
+    photo = rng.integers(0, 256, (3000, 4000, 3), dtype=np.uint8)
+    photo = cv2.GaussianBlur(photo, (31, 31), 0)
+    cv2.rectangle(photo, (1500, 1000), (2100, 1500), GOLD, -1)
+    assets["photo_12mp"] = photo
+    
+    return assets
+
+
+def load_assets(paths: Iterable[str]) -> Dict[str, np.ndarray]:
+    """Decode raster assets from disk as RGB arrays, skipping unreadable files."""
+    
+    assets = {}
+    for path in paths:
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"skipping {path}: not a decodable raster image")
+            continue
+        assets[Path(path).name] = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return assets
+
+
+def time_call(func: Callable, *args, repeat: int = 3, **kwargs) -> Tuple[float, object]:
+    """Return the best wall time in milliseconds and the last result."""
+    
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def print_table(headers: List[str], rows: List[List[object]]) -> None:
+    """Print rows as a fixed-width text table."""
+    
+    cells = [[str(c) for c in row] for row in [headers] + rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    for index, row in enumerate(cells):
+        print("  ".join(cell.ljust(width) for cell, width in zip(row, widths)))
+        if index == 0:
+            print("  ".join("-" * width for width in widths))
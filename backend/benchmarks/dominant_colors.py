@@ -0,0 +1,71 @@
+"""
+Benchmark the histogram dominant color engine against scikit-learn K-means.
+
+    python -m benchmarks.dominant_colors [asset paths...]
+
+Palette agreement is the mean and worst RGB distance from each K-means
+center to the nearest histogram color, plus whether both palettes agree on
+golden arches color presence.
+"""
+import sys
+
+import numpy as np
+
+from app.rule_engine.brand_rules.color_compliance import ColorComplianceChecker
+from app.rule_engine.dominant_colors import extract_dominant_colors
+from benchmarks.common import load_assets, print_table, synthetic_assets, time_call
+
+
+def kmeans_dominant_colors(image: np.ndarray, k: int = 5):
+    """The previous implementation: K-means over every pixel."""
+    
+    from sklearn.cluster import KMeans
+    
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
+    kmeans.fit(image.reshape(-1, 3))
+    return [tuple(color) for color in kmeans.cluster_centers_.astype(int)]
+
+
+def palette_distance(reference, candidate):
+    """Distance from every reference color to its nearest candidate color."""
+    
+    ref = np.asarray(reference, dtype=np.float64)
+    cand = np.asarray(candidate, dtype=np.float64)
+    distances = np.sqrt(((ref[:, None, :] - cand[None, :, :]) ** 2).sum(axis=2)).min(axis=1)
+    return distances.mean(), distances.max()
+
+
+def main(paths):
+    checker = ColorComplianceChecker()
+    assets = synthetic_assets()
+    assets.update(load_assets(paths))
+    
+    try:
+        import sklearn  # noqa: F401
+        have_sklearn = True
+    except ImportError:
+        have_sklearn = False
+        print("scikit-learn not installed: reporting histogram engine only")
+    
+    rows = []
+    for name, image in assets.items():
+        hist_ms, hist_colors = time_call(extract_dominant_colors, image)
+        row = [name, f"{image.shape[1]}x{image.shape[0]}", f"{hist_ms:.1f}"]
+        
+        if have_sklearn:
+            km_ms, km_colors = time_call(kmeans_dominant_colors, image, repeat=1)
+            mean_d, max_d = palette_distance(km_colors, hist_colors)
+            gold_agrees = (checker._check_golden_color_presence(km_colors)
+                           == checker._check_golden_color_presence(hist_colors))
+            row += [f"{km_ms:.1f}", f"{km_ms / hist_ms:.0f}x", f"{mean_d:.1f}", f"{max_d:.1f}", gold_agrees]
+        
+        rows.append(row)
+    
+    headers = ["asset", "size", "histogram ms"]
+    if have_sklearn:
+        headers += ["kmeans ms", "speedup", "mean dist", "max dist", "gold agrees"]
+    print_table(headers, rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
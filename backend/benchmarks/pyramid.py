@@ -0,0 +1,106 @@
+"""
+Latency distribution of coarse-to-fine (pyramid) rule checks.
+
+    python -m benchmarks.pyramid [asset paths...]
+
+Runs the color and geometry checks over a mixed corpus at full resolution
+and in pyramid mode, reporting latency percentiles, how often each pyramid
+level decided the result, and how often the pyramid decision agreed with
+the full-resolution one (golden color match; geometry rotation and
+aspect-ratio threshold outcomes).
+"""
+import sys
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from app.rule_engine.brand_rules.color_compliance import ColorComplianceChecker
+from app.rule_engine.brand_rules.geometry_rules import GeometryChecker
+from benchmarks.common import GOLD, load_assets, print_table, time_call
+
+
+def mixed_corpus(count: int = 40, seed: int = 11):
+    """Logos on plain and textured backgrounds; some colors and rotations sit near the thresholds."""
+    
+    rng = np.random.default_rng(seed)
+    assets = {}
+    for index in range(count):
+        height, width = (1536, 2048) if index % 2 else (2160, 3840)
+        if index % 3 == 0:
+            image = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (21, 21), 0)
+        else:
+            image = np.full((height, width, 3), 255, dtype=np.uint8)
+        
+        # Every fourth asset has a logo color or rotation right at the threshold
+        marginal = index % 4 == 0
+        offset = 10 if marginal else int(rng.choice([0, 2, 40]))
+        color = (GOLD[0], GOLD[1], min(255, GOLD[2] + offset))
+        angle = 5.0 if marginal else float(rng.uniform(10, 40))
+        
+        size = min(height, width) // 2
+        box = cv2.boxPoints(((width / 2, height / 2), (size / 2, size), angle)).astype(np.int32)
+        cv2.fillPoly(image, [box], color)
+        assets[f"asset_{index:02d}_{width}x{height}"] = image
+    return assets
+
+
+def percentiles(values):
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return [f"{p50:.1f}", f"{p90:.1f}", f"{p99:.1f}", f"{max(values):.1f}"]
+
+
+def main(paths):
+    assets = mixed_corpus()
+    assets.update(load_assets(paths))
+    
+    color_checker = ColorComplianceChecker()
+    geometry_checker = GeometryChecker()
+    
+    def geometry_decision(result):
+        ratio_diff = abs(result["aspect_ratio"] - GeometryChecker.EXPECTED_ASPECT_RATIO) / GeometryChecker.EXPECTED_ASPECT_RATIO
+        return (
+            "error" in result,
+            result["rotation_angle"] > geometry_checker.max_rotation_degrees,
+            ratio_diff > GeometryChecker.ASPECT_RATIO_TOLERANCE,
+        )
+    
+    # The color checker takes BGR input, the geometry checker RGB
+    checks = {
+        "color": (color_checker, color_checker.check_color_compliance,
+                  lambda result: result["golden_arches_color_match"],
+                  lambda image: cv2.cvtColor(image, cv2.COLOR_RGB2BGR)),
+        "geometry": (geometry_checker, geometry_checker.check_geometry_compliance,
+                     geometry_decision, lambda image: image),
+    }
+    
+    latency_rows, level_rows = [], []
+    for name, (checker, check, decision, prepare) in checks.items():
+        timings = {False: [], True: []}
+        levels = Counter()
+        agreements = 0
+        for image in assets.values():
+            image = prepare(image)
+            results = {}
+            for pyramid_mode in (False, True):
+                checker.pyramid_mode = pyramid_mode
+                ms, results[pyramid_mode] = time_call(check, image, repeat=1)
+                timings[pyramid_mode].append(ms)
+            levels[results[True]["pyramid_level"]] += 1
+            agreements += decision(results[True]) == decision(results[False])
+        
+        for pyramid_mode in (False, True):
+            latency_rows.append([name, "pyramid" if pyramid_mode else "full"] + percentiles(timings[pyramid_mode]))
+        level_rows.append([
+            name, len(assets),
+            " ".join(f"L{level}:{levels[level]}" for level in sorted(levels)),
+            f"{agreements}/{len(assets)}",
+        ])
+    
+    print_table(["check", "mode", "p50 ms", "p90 ms", "p99 ms", "max ms"], latency_rows)
+    print()
+    print_table(["check", "assets", "deciding level", "same decision"], level_rows)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
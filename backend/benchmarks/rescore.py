@@ -0,0 +1,62 @@
+"""
+Cost of recording color statistics and of a catalog-wide re-score.
+
+    python -m benchmarks.rescore [--assets N] [asset paths...]
+
+Statistics are recorded once per synthetic (or given) asset, then copied
+under N asset ids in a temporary store, and the whole store is re-scored
+with a new tolerance and compared against re-analyzing the pixels.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+import cv2
+
+from app.rule_engine.brand_rules.color_compliance import ColorComplianceChecker
+from app.rule_engine.color_statistics import ColorStatisticsStore
+from app.rule_engine.rescore import rescore_catalog
+from benchmarks.common import load_assets, print_table, synthetic_assets, time_call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=1000, help="Catalog size to simulate")
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args()
+    
+    assets = synthetic_assets()
+    assets.update(load_assets(args.paths))
+    images = {name: cv2.cvtColor(image, cv2.COLOR_RGB2BGR) for name, image in assets.items()}
+    
+    checker = ColorComplianceChecker()
+    directory = tempfile.mkdtemp(prefix="color_stats_")
+    store = ColorStatisticsStore(directory)
+    try:
+        rows = []
+        for name, image in images.items():
+            record_ms, _ = time_call(checker.record_color_statistics, image, name, store=store)
+            checker.analysis_cache.clear()
+            analyze_ms, _ = time_call(checker.check_color_compliance, image, repeat=1)
+            size_kb = len(open(store.path(name), "rb").read()) / 1024
+            rows.append([name, f"{record_ms:.1f}", f"{analyze_ms:.1f}", f"{size_kb:.1f}"])
+        print_table(["asset", "record ms", "full check ms", "stats KB"], rows)
+        
+        # Simulate a catalog by copying the recorded statistics
+        names = list(images)
+        for index in range(args.assets - len(names)):
+            shutil.copyfile(store.path(names[index % len(names)]), store.path(f"asset_{index:06d}"))
+        
+        checker.color_tolerance = checker.color_tolerance + 5
+        start = time.perf_counter()
+        rescored = sum(1 for _ in rescore_catalog(checker, store))
+        elapsed = time.perf_counter() - start
+        print()
+        print(f"Re-scored {rescored} assets in {elapsed:.2f}s ({elapsed / rescored * 1000:.2f}ms per asset)")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
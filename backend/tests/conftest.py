@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch, tmp_path):
+    """Keep every on-disk cache (result store, palette LUTs, statistics, shape index) in tmp_path"""
+    from app.core.config import settings
+    
+    monkeypatch.setattr(settings, "cache_dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(settings, "result_cache_path", str(tmp_path / "cache" / "rule_results.sqlite"))
@@ -1,7 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
 import io
-from PIL import Image
+from PIL import Image, ImageDraw
+from PIL.PngImagePlugin import PngInfo
 
 from app.main import app
 from app.api.models.asset import AssetType, ComplianceStatus
@@ -13,6 +14,23 @@ def client():
     return TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def asset_downloads(monkeypatch):
+    """Serve a golden arches image for every asset instead of downloading it from blob storage"""
+    from app.api.endpoints import analysis
+    
+    async def download(blob_name):
+        img = Image.new('RGB', (300, 300), color='white')
+        ImageDraw.Draw(img).rectangle([80, 100, 220, 200], fill=(255, 188, 13))
+        metadata = PngInfo()
+        metadata.add_text("blob", blob_name)  # Distinct content per asset
+        img_bytes = io.BytesIO()
+        img.save(img_bytes, format='PNG', pnginfo=metadata)
+        return img_bytes.getvalue()
+    
+    monkeypatch.setattr(analysis, "_download_asset", download)
+
+
 @pytest.fixture
 def sample_image():
     """Create a sample image for testing"""
@@ -32,6 +50,7 @@ def test_health_check(client):
     assert data["status"] == "healthy"
     assert "timestamp" in data
     assert "app_name" in data
+    assert {"entries", "hit_ratio", "disk_bytes", "max_bytes"} <= set(data["result_cache"])
 
 
 def test_root_endpoint(client):
@@ -54,6 +73,27 @@ def test_upload_invalid_file_type(client, sample_image):
     assert "not allowed" in response.json()["detail"]
 
 
+def test_upload_records_color_statistics(client, monkeypatch):
+    """Test an uploaded image gets its color statistics recorded once the response is sent"""
+    from app.api.endpoints import upload
+    from app.rule_engine.color_statistics import ColorStatisticsStore
+    
+    async def upload_image(file_content, filename, container=None):
+        return f"https://example.blob.core.windows.net/images/{filename}"
+    
+    monkeypatch.setattr(upload.azure_client, "upload_image", upload_image)
+    img = Image.new('RGB', (200, 200), color='white')
+    ImageDraw.Draw(img).rectangle([50, 60, 150, 140], fill=(255, 188, 13))
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    
+    files = {"file": ("logo.png", io.BytesIO(img_bytes.getvalue()), "image/png")}
+    response = client.post("/api/v1/upload/single", files=files, data={"asset_type": AssetType.RENDER.value})
+    
+    assert response.status_code == 200
+    assert response.json()["asset"]["id"] in {int(asset_id) for asset_id in ColorStatisticsStore().asset_ids()}
+
+
 def test_analyze_asset(client):
     """Test analyzing an asset for brand compliance"""
     response = client.post("/api/v1/analysis/analyze/123")
@@ -63,6 +103,76 @@ def test_analyze_asset(client):
     assert result["asset_id"] == 123
     assert "overall_compliance" in result
     assert "compliance_score" in result
+    assert set(result["rule_timings_ms"]) == {"heritage_detection", "no_rotation", "no_flipping", "gold_color_only"}
+    assert not result["heritage_detected"]
+
+
+def test_analyze_asset_without_image(client, monkeypatch):
+    """Test an asset that cannot be downloaded runs the Golden Arches rules unclassified"""
+    from app.api.endpoints import analysis
+    
+    async def unavailable(blob_name):
+        return None
+    
+    monkeypatch.setattr(analysis, "_download_asset", unavailable)
+    result = client.post("/api/v1/analysis/analyze/124?force_reanalysis=true").json()
+    
+    assert sorted(result["completed_rules"]) == ["gold_color_only", "no_flipping", "no_rotation"]
+    assert not result["heritage_detected"]
+
+
+def test_analyze_asset_result_cache(client, monkeypatch):
+    """Test re-analyzing an unchanged asset is served from the result cache"""
+    from app.api.endpoints import analysis
+    
+    fresh = client.post("/api/v1/analysis/analyze/456?force_reanalysis=true").json()
+    decoded = []
+    from_bytes = analysis.ImageContext.from_bytes
+    monkeypatch.setattr(analysis.ImageContext, "from_bytes", lambda data: decoded.append(data) or from_bytes(data))
+    cached = client.post("/api/v1/analysis/analyze/456").json()
+    
+    assert not fresh["cached"]
+    assert cached["cached"]
+    assert decoded == []  # A cache hit never decodes the image
+    assert cached["compliance_score"] == fresh["compliance_score"]
+    assert cached["rule_timings_ms"] == fresh["rule_timings_ms"]
+    assert not client.post("/api/v1/analysis/analyze/456?force_reanalysis=true").json()["cached"]
+
+
+def test_analyze_asset_recomputes_only_changed_rules(client, monkeypatch):
+    """Test a changed rule setting only re-runs the rules reading it"""
+    from app.core.config import settings
+    
+    fresh = client.post("/api/v1/analysis/analyze/789?force_reanalysis=true").json()
+    assert fresh["rule_evaluations_avoided"] == 0
+    assert fresh["rule_provenance"]["no_rotation"]["parameters"] == {"max_rotation_degrees": settings.max_rotation_degrees}
+    
+    monkeypatch.setattr(settings, "max_rotation_degrees", 1.0)
+    changed = client.post("/api/v1/analysis/analyze/789").json()
+    
+    assert not changed["cached"]
+    assert sorted(changed["reused_rules"]) == ["gold_color_only", "heritage_detection", "no_flipping"]
+    assert changed["rule_evaluations_avoided"] == 3
+    assert set(changed["rule_timings_ms"]) == {"no_rotation"}
+    assert changed["violations_count"] == fresh["violations_count"] + 1
+
+
+def test_analyze_asset_with_deadline(client):
+    """Test a spent deadline reports pending rules that are completed in the background"""
+    checks = ["gold_color_only", "heritage_detection", "no_flipping", "no_rotation"]
+    
+    partial = client.post("/api/v1/analysis/analyze/321?deadline_ms=0&complete_in_background=false").json()
+    assert partial["completed_rules"] == []
+    assert sorted(partial["pending_rules"]) == checks
+    assert partial["overall_compliance"] == ComplianceStatus.PENDING_REVIEW
+    assert not client.post("/api/v1/analysis/analyze/321?deadline_ms=0").json()["cached"]
+    
+    # The background task stored the complete report
+    complete = client.post("/api/v1/analysis/analyze/321").json()
+    assert complete["cached"]
+    assert complete["pending_rules"] == []
+    assert sorted(complete["completed_rules"]) == checks
+    assert complete["overall_compliance"] == ComplianceStatus.COMPLIANT
 
 
 def test_create_annotation(client):
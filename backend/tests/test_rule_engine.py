@@ -1,11 +1,42 @@
 import pytest
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageCms, ImageOps
+import asyncio
 import io
+import json
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 
 from app.rule_engine.brand_rules.color_compliance import ColorComplianceChecker
 from app.rule_engine.brand_rules.geometry_rules import GeometryChecker
+from app.rule_engine.palette import CompiledPalette, PaletteEntry, get_compiled_palette
+from app.rule_engine.perceptual import delta_e_2000, srgb_to_lab
+from app.rule_engine.analysis_context import AnalysisContextCache
+from app.rule_engine import color_statistics
+from app.rule_engine.color_statistics import ColorStatisticsStore, exact_color_counts
+from app.rule_engine import rescore
+from app.rule_engine.image_io import decode_image, get_icc_transform_cache
+from app.rule_engine.svg_colors import extract_svg_colors, is_svg
+from app.rule_engine import image_context
+from app.rule_engine.image_context import ImageContext, to_gray
+from app.rule_engine.contour_features import ContourFeatureTable, bounding_rects
+from app.rule_engine.ai_outlines import read_ai_outlines, render_path
+from app.rule_engine import shape_index
+from app.rule_engine.shape_index import ShapeIndex, build_shape_index
+from app.rule_engine.registry import Rule, RuleExecutor, RuleRegistry
+from app.rule_engine.brand_rules.compliance_rules import (
+    HERITAGE_RECOMMENDATION, HERITAGE_RULE, check_no_flipping, check_no_rotation, complete_compliance_rules,
+    compliance_rules, run_compliance_rules
+)
+from app.rule_engine.brand_rules.heritage_rules import HeritageChecker
+from app.rule_engine.result_cache import ResultCache, content_digest, result_key
+from app.services import ml_service
+from app.services.ml_service import MLService
+from app.core.config import settings
 
 
 class TestColorComplianceChecker:
@@ -67,6 +98,359 @@ class TestColorComplianceChecker:
         assert "dominant_colors" in result
         assert len(result["dominant_colors"]) > 0
     
+    def test_compliant_pixel_ratio_without_uint8_wraparound(self):
+        """Test pixel metrics use true distances rather than wrapped uint8 values"""
+        img_array = np.zeros((100, 100, 3), dtype=np.uint8)
+        img_array[:, 50:] = (255, 188, 13)
+        
+        distance_map = self.checker._compute_distance_map(img_array)
+        
+        assert distance_map.squared.dtype == np.int32
+        assert distance_map.squared[0, 0] == 255**2 + 188**2 + 13**2
+        assert self.checker._calculate_compliant_pixel_ratio(distance_map) == pytest.approx(0.5)
+        assert self.checker._calculate_color_accuracy(distance_map) == pytest.approx(1.0)
+    
+    def test_non_compliant_regions_share_distance_map(self):
+        """Test region extraction on a half gold, half black image"""
+        img_array = np.zeros((100, 100, 3), dtype=np.uint8)
+        img_array[:, 50:] = (255, 188, 13)
+        
+        distance_map = self.checker._compute_distance_map(img_array)
+        regions = self.checker._find_non_compliant_regions(distance_map)
+        
+        assert len(regions) == 1
+        assert regions[0]["width"] == pytest.approx(0.5)
+        assert regions[0]["confidence"] == pytest.approx(0.0)
+    
+    def test_non_compliant_regions_filter_small_components(self):
+        """Test speckle noise is filtered and region confidence uses the box mean"""
+        img_array = np.full((200, 200, 3), (255, 188, 13), dtype=np.uint8)
+        img_array[100::4, ::4] = (0, 0, 0)  # Isolated non-compliant specks
+        img_array[20:60, 100:180] = (255, 0, 0)
+        
+        distance_map = self.checker._compute_distance_map(img_array)
+        regions = self.checker._find_non_compliant_regions(distance_map)
+        
+        assert len(regions) == 1
+        x, y, w, h = 100, 20, 80, 40
+        expected_mean = distance_map.distances[y:y+h, x:x+w].mean()
+        assert regions[0]["area"] == w * h
+        assert regions[0]["confidence"] == pytest.approx(1.0 - expected_mean / 255.0)
+    
+    def test_dominant_colors_ordered_by_prominence(self):
+        """Test histogram dominant colors recover the main colors, largest first"""
+        img_array = np.zeros((120, 120, 3), dtype=np.uint8)
+        img_array[:, :80] = (255, 188, 13)
+        img_array[:, 80:] = (255, 255, 255)
+        
+        dominant_colors = self.checker._extract_dominant_colors(img_array)
+        
+        assert dominant_colors == [(255, 188, 13), (255, 255, 255)]
+        assert all(isinstance(c, int) for color in dominant_colors for c in color)
+    
+    def test_perceptual_distance_mode(self):
+        """Test the CIEDE2000 mode on a subsampled gold and black image"""
+        self.checker.color_distance_mode = "ciede2000"
+        self.checker.perceptual_sample_size = 2500
+        img_array = np.zeros((200, 200, 3), dtype=np.uint8)
+        img_array[:, 100:] = (252, 186, 20)  # Visually indistinguishable from gold
+        
+        distance_map = self.checker._compute_distance_map(img_array)
+        regions = self.checker._find_non_compliant_regions(distance_map)
+        
+        assert distance_map.scale == 4
+        assert self.checker._calculate_compliant_pixel_ratio(distance_map) == pytest.approx(0.5)
+        assert regions[0]["area"] == 100 * 200
+        assert bool(self.checker.validate_hex_color("#FCBA14")) is True
+        assert bool(self.checker.validate_hex_color("#FF0000")) is False
+    
+    def test_delta_e_2000_reference_values(self):
+        """Test CIEDE2000 against published reference pairs (Sharma et al.)"""
+        lab1 = np.array([[50.0, 2.6772, -79.7751], [50.0, 2.5, 0.0]])
+        lab2 = np.array([[50.0, 0.0, -82.7485], [73.0, 25.0, -18.0]])
+        
+        assert delta_e_2000(lab1, lab2) == pytest.approx([2.0425, 27.1492], abs=1e-3)
+        assert srgb_to_lab(np.array([255, 255, 255], dtype=np.uint8)) == pytest.approx([100, 0, 0], abs=1e-3)
+    
+    def test_tiled_analysis_matches_single_pass(self):
+        """Test tiled analysis gives the same metrics and merges regions across tiles"""
+        img_array = np.full((300, 400, 3), (13, 188, 255), dtype=np.uint8)  # BGR gold
+        cv2.rectangle(img_array, (50, 40), (260, 200), (0, 0, 255), -1)
+        cv2.circle(img_array, (330, 230), 50, (255, 0, 0), -1)
+        
+        self.checker.color_tiling_threshold_pixels = 10**9
+        single = self.checker.check_color_compliance(img_array)
+        
+        self.checker.color_tiling_threshold_pixels = 0
+        self.checker.color_tile_size = 64
+        tiled = self.checker.check_color_compliance(img_array)
+        
+        assert tiled["tiled"] is True
+        assert tiled["compliant_pixel_ratio"] == single["compliant_pixel_ratio"]
+        assert tiled["dominant_colors"] == single["dominant_colors"]
+        assert tiled["palette_coverage"] == single["palette_coverage"]
+        
+        def by_position(regions):
+            return sorted(regions, key=lambda r: (r["x"], r["y"]))
+        
+        assert len(tiled["non_compliant_regions"]) == 2
+        for a, b in zip(by_position(tiled["non_compliant_regions"]), by_position(single["non_compliant_regions"])):
+            assert a == pytest.approx(b)
+    
+    def test_batch_matches_single_image_results(self):
+        """Test the batch API returns the single-image results for mixed shapes"""
+        gold = np.full((80, 120, 3), (13, 188, 255), dtype=np.uint8)  # BGR gold
+        red_block = gold.copy()
+        red_block[10:50, 20:90] = (0, 0, 255)
+        small = np.zeros((40, 40, 3), dtype=np.uint8)
+        images = [gold, small, red_block]
+        
+        batch_results = self.checker.check_color_compliance_batch(images)
+        stack_results = self.checker.check_color_compliance_batch(np.stack([gold, red_block]))
+        
+        assert batch_results == [self.checker.check_color_compliance(image) for image in images]
+        assert stack_results == [batch_results[0], batch_results[2]]
+    
+    def test_pyramid_mode_decides_clear_cases_on_coarse_level(self):
+        """Test pyramid mode exits early on clear-cut images and escalates marginal ones"""
+        img_array = np.full((1024, 1024, 3), (13, 188, 255), dtype=np.uint8)  # BGR gold
+        cv2.rectangle(img_array, (100, 100), (500, 400), (0, 0, 255), -1)
+        full = self.checker.check_color_compliance(img_array)
+        
+        self.checker.pyramid_mode = True
+        coarse = self.checker.check_color_compliance(img_array)
+        
+        assert coarse["pyramid_level"] == 2
+        assert coarse["golden_arches_color_match"] == full["golden_arches_color_match"]
+        assert coarse["total_pixels"] == full["total_pixels"]
+        assert coarse["compliant_pixel_ratio"] == pytest.approx(full["compliant_pixel_ratio"], abs=0.01)
+        assert len(coarse["non_compliant_regions"]) == 1
+        assert coarse["non_compliant_regions"][0]["area"] == pytest.approx(
+            full["non_compliant_regions"][0]["area"], rel=0.02
+        )
+        
+        # Exactly color_tolerance away from gold: too close to call below full resolution
+        marginal = np.full((1024, 1024, 3), (23, 188, 255), dtype=np.uint8)
+        assert self.checker.check_color_compliance(marginal)["pyramid_level"] == 0
+    
+    def test_analysis_memoized_for_recommendations(self):
+        """Test recommendations reuse the memoized analysis of the same pixels"""
+        self.checker.analysis_cache = AnalysisContextCache(max_entries=2)
+        img_array = np.full((60, 60, 3), (0, 0, 255), dtype=np.uint8)
+        
+        result = self.checker.check_color_compliance(img_array)
+        result["dominant_colors"].clear()  # Callers get a copy of the cached result
+        recommendations = self.checker.get_color_recommendations(img_array.copy())
+        
+        assert self.checker.analysis_cache.stats()["hits"] == 1
+        assert self.checker.analysis_cache.stats()["misses"] == 1
+        assert self.checker.check_color_compliance(img_array)["dominant_colors"] == [(255, 0, 0)]
+        assert recommendations == self.checker.get_color_recommendations(None, analysis=result)
+        
+        # A configuration change is a different result, and the LRU stays bounded
+        self.checker.color_tolerance = 50
+        self.checker.check_color_compliance(img_array)
+        for value in (1, 2):
+            self.checker.check_color_compliance(np.full((10, 10, 3), value, dtype=np.uint8))
+        
+        stats = self.checker.analysis_cache.stats()
+        assert stats["misses"] == 4
+        assert stats["entries"] == 2
+    
+    def test_image_context_shared_between_checkers(self, monkeypatch):
+        """Test both checkers reuse one context's derived arrays and match array input"""
+        img_array = np.zeros((200, 240, 3), dtype=np.uint8)
+        cv2.rectangle(img_array, (60, 40), (160, 170), (13, 188, 255), -1)
+        geometry_checker = GeometryChecker()
+        for checker in (self.checker, geometry_checker):
+            checker.analysis_cache = AnalysisContextCache(max_entries=0)
+        
+        expected_color = self.checker.check_color_compliance(img_array)
+        expected_geometry = geometry_checker.check_geometry_compliance(img_array)
+        expected_recommendations = self.checker.get_color_recommendations(img_array)
+        
+        digests = []
+        monkeypatch.setattr(
+            image_context, "image_digest", lambda image: digests.append(image.shape) or "digest"
+        )
+        context = ImageContext(img_array)
+        assert geometry_checker.check_geometry_compliance(context) == expected_geometry
+        assert self.checker.check_color_compliance(context) == expected_color
+        assert self.checker.get_color_recommendations(context) == expected_recommendations
+        
+        assert digests == [(200, 240, 3)]
+        assert "gray" in context and "otsu_mask" in context
+        distance_maps = [key for key in context._derived if isinstance(key, tuple) and key[0] == "distance_map"]
+        assert len(distance_maps) == 1
+        
+        # Batch checks keep the stacked grayscale and reuse the contexts for ROI checks
+        contexts = [ImageContext(img_array), ImageContext(img_array.copy())]
+        geometry = geometry_checker.check_geometry_compliance_batch(contexts)
+        assert geometry == [expected_geometry, expected_geometry]
+        assert all("gray" in c for c in contexts)
+        colors = self.checker.check_color_compliance_batch(contexts, rois=geometry)
+        assert colors[0] == self.checker.check_color_compliance(img_array, roi=expected_geometry)
+        assert all(("crop", tuple(expected_geometry["bounding_box"])) in c for c in contexts)
+    
+    def test_image_context_derived_once_across_threads(self):
+        """Test threads sharing a context compute each derived array once and only see complete ones"""
+        context = ImageContext(np.zeros((64, 64, 3), dtype=np.uint8))
+        calls = []
+        barrier = threading.Barrier(8, timeout=5)
+        
+        def slow_gray():
+            calls.append("gray")
+            time.sleep(0.05)
+            return to_gray(context.image)
+        
+        def derive(_):
+            barrier.wait()
+            gray = context.derived("slow_gray", slow_gray)
+            # A nested key derived while another thread holds the outer one's lock
+            return context.derived("threshold", lambda: context.derived("slow_gray", slow_gray) > 0), gray
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(derive, range(8)))
+        
+        assert calls == ["gray"]
+        assert all(gray is results[0][1] and threshold is results[0][0] for threshold, gray in results)
+        assert results[0][1].shape == (64, 64)
+    
+    def test_rescore_from_stored_color_statistics(self, tmp_path, capsys):
+        """Test stored statistics re-score to the same metrics as a fresh analysis"""
+        rng = np.random.default_rng(3)
+        img_array = np.full((120, 160, 3), (13, 188, 255), dtype=np.uint8)  # BGR gold
+        img_array[:60] = np.clip(img_array[:60] + rng.integers(-20, 21, (60, 160, 3)), 0, 255)
+        img_array[90:, :80] = (0, 0, 255)
+        
+        store = ColorStatisticsStore(str(tmp_path))
+        self.checker.record_color_statistics(img_array, 42, store=store)
+        statistics = store.load(42)
+        
+        for tolerance in (10, 25):
+            self.checker.color_tolerance = tolerance
+            rescored = self.checker.rescore_color_statistics(statistics)
+            full = self.checker.check_color_compliance(img_array)
+            
+            assert rescored["exact"] is True
+            assert rescored["compliant_pixel_ratio"] == full["compliant_pixel_ratio"]
+            assert rescored["color_accuracy_score"] == full["color_accuracy_score"]
+            assert rescored["golden_arches_color_match"] == full["golden_arches_color_match"]
+        
+        # A gold reference outside the recorded palette is estimated from the color histogram
+        self.checker.golden_arches_rgb = (250, 190, 20)
+        estimate = self.checker.rescore_color_statistics(statistics)
+        assert estimate["exact"] is False
+        assert estimate["compliant_pixel_ratio"] == pytest.approx(
+            self.checker.check_color_compliance(img_array)["compliant_pixel_ratio"], abs=0.1
+        )
+        
+        assert rescore.main(["--store", str(tmp_path), "--tolerance", "25", "--json"]) == 0
+        assert '"asset_id": "42"' in capsys.readouterr().out
+    
+    def test_rescore_color_statistics_over_roi(self, tmp_path):
+        """Test statistics recorded over the logo region re-score like the live region analysis"""
+        img_array = np.full((200, 200, 3), 255, dtype=np.uint8)
+        img_array[50:150, 60:140] = (13, 188, 255)  # BGR gold logo
+        img_array[160:, :] = (0, 0, 255)
+        roi = (40, 30, 120, 140)
+        
+        store = ColorStatisticsStore(str(tmp_path))
+        self.checker.record_color_statistics(img_array, 7, store=store, roi=roi)
+        statistics = store.load(7)
+        rescored = self.checker.rescore_color_statistics(statistics)
+        live = self.checker.check_color_compliance(img_array, roi=roi)
+        
+        assert rescored["roi"] == list(roi)
+        assert rescored["total_pixels"] == 120 * 140
+        assert rescored["compliant_pixel_ratio"] == live["compliant_pixel_ratio"]
+        assert rescored["compliant_pixel_ratio"] != self.checker.check_color_compliance(img_array)["compliant_pixel_ratio"]
+        assert self.checker.rescore_color_statistics(self.checker.collect_color_statistics(img_array))["roi"] is None
+    
+    def test_exact_color_counts_merged_across_blocks(self, monkeypatch):
+        """Test per-block color counts add up to a whole-image count"""
+        rng = np.random.default_rng(5)
+        img_array = rng.integers(0, 4, (90, 70, 3), dtype=np.uint8)
+        mask = rng.random((90, 70)) < 0.7
+        keys = (img_array[..., 0].astype(np.int64) << 16) | (img_array[..., 1].astype(np.int64) << 8) | img_array[..., 2]
+        monkeypatch.setattr(color_statistics, "_COUNT_BLOCK_PIXELS", 1000)
+        
+        for pixel_mask in (None, mask):
+            colors, counts = exact_color_counts(img_array, pixel_mask)
+            expected_keys, expected_counts = np.unique(keys if pixel_mask is None else keys[pixel_mask], return_counts=True)
+            
+            packed = (colors[:, 0].astype(np.int64) << 16) | (colors[:, 1].astype(np.int64) << 8) | colors[:, 2]
+            assert packed.tolist() == expected_keys.tolist()
+            assert counts.tolist() == expected_counts.tolist()
+        
+        colors, counts = exact_color_counts(img_array, np.zeros((90, 70), dtype=bool))
+        assert colors.shape == (0, 3) and counts.shape == (0,)
+    
+    def test_roi_restricts_analysis_to_logo(self):
+        """Test color metrics can be restricted to a logo bounding box"""
+        img_array = np.zeros((1000, 1000, 3), dtype=np.uint8)
+        img_array[200:280, 300:400] = (13, 188, 255)  # BGR gold logo
+        img_array[260:280, 300:320] = (0, 0, 255)  # Red corner inside the logo
+        
+        full_frame = self.checker.check_color_compliance(img_array)
+        geometry = GeometryChecker().check_geometry_compliance(img_array)
+        
+        for roi in (geometry, (300, 200, 100, 80), [0.3, 0.2, 0.1, 0.08]):
+            result = self.checker.check_color_compliance(img_array, roi=roi)
+            
+            assert result["roi"] == {"x": 300, "y": 200, "width": 100, "height": 80}
+            assert result["total_pixels"] == 8000
+            assert result["compliant_pixel_ratio"] == pytest.approx(0.95)
+            
+            # Regions are reported in full-frame coordinates
+            region = max(result["non_compliant_regions"], key=lambda r: r["area"])
+            assert region["x"] == pytest.approx(0.3)
+            assert region["y"] == pytest.approx(0.26)
+            assert region["width"] == pytest.approx(0.02)
+        
+        assert full_frame["compliant_pixel_ratio"] < 0.01
+        
+        # No logo found: fall back to the full frame
+        no_logo = GeometryChecker._empty_result("No logo detected")
+        fallback = self.checker.check_color_compliance(img_array, roi=no_logo)
+        assert "roi" not in fallback
+        assert fallback == full_frame
+        
+        rois = [no_logo, (300, 200, 100, 80)]
+        assert self.checker.check_color_compliance_batch([img_array, img_array], rois=rois) == [
+            full_frame, self.checker.check_color_compliance(img_array, roi=rois[1])
+        ]
+    
+    def test_transparent_pixels_excluded(self):
+        """Test fully transparent RGBA pixels are masked out of every metric"""
+        img_array = np.zeros((100, 100, 4), dtype=np.uint8)
+        img_array[:, :50] = (13, 188, 255, 255)  # Opaque BGRA gold
+        img_array[:, 50:] = (0, 0, 255, 0)  # Transparent red
+        
+        # Decoding a transparent PNG keeps the alpha channel
+        _, png = cv2.imencode(".png", img_array)
+        decoded = decode_image(png.tobytes())
+        assert decoded.shape == (100, 100, 4)
+        
+        result = self.checker.check_color_compliance(decoded)
+        
+        assert result["dominant_colors"] == [(255, 188, 13)]
+        assert result["compliant_pixel_ratio"] == 1.0
+        assert result["non_compliant_regions"] == []
+        assert result["transparent_pixel_ratio"] == 0.5
+        assert result["palette_coverage"]["golden_arches"] == 1.0
+        
+        self.checker.color_tiling_threshold_pixels = 0
+        self.checker.color_tile_size = 32
+        tiled = self.checker.check_color_compliance(decoded)
+        assert tiled["compliant_pixel_ratio"] == 1.0
+        assert tiled["non_compliant_regions"] == []
+        assert tiled["transparent_pixel_ratio"] == 0.5
+        
+        geometry = GeometryChecker().check_geometry_compliance(decoded)
+        assert "error" not in geometry
+        assert geometry["bounding_box"] == (0, 0, 50, 100)
+    
     def test_hex_color_validation(self):
         """Test hex color validation"""
         # Test valid McDonald's gold - handle numpy boolean
@@ -82,6 +466,110 @@ class TestColorComplianceChecker:
         
         result4 = self.checker.validate_hex_color("#000000")
         assert bool(result4) is False
+    
+    def test_hex_color_validation_batch_matches_single(self):
+        """Vectorized hex validation agrees with validate_hex_color"""
+        colors = ["#FFBC0D", "FFBC0D", "#ffbc0d", "#FCBA14", "#FF0000", "#000000", "xyz", "#FFF", ""]
+        
+        for mode in ("rgb", "ciede2000"):
+            self.checker.color_distance_mode = mode
+            batch = self.checker.validate_hex_colors(colors)
+            assert batch.tolist() == [bool(self.checker.validate_hex_color(color)) for color in colors]
+        
+        assert self.checker.validate_hex_colors([]).shape == (0,)
+    
+    def test_svg_color_compliance(self):
+        """SVG paint colors are resolved through styles, inheritance and gradients"""
+        svg = b"""<?xml version="1.0" encoding="UTF-8"?>
+        <svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100">
+          <defs>
+            <style>.cls-1{fill:#ffbc0d;} .cls-2, .cls-3 {fill: #DA291C; stroke: none}</style>
+            <linearGradient id="g">
+              <stop offset="0" stop-color="#FFBC0D"/>
+              <stop offset="1" style="stop-color: rgb(255, 0, 0)"/>
+            </linearGradient>
+            <clipPath id="clip"><rect fill="#00FF00" width="10" height="10"/></clipPath>
+          </defs>
+          <g fill="red" stroke="blue">
+            <path class="cls-1" d="M0 0 L10 10"/>
+            <rect width="5" height="5"/>
+            <circle fill="none" r="3"/>
+            <text style="fill: currentColor">M</text>
+          </g>
+          <rect fill="url(#g)" width="5" height="5"/>
+          <rect class="cls-3" width="5" height="5"/>
+        </svg>"""
+        
+        assert is_svg(svg)
+        assert dict(extract_svg_colors(svg)) == {
+            "#FFBC0D": 2, "#0000FF": 4, "#FF0000": 2, "#000000": 1, "#DA291C": 1
+        }
+        
+        result = self.checker.check_svg_color_compliance(svg)
+        assert result["vector"] is True
+        assert result["golden_arches_color_match"] is True
+        assert result["paint_count"] == 10
+        assert result["compliant_pixel_ratio"] == pytest.approx(0.2)
+        assert result["dominant_colors"][0] == (0, 0, 255)
+        assert result["palette_coverage"]["golden_arches"] == pytest.approx(0.2)
+        assert result["palette_coverage"]["off_palette"] == pytest.approx(0.7)
+        
+        not_svg = self.checker.check_svg_color_compliance(b"<html><body/></html>")
+        assert "error" in not_svg
+
+
+class TestCompiledPalette:
+    """Test the compiled brand palette lookup table"""
+    
+    def setup_method(self):
+        self.entries = [
+            PaletteEntry("golden_arches", (255, 188, 13), "approved"),
+            PaletteEntry("white", (255, 255, 255), "approved"),
+            PaletteEntry("pantone_2035c", (220, 0, 28), "heritage"),
+        ]
+        self.palette = CompiledPalette(self.entries, tolerance=10, bits=7)
+    
+    def test_classify_nearest_color_and_tolerance(self):
+        """Test pixels map to the nearest palette color with a tolerance flag"""
+        img_array = np.array([[(255, 188, 13), (250, 250, 250), (255, 0, 0), (220, 2, 30)]], dtype=np.uint8)
+        
+        indices, in_tolerance = self.palette.classify(img_array)
+        
+        assert indices.tolist() == [[0, 1, 2, 2]]
+        assert in_tolerance.tolist() == [[True, True, False, True]]
+    
+    def test_coverage(self):
+        """Test per-color coverage on a half gold, half red image"""
+        img_array = np.zeros((10, 10, 3), dtype=np.uint8)
+        img_array[:, :5] = (255, 188, 13)
+        img_array[:, 5:] = (255, 0, 0)
+        
+        coverage = self.palette.coverage(img_array)
+        
+        assert coverage["golden_arches"] == pytest.approx(0.5)
+        assert coverage["off_palette"] == pytest.approx(0.5)
+        assert coverage["white"] == 0.0
+    
+    def test_lut_cached_on_disk_and_reused(self, tmp_path, monkeypatch):
+        """Test the compiled palette is reused until palette settings change"""
+        from app.rule_engine import palette as palette_module
+        from app.core.config import settings
+        
+        monkeypatch.setattr(settings, "cache_dir", str(tmp_path))
+        monkeypatch.setattr(palette_module, "_compiled_palette", None)
+        
+        first = get_compiled_palette()
+        assert get_compiled_palette() is first
+        assert len(list(tmp_path.glob("palette_lut_*.npy"))) == 1
+        
+        monkeypatch.setattr(settings, "color_tolerance", settings.color_tolerance + 5)
+        second = get_compiled_palette()
+        assert second is not first
+        assert len(list(tmp_path.glob("palette_lut_*.npy"))) == 2
+        
+        monkeypatch.setattr(palette_module, "_compiled_palette", None)
+        reloaded = get_compiled_palette()
+        assert np.array_equal(reloaded.lut, second.lut)
 
 
 class TestGeometryChecker:
@@ -129,6 +617,126 @@ class TestGeometryChecker:
         assert "aspect_ratio" in result
         assert result["aspect_ratio"] >= 0
     
+    def test_geometry_batch_matches_single_image_results(self):
+        """Test the geometry batch API returns the single-image results"""
+        images = []
+        for angle in (0, 30):
+            img_array = np.zeros((200, 200, 3), dtype=np.uint8)
+            box = cv2.boxPoints(((100, 100), (120, 60), angle)).astype(np.int32)
+            cv2.fillPoly(img_array, [box], (255, 188, 13))
+            images.append(img_array)
+        
+        batch_results = self.checker.check_geometry_compliance_batch(np.stack(images))
+        
+        assert batch_results == [self.checker.check_geometry_compliance(image) for image in images]
+    
+    def test_geometry_pyramid_mode(self):
+        """Test geometry pyramid mode reports the deciding level in full-resolution pixels"""
+        def rotated_box(angle):
+            img_array = np.zeros((1024, 1024, 3), dtype=np.uint8)
+            box = cv2.boxPoints(((512, 512), (240, 480), angle)).astype(np.int32)
+            cv2.fillPoly(img_array, [box], (255, 188, 13))
+            return img_array
+        
+        clear = rotated_box(30)
+        full = self.checker.check_geometry_compliance(clear)
+        
+        self.checker.pyramid_mode = True
+        coarse = self.checker.check_geometry_compliance(clear)
+        
+        assert coarse["pyramid_level"] == 2
+        assert coarse["rotation_angle"] == pytest.approx(full["rotation_angle"], abs=1.0)
+        assert coarse["contour_area"] == pytest.approx(full["contour_area"], rel=0.02)
+        assert coarse["bounding_box"] == pytest.approx(full["bounding_box"], abs=8)  # Two level-2 pixels
+        
+        # Rotation right at max_rotation_degrees escalates to full resolution
+        marginal = self.checker.check_geometry_compliance(rotated_box(self.checker.max_rotation_degrees))
+        assert marginal["pyramid_level"] == 0
+        
+        # The batch API runs the same pyramid analysis
+        assert self.checker.check_geometry_compliance_batch(np.stack([clear, rotated_box(79)])) == [
+            coarse, self.checker.check_geometry_compliance(rotated_box(79))
+        ]
+    
+    def test_multiple_logos_analyzed_in_one_pass(self):
+        """Test every logo instance gets its own result and the aggregate reports the worst one"""
+        def draw(img_array, center, size, angle):
+            box = cv2.boxPoints((center, size, angle)).astype(np.int32)
+            cv2.fillPoly(img_array, [box], (255, 188, 13))
+        
+        img_array = np.zeros((400, 800, 3), dtype=np.uint8)
+        draw(img_array, (200, 200), (200, 170), 0)
+        draw(img_array, (600, 200), (150, 120), 30)
+        
+        result = self.checker.check_geometry_compliance(img_array)
+        
+        assert result["logo_count"] == 2
+        main, rotated = result["logos"]
+        assert {k: result[k] for k in main} == main
+        assert main["contour_area"] > rotated["contour_area"]
+        assert rotated["bounding_box"][0] > 400
+        
+        # Each instance matches a single-logo analysis of its own half of the image
+        for logo, half in ((main, img_array[:, :400]), (rotated, img_array[:, 400:])):
+            single = self.checker.check_geometry_compliance(np.ascontiguousarray(half))
+            assert single["logo_count"] == 1
+            assert single["rotation_angle"] == pytest.approx(logo["rotation_angle"])
+            assert single["geometry_score"] == pytest.approx(logo["geometry_score"])
+        
+        aggregate = result["aggregate"]
+        assert aggregate["geometry_score"] == min(main["geometry_score"], rotated["geometry_score"])
+        rotated_logos = sum(logo["rotation_angle"] > self.checker.max_rotation_degrees for logo in result["logos"])
+        assert aggregate["rotated_logos"] == rotated_logos > 0
+        assert aggregate["max_rotation_angle"] == max(main["rotation_angle"], rotated["rotation_angle"])
+        
+        recommendations = self.checker.get_geometry_recommendations(result)
+        assert any(f"2 logos detected ({rotated_logos} rotated" in r for r in recommendations)
+        
+        self.checker.max_logo_instances = 1
+        assert self.checker.check_geometry_compliance(img_array)["logo_count"] == 1
+    
+    def test_compliance_rules_check_every_logo(self):
+        """Test a rotated or flipped secondary logo is a violation even when the main logo complies"""
+        img_array = np.zeros((400, 800, 3), dtype=np.uint8)
+        for center, size, angle in (((200, 200), (170, 200), 0), ((600, 200), (150, 120), 30)):
+            cv2.fillPoly(img_array, [cv2.boxPoints((center, size, angle)).astype(np.int32)], (255, 188, 13))
+        result = self.checker.check_geometry_compliance(img_array)
+        
+        assert result["rotation_angle"] <= settings.max_rotation_degrees
+        assert [violation["rule"] for violation in check_no_rotation(result)["violations"]] == ["no_rotation"]
+        
+        secondary_flipped = {"is_flipped": False, "aggregate": {"flipped_logos": 1}}
+        assert [violation["rule"] for violation in check_no_flipping(secondary_flipped)["violations"]] == ["no_flipping"]
+        assert not check_no_flipping({"is_flipped": False, "aggregate": {"flipped_logos": 0}})["violations"]
+        
+        # Analyses without an aggregate fall back to the main logo
+        assert check_no_rotation({"rotation_angle": 30.0})["violations"]
+        assert check_no_flipping({"is_flipped": True})["violations"]
+        assert not check_no_flipping({"is_flipped": False})["violations"]
+    
+    def test_localized_geometry_matches_full_resolution(self):
+        """Test large images are localized on a small copy and refined at full resolution"""
+        img_array = np.full((1500, 2400, 3), 30, dtype=np.uint8)
+        box = cv2.boxPoints(((1500, 600), (360, 300), 12)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], (13, 188, 255))
+        cv2.ellipse(img_array, (500, 1000), (150, 90), 30, 0, 300, (13, 188, 255), -1)
+        cv2.rectangle(img_array, (1720, 0), (1760, 1499), (13, 188, 255), -1)  # Thin bar, cut by the logo region
+        
+        self.checker.localization_size = 0
+        full = self.checker.check_geometry_compliance(img_array)
+        self.checker.localization_size = 600
+        localized = self.checker.check_geometry_compliance(img_array)
+        
+        assert localized["localized_regions"] == 2
+        assert localized["logo_count"] == full["logo_count"]
+        for logo, reference in zip(localized["logos"], full["logos"]):
+            assert logo["bounding_box"] == pytest.approx(reference["bounding_box"], abs=1)
+            assert logo["contour_area"] == pytest.approx(reference["contour_area"], rel=0.01)
+            assert logo["rotation_angle"] == pytest.approx(reference["rotation_angle"], abs=0.5)
+            assert logo["aspect_ratio"] == pytest.approx(reference["aspect_ratio"], rel=0.01)
+        
+        assert self.checker.check_geometry_compliance_batch([img_array]) == [localized]
+    
     def test_geometry_recommendations(self):
         """Test geometry recommendations generation"""
         # Create a normal image
@@ -139,4 +747,798 @@ class TestGeometryChecker:
         recommendations = self.checker.get_geometry_recommendations(analysis)
         
         assert isinstance(recommendations, list)
-        assert len(recommendations) > 0 
\ No newline at end of file
+        assert len(recommendations) > 0
+    
+    def test_contour_feature_table_matches_opencv(self):
+        """Test the vectorized contour features agree with the per-contour OpenCV calls"""
+        rng = np.random.default_rng(7)
+        img_array = np.zeros((400, 400), dtype=np.uint8)
+        for _ in range(60):
+            center = tuple(int(v) for v in rng.integers(20, 380, 2))
+            axes = tuple(int(v) for v in rng.integers(2, 25, 2))
+            cv2.ellipse(img_array, center, axes, float(rng.uniform(0, 180)), 0, 360, 255, -1)
+        img_array[5, 5] = img_array[5, 6] = 255  # Degenerate zero-area contour
+        contours, _ = cv2.findContours(img_array, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        
+        table = ContourFeatureTable(contours)
+        
+        assert len(table) == len(contours)
+        assert table.areas == pytest.approx([cv2.contourArea(c) for c in contours])
+        assert table.perimeters == pytest.approx([cv2.arcLength(c, True) for c in contours])
+        assert table.bounding_rects.tolist() == [list(cv2.boundingRect(c)) for c in contours]
+        for centroid, contour in zip(table.centroids, contours):
+            moments = cv2.moments(contour)
+            if moments["m00"]:
+                assert centroid == pytest.approx((moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]))
+            else:
+                assert np.isnan(centroid).all()
+        
+        large = table.subset(np.flatnonzero(table.areas > 100))
+        assert large.hull_areas == pytest.approx([cv2.contourArea(cv2.convexHull(c)) for c in large.contours])
+        assert large.ellipses[:, 4] == pytest.approx([cv2.fitEllipse(c)[2] for c in large.contours])
+        assert ContourFeatureTable([]).areas.shape == (0,)
+        assert bounding_rects(contours).tolist() == table.bounding_rects.tolist()
+        assert bounding_rects([]).shape == (0, 4)
+    
+    def test_bounding_box_prefilter_keeps_every_logo_candidate(self):
+        """Test contours dropped by bounding box alone would also fail the full filter"""
+        rng = np.random.default_rng(11)
+        noise = rng.integers(0, 256, (201, 201), dtype=np.uint8)
+        gray = cv2.resize(noise, (600, 600), interpolation=cv2.INTER_CUBIC)
+        border = cv2.boxPoints(((300, 300), (280, 160), 20)).astype(np.int32)
+        box = cv2.boxPoints(((300, 300), (240, 120), 20)).astype(np.int32)
+        cv2.fillPoly(gray, [border], 0)
+        cv2.fillPoly(gray, [box], 255)
+        cv2.line(gray, (20, 580), (580, 560), 255, 3)
+        
+        binary = ImageContext(gray).otsu_mask
+        contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        table = ContourFeatureTable(contours)
+        unfiltered = self.checker._filter_logo_contours(table, self.checker.min_logo_size)
+        kept = self.checker._bounding_box_mask(table.bounding_rects, self.checker.min_logo_size)
+        
+        detected = self.checker._detect_logo_contours(gray, binary=binary)
+        
+        assert kept.sum() < len(contours) / 10
+        assert len(detected) > 0
+        assert detected.bounding_rects.tolist() == unfiltered.bounding_rects.tolist()
+        assert detected.areas == pytest.approx(unfiltered.areas)
+    
+    def test_largest_candidate_analyzed_among_many_contours(self):
+        """Test the main logo is picked from many candidate contours"""
+        img_array = np.zeros((600, 600, 3), dtype=np.uint8)
+        box = cv2.boxPoints(((300, 300), (240, 120), 20)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], (255, 188, 13))
+        for x in range(20, 580, 40):
+            cv2.circle(img_array, (x, 30), 8, (255, 188, 13), -1)
+        
+        result = self.checker.check_geometry_compliance(img_array)
+        contour = max(self.checker._detect_logo_contours(to_gray(img_array)).contours, key=cv2.contourArea)
+        
+        assert result["bounding_box"] == cv2.boundingRect(contour)
+        assert result["contour_area"] == pytest.approx(cv2.contourArea(contour))
+        angle = cv2.fitEllipse(contour)[2]
+        assert result["rotation_angle"] == pytest.approx(abs(angle - 180 if angle > 90 else angle))
+
+def _matrix_trc_icc_profile(description, red, green, blue, gamma):
+    """Minimal ICC v2 RGB display profile from D50 colorants and a gamma curve"""
+    def xyz(values):
+        return b"XYZ \0\0\0\0" + b"".join(struct.pack(">i", round(v * 65536)) for v in values)
+    
+    curve = b"curv\0\0\0\0" + struct.pack(">IH", 1, round(gamma * 256)) + b"\0\0"
+    text = description.encode() + b"\0"
+    tags = [
+        (b"desc", b"desc\0\0\0\0" + struct.pack(">I", len(text)) + text + b"\0" * 79),
+        (b"wtpt", xyz((0.9642, 1.0, 0.8249))),
+        (b"rXYZ", xyz(red)), (b"gXYZ", xyz(green)), (b"bXYZ", xyz(blue)),
+        (b"rTRC", curve), (b"gTRC", curve), (b"bTRC", curve),
+        (b"cprt", b"text\0\0\0\0" + b"none\0\0\0\0"),
+    ]
+    
+    offset = 128 + 4 + 12 * len(tags)
+    table, data = b"", b""
+    for signature, body in tags:
+        body += b"\0" * (-len(body) % 4)
+        table += signature + struct.pack(">II", offset + len(data), len(body))
+        data += body
+    size = offset + len(data)
+    
+    header = struct.pack(">I4sI4s4s4s12s4s", size, b"\0" * 4, 0x02100000, b"mntr", b"RGB ", b"XYZ ", b"\0" * 12, b"acsp")
+    header += b"\0" * 24 + struct.pack(">I", 0) + xyz((0.9642, 1.0, 0.8249))[8:]
+    header += b"\0" * (128 - len(header))
+    return header + struct.pack(">I", len(tags)) + table + data
+
+
+ADOBE_RGB_PROFILE = _matrix_trc_icc_profile(
+    "Adobe RGB (1998)",
+    red=(0.60974, 0.31111, 0.01947), green=(0.20528, 0.62567, 0.06087), blue=(0.14919, 0.06322, 0.74457),
+    gamma=563 / 256
+)
+
+
+class TestImageDecoding:
+    """Test color-managed, orientation-aware decoding of uploads"""
+    
+    def setup_method(self):
+        get_icc_transform_cache().clear()
+    
+    def _encode_png(self, image, **params):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", **params)
+        return buffer.getvalue()
+    
+    def test_embedded_profile_converted_to_srgb(self):
+        """Adobe RGB values are converted to sRGB with a cached transform"""
+        gold = Image.new("RGB", (40, 30), (255, 188, 13))
+        adobe_profile = ImageCms.ImageCmsProfile(io.BytesIO(ADOBE_RGB_PROFILE))
+        srgb_to_adobe = ImageCms.buildTransform(ImageCms.createProfile("sRGB"), adobe_profile, "RGB", "RGB")
+        adobe_gold = ImageCms.applyTransform(gold, srgb_to_adobe)
+        assert max(abs(a - b) for a, b in zip(adobe_gold.getpixel((0, 0)), (255, 188, 13))) > 10
+        
+        data = self._encode_png(adobe_gold, icc_profile=ADOBE_RGB_PROFILE)
+        for _ in range(3):
+            decoded = decode_image(data)
+            assert decoded.shape == (30, 40, 3)
+            assert decoded[0, 0].tolist() == pytest.approx([13, 188, 255], abs=2)  # BGR
+        
+        stats = get_icc_transform_cache().stats()
+        assert (stats["entries"], stats["misses"], stats["hits"]) == (1, 1, 2)
+        
+        # Without the profile the stored values are taken as sRGB
+        adobe_gold.info.pop("icc_profile", None)
+        untagged = decode_image(self._encode_png(adobe_gold))
+        assert untagged[0, 0].tolist() == list(adobe_gold.getpixel((0, 0)))[::-1]
+    
+    def test_srgb_profile_skips_conversion(self):
+        """sRGB-tagged images keep their stored values, alpha included"""
+        image = Image.new("RGBA", (20, 10), (255, 188, 13, 128))
+        srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+        
+        decoded = decode_image(self._encode_png(image, icc_profile=srgb))
+        
+        assert decoded[0, 0].tolist() == [13, 188, 255, 128]
+        assert get_icc_transform_cache().stats()["entries"] == 1
+    
+    @pytest.mark.parametrize("orientation", range(1, 9))
+    def test_exif_orientation_applied(self, orientation):
+        """Decoded pixels match PIL's EXIF transpose for every orientation"""
+        pixels = np.random.RandomState(orientation).randint(0, 256, (24, 40, 3), dtype=np.uint8)
+        image = Image.fromarray(pixels)
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", exif=exif)
+        
+        decoded = decode_image(buffer.getvalue())
+        
+        expected = np.asarray(ImageOps.exif_transpose(Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")))
+        assert np.array_equal(decoded[..., ::-1], expected)
+
+
+def _minimal_ai_file(content):
+    """Single-page PDF (the format .ai files embed) with a Flate-compressed content stream"""
+    stream = zlib.compress(content.encode())
+    objects = [
+        b"<</Type/Catalog/Pages 2 0 R>>",
+        b"<</Type/Pages/Kids[3 0 R]/Count 1>>",
+        b"<</Type/Page/Parent 2 0 R/MediaBox[0 0 400 400]/Contents 4 0 R>>",
+        b"<</Filter/FlateDecode/Length %d>>stream\r\n" % len(stream) + stream + b"\r\nendstream",
+    ]
+    return b"%PDF-1.6\r" + b"".join(
+        b"%d 0 obj\r" % number + body + b"\rendobj\r" for number, body in enumerate(objects, 1)
+    ) + b"trailer<</Root 1 0 R>>\r%%EOF"
+
+
+# An asymmetric hooked arch on a white background rectangle
+HOOK_MARK_CONTENT = """
+/CS0 cs 1 scn
+0 0 400 400 re
+f
+q 1 0 0 1 100 80 cm
+0 0 m
+0 160 l
+0 220 60 240 100 240 c
+140 240 180 210 180 170 c
+180 120 l
+140 120 l
+140 170 l
+140 190 120 200 100 200 c
+70 200 40 190 40 160 c
+40 0 l
+h
+f
+Q
+BT /T1 12 Tf (ignored) Tj ET
+"""
+
+
+class TestReferenceShapeIndex:
+    """Test the reference-shape descriptor index and its use by the geometry checker"""
+    
+    def _scene(self, mask, angle=0.0, flip=False):
+        mask = cv2.flip(mask, 1) if flip else mask
+        height, width = mask.shape
+        size = int(max(height, width) * 1.6)
+        canvas = np.zeros((size, size), dtype=np.uint8)
+        canvas[(size - height) // 2:(size - height) // 2 + height, (size - width) // 2:(size - width) // 2 + width] = mask
+        rotation = cv2.getRotationMatrix2D((size / 2, size / 2), -angle, 1)  # Clockwise on screen
+        canvas = cv2.warpAffine(canvas, rotation, (size, size))
+        img_array = np.zeros((size, size, 3), dtype=np.uint8)
+        img_array[canvas > 127] = (13, 188, 255)
+        return img_array
+    
+    def _largest_contour(self, img_array):
+        contours, _ = cv2.findContours(ImageContext(img_array).otsu_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return max(contours, key=cv2.contourArea)
+    
+    def test_outlines_read_from_ai_file(self):
+        """Test filled paths are read from the content stream, text and painting state ignored"""
+        outlines, media_box = read_ai_outlines(_minimal_ai_file(HOOK_MARK_CONTENT))
+        
+        assert media_box == (0.0, 0.0, 400.0, 400.0)
+        assert len(outlines) == 2
+        background, hook = outlines
+        assert background.subpaths[0].tolist() == [[0, 0], [400, 0], [400, 400], [0, 400]]
+        
+        # The cm translation is applied and curves are flattened
+        points = hook.subpaths[0]
+        assert points.min(axis=0).tolist() == [100, 80]
+        assert points.max(axis=0).tolist() == pytest.approx([280, 320], abs=1.0)
+        assert len(points) > 20
+        
+        mask = render_path(hook, 200)
+        assert max(mask.shape) == 200
+        assert mask[-2, 5] == 255 and mask[-2, -5] == 0  # The long leg is on the left, y points down
+    
+    def test_index_built_saved_and_memory_mapped(self, tmp_path):
+        """Test the builder skips convex outlines and the saved index is memory-mapped"""
+        (tmp_path / "Hook.ai").write_bytes(_minimal_ai_file(HOOK_MARK_CONTENT))
+        
+        index = build_shape_index([str(tmp_path)])
+        index.save(str(tmp_path / "shape_index.npy"))
+        loaded = ShapeIndex.load(str(tmp_path / "shape_index.npy"))
+        
+        assert index.marks == ["Hook#1"]  # The background rectangle is too convex to identify anything
+        assert index.groups == ["approved"]
+        assert len(loaded.entries) == 2 * shape_index.SIGNATURE_BINS
+        assert isinstance(loaded.entries, np.memmap)
+        assert loaded.digest == index.digest
+    
+    @pytest.mark.parametrize("angle, flip", [(0, False), (30, False), (-60, False), (0, True), (120, True)])
+    def test_rotation_and_mirroring_recovered(self, angle, flip):
+        """Test a rendered mark is matched with its rotation and mirroring"""
+        outlines, _ = read_ai_outlines(_minimal_ai_file(HOOK_MARK_CONTENT))
+        index = ShapeIndex(shape_index._variant_rows("Hook", 0, self._largest_contour(
+            self._scene(render_path(outlines[1], 300))
+        )))
+        
+        matches = index.match([self._largest_contour(self._scene(render_path(outlines[1], 180), angle, flip))])
+        
+        assert matches.marks == ["Hook"]
+        assert matches.distances[0] < settings.shape_match_max_distance
+        assert bool(matches.mirrored[0]) == flip
+        assert matches.rotations[0] == pytest.approx(angle, abs=3.0)
+    
+    def test_geometry_checker_uses_reference_matches(self, tmp_path, monkeypatch):
+        """Test recognized marks get rotation and flipping from the index; other shapes keep the heuristics"""
+        (tmp_path / "Hook.ai").write_bytes(_minimal_ai_file(HOOK_MARK_CONTENT))
+        build_shape_index([str(tmp_path)]).save(str(tmp_path / "shape_index.npy"))
+        monkeypatch.setattr(settings, "shape_index_path", str(tmp_path / "shape_index.npy"))
+        
+        outlines, _ = read_ai_outlines(_minimal_ai_file(HOOK_MARK_CONTENT))
+        flipped = self._scene(render_path(outlines[1], 300), angle=20, flip=True)
+        
+        checker = GeometryChecker()
+        result = checker.check_geometry_compliance(flipped)
+        
+        assert result["reference_match"]["mark"] == "Hook#1"
+        assert result["is_flipped"] is True
+        assert result["rotation_angle"] == pytest.approx(20, abs=3.0)
+        
+        box = np.zeros((300, 300, 3), dtype=np.uint8)
+        cv2.fillPoly(box, [np.array([[50, 50], [250, 50], [250, 200], [150, 120], [50, 200]], dtype=np.int32)], (13, 188, 255))
+        assert checker.check_geometry_compliance(box)["reference_match"] is None
+
+
+class TestRuleExecutor:
+    """Test the rule registry and the dependency-ordered executor"""
+    
+    def _registry(self, calls):
+        registry = RuleRegistry()
+        barrier = threading.Barrier(2, timeout=5)
+        
+        @registry.rule("gray", consumes=("image",), produces=("gray",))
+        def gray(image):
+            calls.append("gray")
+            return {"gray": image.mean(axis=2)}
+        
+        # Both checks wait for each other, so they only finish if they run concurrently
+        @registry.rule("bright", consumes=("gray",))
+        def bright(gray):
+            barrier.wait()
+            return {"value": float(gray.max())}
+        
+        @registry.rule("dark", consumes=("gray",))
+        def dark(gray):
+            barrier.wait()
+            return {"value": float(gray.min())}
+        
+        return registry
+    
+    def test_shared_artifact_computed_once_and_independent_rules_run_concurrently(self):
+        """Test consumers share one producer call and run on the worker pool together"""
+        calls = []
+        image = np.arange(12, dtype=np.uint8).reshape(2, 2, 3)
+        
+        execution = RuleExecutor(self._registry(calls), max_workers=2).run({"image": image})
+        
+        assert calls == ["gray"]
+        assert execution.outputs["bright"] == {"value": 10.0}
+        assert execution.outputs["dark"] == {"value": 1.0}
+        assert set(execution.timings_ms) == {"gray", "bright", "dark"}
+        assert not execution.errors and not execution.skipped
+    
+    def test_available_artifacts_are_not_recomputed(self):
+        """Test producers of input artifacts are left out of the plan"""
+        calls = []
+        registry = self._registry(calls)
+        executor = RuleExecutor(registry, max_workers=2)
+        
+        assert [rule.name for rule in executor.plan({"image"})] == ["gray", "bright", "dark"]
+        assert [rule.name for rule in executor.plan({"gray"})] == ["bright", "dark"]
+        assert [rule.name for rule in executor.plan({"image"}, targets=["gray"])] == ["gray"]
+        
+        execution = executor.run({"gray": np.array([[3.0, 7.0]])})
+        assert calls == []
+        assert execution.outputs["bright"] == {"value": 7.0}
+    
+    def test_invalid_graphs_are_rejected(self):
+        """Test missing producers, duplicate producers and cycles"""
+        registry = RuleRegistry()
+        registry.add(Rule("a", lambda b: {"a": b}, consumes=("b",), produces=("a",)))
+        registry.add(Rule("b", lambda a: {"b": a}, consumes=("a",), produces=("b",)))
+        
+        with pytest.raises(ValueError, match="cycle"):
+            RuleExecutor(registry).plan(set())
+        with pytest.raises(ValueError, match="already produced"):
+            registry.add(Rule("c", lambda: {"a": 1}, produces=("a",)))
+        with pytest.raises(ValueError, match="No rule produces artifact 'image'"):
+            RuleExecutor(self._registry([])).plan(set())
+    
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_failed_rule_skips_its_dependents(self, max_workers):
+        """Test a failing rule is recorded and rules consuming its artifacts are skipped"""
+        registry = RuleRegistry()
+        
+        @registry.rule("broken", produces=("mask",))
+        def broken():
+            raise RuntimeError("no mask")
+        
+        registry.add(Rule("uses_mask", lambda mask: {}, consumes=("mask",), produces=("area",)))
+        registry.add(Rule("uses_area", lambda area: {}, consumes=("area",)))
+        registry.add(Rule("independent", lambda: {"ok": True}))
+        
+        execution = RuleExecutor(registry, max_workers=max_workers).run({})
+        
+        assert execution.errors == {"broken": "no mask"}
+        assert sorted(execution.skipped) == ["uses_area", "uses_mask"]
+        assert execution.outputs == {"independent": {"ok": True}}
+    
+    def test_compliance_rules_on_an_image(self):
+        """Test the registered brand rules run from an image context"""
+        img_array = np.zeros((300, 300, 3), dtype=np.uint8)
+        box = cv2.boxPoints(((150, 150), (160, 100), 20)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], (13, 188, 255))
+        
+        execution = RuleExecutor(compliance_rules, max_workers=4).run({"image_context": ImageContext(img_array)})
+        
+        assert not execution.errors
+        assert set(execution.timings_ms) == {rule.name for rule in compliance_rules}
+        assert execution.artifacts["geometry_analysis"]["logo_count"] == 1
+        assert execution.outputs["gold_color_only"] == {"violations": [], "recommendations": []}
+        rotation = execution.outputs["no_rotation"]["violations"]
+        assert [violation["rule"] for violation in rotation] == ["no_rotation"]
+        assert execution.outputs["no_rotation"]["recommendations"]
+    
+    def _versioned_registry(self, calls, flip_version="1"):
+        registry = RuleRegistry()
+        
+        @registry.rule("gray", consumes=("image",), produces=("gray",))
+        def gray(image):
+            calls.append("gray")
+            return {"gray": image.mean(axis=2)}
+        
+        @registry.rule("rotation", consumes=("gray",), parameters=("max_rotation_degrees",))
+        def rotation(gray):
+            calls.append("rotation")
+            # Reused artifacts come back from the stored JSON as lists
+            return {"over": bool(np.max(gray) > settings.max_rotation_degrees)}
+        
+        @registry.rule("flip", consumes=("gray",), version=flip_version)
+        def flip(gray):
+            calls.append("flip")
+            return {"flipped": False}
+        
+        return registry
+    
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_only_changed_rules_are_recomputed(self, monkeypatch, max_workers):
+        """Test a stored run's outputs are reused for rules with unchanged version, parameters and inputs"""
+        calls = []
+        inputs = {"image": np.full((2, 2, 3), 4, dtype=np.uint8)}
+        fingerprints = {"image": "image-sha"}
+        executor = RuleExecutor(self._versioned_registry(calls), max_workers=max_workers)
+        
+        first = executor.run(inputs, fingerprints=fingerprints)
+        assert sorted(calls) == ["flip", "gray", "rotation"]
+        assert first.reused == [] and first.evaluations_avoided == 0
+        assert first.provenance["rotation"]["parameters"] == {"max_rotation_degrees": settings.max_rotation_degrees}
+        assert first.provenance["rotation"]["inputs"] == {"gray": first.fingerprints["gray"]}
+        # Stored records come back from the result cache as JSON
+        record = json.loads(json.dumps(first.record(), default=lambda value: value.tolist()))
+        
+        calls.clear()
+        again = executor.run(inputs, fingerprints=fingerprints, previous=record)
+        assert calls == [] and again.evaluations_avoided == 3
+        assert again.outputs["rotation"] == first.outputs["rotation"]
+        
+        # A changed parameter recomputes the rules reading it, on the stored artifacts
+        monkeypatch.setattr(settings, "max_rotation_degrees", 3.0)
+        assert executor.plan_reanalysis(inputs, fingerprints, record) == {
+            "reuse": ["gray", "flip"], "recompute": ["rotation"]
+        }
+        calls.clear()
+        changed = executor.run(inputs, fingerprints=fingerprints, previous=record)
+        assert calls == ["rotation"] and sorted(changed.reused) == ["flip", "gray"]
+        assert changed.outputs["rotation"] == {"over": True}
+        
+        # So does a new rule version
+        calls.clear()
+        RuleExecutor(self._versioned_registry(calls, flip_version="2"), max_workers=max_workers).run(
+            inputs, fingerprints=fingerprints, previous=changed.record()
+        )
+        assert calls == ["flip"]
+        
+        # Other content, or content without a fingerprint, is never reused
+        calls.clear()
+        executor.run(inputs, fingerprints={"image": "other-sha"}, previous=record)
+        executor.run(inputs, previous=record)
+        assert calls.count("gray") == 2
+    
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_reused_rules_settle_past_the_deadline(self, monkeypatch, max_workers):
+        """Test a spent deadline still reuses unchanged rules and only leaves the changed ones pending"""
+        calls = []
+        inputs = {"image": np.full((2, 2, 3), 4, dtype=np.uint8)}
+        fingerprints = {"image": "image-sha"}
+        executor = RuleExecutor(self._versioned_registry(calls), max_workers=max_workers)
+        first = executor.run(inputs, fingerprints=fingerprints)
+        
+        monkeypatch.setattr(settings, "max_rotation_degrees", 3.0)
+        calls.clear()
+        late = executor.run(
+            inputs, fingerprints=fingerprints, previous=first.record(), deadline=time.perf_counter() - 1.0
+        )
+        
+        assert calls == []
+        assert sorted(late.reused) == ["flip", "gray"]
+        assert late.pending == ["rotation"]
+    
+    def test_concurrent_runs_share_cost_estimates(self):
+        """Test runs on one executor from several threads all update the shared cost estimates"""
+        calls = []
+        executor = RuleExecutor(self._versioned_registry(calls), max_workers=4)
+        inputs = {"image": np.full((2, 2, 3), 4, dtype=np.uint8)}
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            executions = list(pool.map(lambda _: executor.run(inputs), range(32)))
+        
+        assert all(not execution.errors and not execution.pending for execution in executions)
+        assert len(calls) == 3 * 32
+        assert sorted(executor.cost_estimates) == ["flip", "gray", "rotation"]
+        assert all(estimate > 0 for estimate in executor.cost_estimates.values())
+    
+    def test_heritage_first_reuses_unchanged_rules(self):
+        """Test both heritage-first passes reuse a stored compliance run"""
+        img_array = np.zeros((300, 300, 3), dtype=np.uint8)
+        box = cv2.boxPoints(((150, 150), (160, 100), 20)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], (13, 188, 255))
+        inputs = {"image_context": ImageContext(img_array)}
+        fingerprints = {"image_context": content_digest(img_array.tobytes())}
+        executor = RuleExecutor(compliance_rules, max_workers=4)
+        
+        first = run_compliance_rules(executor, inputs, heritage_first=True, fingerprints=fingerprints)
+        record = json.loads(json.dumps(first.record(), default=lambda value: value.tolist()))
+        again = run_compliance_rules(
+            executor, inputs, heritage_first=True, fingerprints=fingerprints, previous=record
+        )
+        
+        assert not again.timings_ms
+        assert sorted(again.reused) == sorted(rule.name for rule in compliance_rules)
+        assert again.outputs["no_rotation"] == record["outputs"]["no_rotation"]
+    
+    def test_decisive_rules_run_first_and_deadline_leaves_the_rest_pending(self):
+        """Test weightier rules per expected second start first and none start past the deadline"""
+        calls = []
+        registry = RuleRegistry()
+        registry.add(Rule("slow_step", lambda: calls.append("slow_step") or {"mask": 1}, produces=("mask",), weight=0.0))
+        registry.add(Rule("minor", lambda mask: calls.append("minor") or {}, consumes=("mask",)))
+        registry.add(Rule("cheap", lambda: calls.append("cheap") or {}))
+        registry.add(Rule("critical", lambda: calls.append("critical") or {}, weight=3.0))
+        executor = RuleExecutor(registry, max_workers=1)
+        executor.cost_estimates.update({"slow_step": 10.0, "minor": 1e-3, "cheap": 1e-3, "critical": 1e-3})
+        
+        execution = executor.run({}, deadline=time.perf_counter() + 1.0)
+        assert calls == ["critical", "cheap"]
+        assert execution.pending == ["slow_step", "minor"]
+        assert executor.cost_estimates["slow_step"] == 10.0
+        
+        calls.clear()
+        rest = executor.run(execution.artifacts, targets=execution.pending)
+        assert calls == ["slow_step", "minor"] and rest.pending == []
+        assert executor.cost_estimates["slow_step"] < 10.0
+        
+        calls.clear()
+        spent = executor.run({}, deadline=time.perf_counter() - 1.0)
+        assert calls == [] and spent.pending == ["slow_step", "cheap", "critical", "minor"]
+    
+    def test_new_rule_expected_to_take_the_mean_known_time(self):
+        """Test a rule without a cost estimate is not started when the mean known run time does not fit"""
+        calls = []
+        registry = RuleRegistry()
+        registry.add(Rule("new", lambda: calls.append("new") or {}))
+        executor = RuleExecutor(registry, max_workers=1)
+        executor.cost_estimates.update({"slow": 10.0, "slower": 20.0})
+        
+        execution = executor.run({}, deadline=time.perf_counter() + 1.0)
+        assert calls == [] and execution.pending == ["new"]
+        
+        assert executor.run({}, deadline=time.perf_counter() + 60.0).pending == []
+        assert calls == ["new"]
+    
+    def test_pending_compliance_rules_completed_later(self):
+        """Test a spent deadline leaves every rule pending and completing runs them heritage first"""
+        img_array = np.zeros((300, 300, 3), dtype=np.uint8)
+        box = cv2.boxPoints(((150, 150), (160, 100), 20)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], (13, 188, 255))
+        executor = RuleExecutor(compliance_rules, max_workers=4)
+        
+        execution = run_compliance_rules(
+            executor, {"image_context": ImageContext(img_array)}, heritage_first=True,
+            deadline=time.perf_counter() - 1.0
+        )
+        assert not execution.outputs
+        assert sorted(execution.pending) == sorted(rule.name for rule in compliance_rules)
+        
+        complete = complete_compliance_rules(executor, execution, heritage_first=True)
+        assert complete.pending == [] and not complete.errors
+        assert set(complete.outputs) == {rule.name for rule in compliance_rules}
+        assert [violation["rule"] for violation in complete.outputs["no_rotation"]["violations"]] == ["no_rotation"]
+
+
+class TestHeritageRouting:
+    """Test heritage marks are classified first and skip the Golden Arches rules"""
+    
+    @pytest.fixture
+    def heritage_index(self, tmp_path, monkeypatch):
+        """Shape index of a heritage mark (the hook outline)"""
+        (tmp_path / "Hook.ai").write_bytes(_minimal_ai_file(HOOK_MARK_CONTENT))
+        build_shape_index([], heritage_paths=[str(tmp_path)]).save(str(tmp_path / "shape_index.npy"))
+        monkeypatch.setattr(settings, "shape_index_path", str(tmp_path / "shape_index.npy"))
+    
+    def _hook_image(self, bgr):
+        outlines, _ = read_ai_outlines(_minimal_ai_file(HOOK_MARK_CONTENT))
+        mask = render_path(outlines[1], 300)
+        img_array = np.full((400, 400, 3), 255, dtype=np.uint8)
+        canvas = img_array[50:50 + mask.shape[0], 50:50 + mask.shape[1]]
+        canvas[mask > 127] = bgr
+        return img_array
+    
+    def _heritage_image(self):
+        # The heritage hook in Pantone 2035 C red (BGR) on white
+        return self._hook_image((28, 0, 220))
+    
+    def _heritage_colored_boxes(self):
+        # Pantone 2035 C red and 2728 C blue on white, but no heritage outline
+        img_array = np.full((400, 600, 3), 255, dtype=np.uint8)
+        img_array[50:250, 50:550] = (28, 0, 220)
+        img_array[280:350, 100:500] = (187, 71, 0)
+        return img_array
+    
+    def _golden_arches_image(self, bgr=(13, 188, 255), background=(7, 0, 219)):
+        img_array = np.full((300, 300, 3), background, dtype=np.uint8)
+        box = cv2.boxPoints(((150, 150), (160, 100), 20)).astype(np.int32)
+        cv2.fillPoly(img_array, [box], bgr)
+        return img_array
+    
+    def test_heritage_classification(self, heritage_index):
+        """Test heritage colors and a matching heritage outline decide the classification"""
+        checker = HeritageChecker()
+        
+        heritage = checker.check_heritage(self._heritage_image())
+        boxes = checker.check_heritage(self._heritage_colored_boxes())
+        golden = checker.check_heritage(self._golden_arches_image())
+        
+        assert heritage["is_heritage"]
+        assert heritage["heritage_shape_match"]["mark"] == "Hook#1"
+        assert heritage["heritage_shape_match"]["group"] == "heritage"
+        assert list(heritage["heritage_colors"]) == ["pantone_2035c"]
+        assert not boxes["is_heritage"] and boxes["heritage_shape_match"] is None
+        assert list(boxes["heritage_colors"]) == ["pantone_2035c", "pantone_2728c"]
+        assert boxes["heritage_coverage"] == pytest.approx(0.533, abs=0.02)
+        assert not golden["is_heritage"]
+        assert golden["golden_arches_coverage"] > 0.1
+        assert not checker.check_heritage(np.zeros((50, 50), dtype=np.uint8))["is_heritage"]
+    
+    def test_no_heritage_without_shape_index(self, tmp_path, monkeypatch):
+        """Test heritage colors alone are not enough evidence to skip the Golden Arches rules"""
+        monkeypatch.setattr(settings, "shape_index_path", str(tmp_path / "missing.npy"))
+        
+        classification = HeritageChecker().check_heritage(self._heritage_image())
+        
+        assert not classification["is_heritage"]
+        assert classification["heritage_coverage"] > 0.05
+    
+    def test_approved_outline_in_heritage_colors_is_not_heritage(self, tmp_path, monkeypatch):
+        """Test only heritage outlines of the index back a heritage classification"""
+        (tmp_path / "Hook.ai").write_bytes(_minimal_ai_file(HOOK_MARK_CONTENT))
+        build_shape_index([str(tmp_path)]).save(str(tmp_path / "shape_index.npy"))
+        monkeypatch.setattr(settings, "shape_index_path", str(tmp_path / "shape_index.npy"))
+        
+        # A current mark printed in heritage red still runs the Golden Arches rules
+        execution = run_compliance_rules(
+            RuleExecutor(compliance_rules), {"image_context": ImageContext(self._heritage_image())}
+        )
+        
+        assert not execution.artifacts["heritage_classification"]["is_heritage"]
+        assert execution.artifacts["heritage_classification"]["heritage_shape_match"] is None
+        assert execution.outputs["gold_color_only"]["violations"]
+    
+    @pytest.mark.parametrize("rgb, hook", [
+        ((255, 185, 25), False), ((255, 184, 29), False), ((231, 101, 0), False), ((45, 42, 38), False),
+        ((255, 184, 29), True)
+    ])
+    def test_off_gold_arches_get_gold_color_only(self, heritage_index, rgb, hook):
+        """Test off-gold logos, even in near-gold heritage colors, run the Golden Arches rules"""
+        bgr = rgb[::-1]
+        image = self._hook_image(bgr) if hook else self._golden_arches_image(bgr, background=(255, 255, 255))
+        
+        execution = run_compliance_rules(RuleExecutor(compliance_rules), {"image_context": ImageContext(image)})
+        
+        assert not execution.artifacts["heritage_classification"]["is_heritage"]
+        assert "pantone_1235c" not in execution.artifacts["heritage_classification"]["heritage_colors"]
+        violations = execution.outputs["gold_color_only"]["violations"]
+        assert [violation["rule"] for violation in violations] == ["gold_color_only"]
+    
+    def test_heritage_asset_skips_golden_arches_rules(self, heritage_index):
+        """Test a heritage classification stops the pipeline before color and geometry"""
+        executor = RuleExecutor(compliance_rules, max_workers=4)
+        
+        heritage = run_compliance_rules(executor, {"image_context": ImageContext(self._heritage_image())})
+        golden = run_compliance_rules(executor, {"image_context": ImageContext(self._golden_arches_image())})
+        
+        assert list(heritage.outputs) == [HERITAGE_RULE]
+        assert heritage.outputs[HERITAGE_RULE]["recommendations"] == [HERITAGE_RECOMMENDATION]
+        assert "geometry_analysis" not in heritage.artifacts
+        assert set(golden.timings_ms) == {rule.name for rule in compliance_rules}
+        assert not golden.artifacts["heritage_classification"]["is_heritage"]
+        assert golden.outputs["no_rotation"]["violations"]
+        
+        # Without heritage-first routing every rule runs
+        assert set(run_compliance_rules(executor, {"image_context": ImageContext(self._heritage_image())},
+                                        heritage_first=False).outputs) == {rule.name for rule in compliance_rules}
+        
+        # Without an image there is nothing to classify, and the Golden Arches checks run
+        analyses = {"geometry_analysis": golden.artifacts["geometry_analysis"],
+                    "color_analysis": golden.artifacts["color_analysis"]}
+        assert set(run_compliance_rules(executor, analyses).outputs) == {"no_rotation", "no_flipping", "gold_color_only"}
+    
+    def test_batch_rule_checks_skip_heritage_images(self, heritage_index):
+        """Test heritage images in a batch get no color or geometry results"""
+        encoded = [cv2.imencode(".png", image)[1].tobytes()
+                   for image in (self._heritage_image(), self._golden_arches_image())]
+        
+        heritage, golden = MLService()._batch_rule_checks(encoded, force_reanalysis=True)
+        
+        assert heritage["heritage"]["is_heritage"]
+        assert heritage["color"] is None and heritage["geometry"] is None
+        assert not golden["heritage"]["is_heritage"]
+        assert golden["geometry"]["logo_count"] == 1
+        assert golden["color"]["golden_arches_color_match"]
+    
+    @pytest.mark.parametrize("heritage_first", [True, False])
+    def test_batch_predict_decodes_each_image_once(self, heritage_index, monkeypatch, heritage_first):
+        """Test batch predictions reuse the batch's decoded images and classifications with either routing"""
+        monkeypatch.setattr(settings, "heritage_first", heritage_first)
+        encoded = [cv2.imencode(".png", image)[1].tobytes()
+                   for image in (self._heritage_image(), self._golden_arches_image())]
+        decoded = []
+        from_bytes = ImageContext.from_bytes
+        monkeypatch.setattr(ImageContext, "from_bytes", lambda data: decoded.append(data) or from_bytes(data))
+        
+        service = MLService()
+        service.model_loaded = True  # Skip the simulated model loading
+        results = asyncio.run(service.batch_predict(encoded, ["heritage", "photography"], force_reanalysis=True))
+        
+        assert len(decoded) == 2
+        assert [result["rule_checks"]["heritage"]["is_heritage"] for result in results] == [True, False]
+        assert all(
+            result["predictions"]["rule_predictions"]["heritage_detection"] == result["rule_checks"]["heritage"]
+            for result in results
+        )
+        assert (results[0]["rule_checks"]["geometry"] is None) == heritage_first
+
+
+class TestResultCache:
+    """Test the two-tier content-addressed rule result cache"""
+    
+    def test_results_round_trip_through_both_tiers(self, tmp_path):
+        """Test results are served from memory, then from the store after a restart"""
+        path = str(tmp_path / "results.sqlite")
+        cache = ResultCache(path, memory_entries=1)
+        cache.put("a", {"score": np.float32(0.5), "box": (1, 2, 3, 4), "mask": np.array([1, 0])})
+        cache.put("b", {"score": 1.0})
+        
+        assert cache.get("b") == {"score": 1.0}  # Memory tier
+        assert cache.get("a") == {"score": 0.5, "box": [1, 2, 3, 4], "mask": [1, 0]}  # Store
+        assert cache.get("missing") is None
+        assert cache.stats()["memory_hits"] == 1
+        assert cache.stats()["disk_hits"] == 1
+        assert cache.stats()["hit_ratio"] == pytest.approx(2 / 3)
+        
+        cache.get("a")["score"] = 0.0
+        assert cache.get("a")["score"] == 0.5
+        
+        cache.close()
+        reopened = ResultCache(path)
+        assert len(reopened) == 2
+        assert reopened.get("b") == {"score": 1.0}
+        reopened.close()
+    
+    def test_store_evicts_least_recently_used_beyond_budget(self, tmp_path):
+        """Test the byte budget evicts the results used longest ago"""
+        cache = ResultCache(str(tmp_path / "results.sqlite"), memory_entries=0, max_bytes=250)
+        for key in "abc":
+            cache.put(key, {"payload": "x" * 60})
+            time.sleep(0.01)
+        cache.get("a")
+        cache.put("d", {"payload": "x" * 60})
+        
+        assert cache.get("b") is None
+        assert cache.get("a") is not None and cache.get("c") is not None and cache.get("d") is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["disk_bytes"] <= 250
+        cache.close()
+    
+    def test_key_depends_on_content_rules_settings_and_model(self, monkeypatch):
+        """Test every part of the key changes it"""
+        digest = content_digest(b"asset")
+        key = result_key(digest, "v1")
+        
+        assert result_key(digest, "v1") == key
+        assert result_key(content_digest(b"other"), "v1") != key
+        assert result_key(digest, "v2") != key
+        assert result_key(digest, "v1", model_version="next") != key
+        monkeypatch.setattr(settings, "color_tolerance", settings.color_tolerance + 1)
+        assert result_key(digest, "v1") != key
+    
+    def test_batch_rule_checks_are_cached_by_content(self, tmp_path, monkeypatch):
+        """Test unchanged images are looked up and force_reanalysis recomputes them"""
+        cache = ResultCache(str(tmp_path / "results.sqlite"))
+        monkeypatch.setattr(ml_service, "get_result_cache", lambda: cache)
+        service = MLService()
+        computed = []
+        compute = service._compute_rule_checks
+        monkeypatch.setattr(service, "_compute_rule_checks", lambda batch: computed.append(len(batch)) or compute(batch))
+        
+        gold = np.zeros((200, 200, 3), dtype=np.uint8)
+        gold[50:150, 40:160] = (13, 188, 255)
+        encoded = [cv2.imencode(".png", gold)[1].tobytes(), cv2.imencode(".png", 255 - gold)[1].tobytes()]
+        
+        first = service._batch_rule_checks(encoded)
+        second = service._batch_rule_checks(encoded + [cv2.imencode(".png", np.roll(gold, 7, axis=0))[1].tobytes()])
+        service._batch_rule_checks(encoded, force_reanalysis=True)
+        
+        assert computed == [2, 1, 2]
+        assert second[:2] == json.loads(json.dumps(first, default=lambda value: value.item()))
+        cache.close()